@@ -0,0 +1,198 @@
+"""
+Admission control for /chat.
+
+At most `max_concurrency` queries run at once; up to `max_queue` more wait
+in a priority queue (lower number = more urgent, FIFO within a class).
+Arrivals are rejected early with Overloaded(retry_after) when the queue is
+full or the estimated wait (EWMA service time x queue position / slots)
+already exceeds `max_wait`, so the caller can answer 429 + Retry-After
+instead of letting every request time out together. When the queue is full
+an urgent arrival displaces the newest waiter of the least urgent class.
+"""
+
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import metrics
+
+# ---------------------------- Logging Setup ----------------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+if not logger.handlers:
+    handler = logging.FileHandler("logs/chatbot.log", encoding="utf-8")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+# ---------------------------- Priority Classes ----------------------------
+
+PRIORITIES = {
+    "emergency": 0,   # emergency ward / ICU
+    "clinical": 1,    # ward rounds, OPD doctors
+    "normal": 2,      # default when no header is sent
+    "admin": 3,       # admin staff, reports, bulk lookups
+}
+DEFAULT_PRIORITY = "normal"
+
+def parse_priority(value: Optional[str]) -> str:
+    value = (value or "").strip().lower()
+    return value if value in PRIORITIES else DEFAULT_PRIORITY
+
+# ---------------------------- Metrics ----------------------------
+
+ADMISSIONS_TOTAL = metrics.REGISTRY.counter(
+    "chatbot_admission_total",
+    "Admission decisions for /chat by priority and result (admitted, rejected, displaced, cancelled).",
+    ("priority", "result"),
+)
+QUEUE_WAIT_SECONDS = metrics.REGISTRY.histogram(
+    "chatbot_admission_queue_wait_seconds",
+    "Time admitted /chat requests spent waiting for a slot.",
+    ("priority",),
+)
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "future", "enqueued")
+
+    def __init__(self, priority: int, seq: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+# ---------------------------- Controller ----------------------------
+
+class AdmissionController:
+    def __init__(self, max_concurrency: int, max_queue: int, max_wait: float,
+                 initial_service_time: float = 2.0, ewma_alpha: float = 0.2):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.service_time = initial_service_time
+        self.alpha = ewma_alpha
+        self.active = 0
+        self._heap = []
+        self._seq = itertools.count()
+
+        metrics.REGISTRY.gauge("chatbot_admission_active", "/chat queries holding a slot.",
+                               fn=lambda: self.active)
+        metrics.REGISTRY.gauge("chatbot_admission_queue_depth", "/chat queries waiting for a slot by priority.",
+                               ("priority",), fn=self.queue_depths)
+        metrics.REGISTRY.gauge("chatbot_admission_service_seconds", "EWMA /chat service time used for wait estimates.",
+                               fn=lambda: self.service_time)
+
+    # --- estimates ---
+    def _queued_ahead(self, priority: int) -> int:
+        return sum(1 for w in self._heap if w.priority <= priority and not w.future.done())
+
+    def estimate_wait(self, priority: int) -> float:
+        if self.active < self.max_concurrency:
+            return 0.0
+        # everyone ahead of us plus ourselves, drained max_concurrency at a time
+        return (self._queued_ahead(priority) + 1) * self.service_time / self.max_concurrency
+
+    def queue_depths(self) -> dict:
+        names = {v: k for k, v in PRIORITIES.items()}
+        depths = {name: 0 for name in PRIORITIES}
+        for w in self._heap:
+            if not w.future.done():
+                depths[names[w.priority]] += 1
+        return depths
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "maxConcurrency": self.max_concurrency,
+            "queued": self.queue_depths(),
+            "maxQueue": self.max_queue,
+            "serviceTimeS": round(self.service_time, 3),
+        }
+
+    # --- queue management ---
+    def _live_waiters(self) -> list:
+        return [w for w in self._heap if not w.future.done()]
+
+    def _displace_for(self, priority: int) -> bool:
+        # evict the newest waiter of the least urgent class, if it is less urgent than us
+        live = self._live_waiters()
+        if not live:
+            return False
+        victim = max(live, key=lambda w: (w.priority, w.seq))
+        if victim.priority <= priority:
+            return False
+        victim.future.set_exception(Overloaded(self.estimate_wait(victim.priority), "displaced by higher priority"))
+        return True
+
+    def _grant_next(self):
+        while self._heap and self.active < self.max_concurrency:
+            waiter = heapq.heappop(self._heap)
+            if waiter.future.done():
+                continue  # cancelled or displaced
+            self.active += 1
+            waiter.future.set_result(None)
+
+    def _release(self, service_time: float):
+        self.active -= 1
+        self.service_time += self.alpha * (service_time - self.service_time)
+        self._grant_next()
+
+    # --- public API ---
+    async def acquire(self, priority_name: str) -> float:
+        """Waits for a slot; returns seconds spent queued. Raises Overloaded."""
+        priority = PRIORITIES[priority_name]
+        if self.active < self.max_concurrency and not self._live_waiters():
+            self.active += 1
+            ADMISSIONS_TOTAL.inc(priority=priority_name, result="admitted")
+            QUEUE_WAIT_SECONDS.observe(0.0, priority=priority_name)
+            return 0.0
+
+        estimate = self.estimate_wait(priority)
+        if estimate > self.max_wait:
+            ADMISSIONS_TOTAL.inc(priority=priority_name, result="rejected")
+            raise Overloaded(estimate, "estimated queue wait too long")
+        if len(self._live_waiters()) >= self.max_queue and not self._displace_for(priority):
+            ADMISSIONS_TOTAL.inc(priority=priority_name, result="rejected")
+            raise Overloaded(estimate, "admission queue full")
+
+        waiter = _Waiter(priority, next(self._seq), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._heap, waiter)
+        try:
+            await waiter.future
+        except Overloaded:
+            ADMISSIONS_TOTAL.inc(priority=priority_name, result="displaced")
+            raise
+        except asyncio.CancelledError:
+            # client went away; hand the slot on if we were granted it meanwhile
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                self._release(self.service_time)
+            ADMISSIONS_TOTAL.inc(priority=priority_name, result="cancelled")
+            raise
+
+        waited = time.perf_counter() - waiter.enqueued
+        ADMISSIONS_TOTAL.inc(priority=priority_name, result="admitted")
+        QUEUE_WAIT_SECONDS.observe(waited, priority=priority_name)
+        return waited
+
+    @asynccontextmanager
+    async def slot(self, priority_name: str):
+        waited = await self.acquire(priority_name)
+        t0 = time.perf_counter()
+        try:
+            yield waited
+        finally:
+            self._release(time.perf_counter() - t0)
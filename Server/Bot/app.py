@@ -4,33 +4,76 @@ Doctor Chatbot service wrapper (FastAPI).
 - Adds conversation endpoints used by the Node gateway:
     POST  /chat
     POST  /conversations
-    GET   /conversations
-    GET   /conversations/{id}/messages
+    GET   /conversations                 (?limit=&before=&after=, ETag / If-None-Match)
+    GET   /conversations/{id}/messages   (?limit=&before=&after=, ETag / If-None-Match)
+    GET   /metrics                       (Prometheus text exposition)
+    GET   /admin/profile                 (X-Admin-Token; sampling profiler, collapsed stacks for flame graphs)
+    GET   /admin/memory                  (X-Admin-Token; RSS, store sizes, tracemalloc top allocators)
+    POST  /admin/memory/tracemalloc      (?enable=&seconds=&frames=; bounded tracing window)
+    POST  /admin/memory/snapshots        GET /admin/memory/diff?base=&target=
+    WS    /ws/conversations/{id}         (pipelined chat with pushed status/tokens/final + heartbeats)
 
 Environment:
   LOG_TO_FILE=1           -> enables file logging under ./logs/chatbot.log
   SPACY_TRANSFORMER=0     -> set to "1" to try downloading and loading en_core_web_trf (heavy)
   USE_MONGO_FOR_CONV=1    -> if "1", will attempt to call persistence helpers from mongo module
+  ENSURE_INDEXES=0        -> if "1", applies indexes.INDEX_SPEC in the background after startup
+                             (default off: deploys run `python indexes.py --apply` once)
+  CONV_BACKEND=memory     -> local conversation store: "memory" (per worker) or "sqlite" (shared file)
+  CONV_SQLITE_PATH        -> sqlite file path (default ./data/conversations.db)
+  CONV_MAX_CONVERSATIONS / CONV_MAX_MESSAGES / CONV_TTL_SECONDS / CONV_SHARDS
+                          -> bounds for the in-memory conversation store
+  CHAT_MAX_CONCURRENCY=8 / CHAT_MAX_QUEUE=64 / CHAT_MAX_QUEUE_WAIT_S=20
+                          -> /chat admission control; overflow is answered 429 + Retry-After
+  X-Priority              -> (request header) emergency | clinical | normal | admin; urgent queries skip ahead
+  DIALOGUE_MAX_CONVERSATIONS=5000 / DIALOGUE_TTL_S=1800 / DIALOGUE_MAX_RECORDS=16 / DIALOGUE_RECORD_TTL_S=120
+  DIALOGUE_MAX_PREFETCH=32 -> per-conversation follow-up state, reused Mongo results and background prefetches
+  WS_HEARTBEAT_S=20 / WS_MAX_PIPELINE=16
+                          -> websocket ping interval (idle timeout is 3x) and per-connection queued messages
+  COMPRESS_MIN_BYTES=1024 -> responses at least this large are brotli/gzip compressed when the client accepts it
+  X-Debug-Timing: 1       -> (request header) /chat returns its per-stage timing breakdown in meta.timing
+  CAPTURE_PATH            -> if set, records anonymized /chat traffic there for bench/replay.py
+                             (CAPTURE_SALT / CAPTURE_SAMPLE / CAPTURE_MAX_MB / CAPTURE_PATIENT_SPACE, see capture.py)
+  ADMIN_TOKEN             -> enables /admin/* for requests carrying it in X-Admin-Token (unset = 404)
+  PROFILE_MAX_S=300       -> longest /admin/profile session
+  MEMDIAG_TRACE_MAX_S=3600 / MEMDIAG_MAX_SNAPSHOTS=4
+                          -> longest tracemalloc window and memory snapshots kept (see memdiag.py)
   (PYTHON service will still run fine without mongo persistence)
 """
 
 import os
+import re
+import hmac
+import time
+import hashlib
 import logging
 import asyncio
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timedelta
 import dateparser
 
-from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi import FastAPI, HTTPException, Header, Request, Response, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
+from conversation_store import InMemoryConversationStore, SQLiteConversationStore, InvalidCursor, new_id
+import metrics
+from fastjson import FastJSONResponse
+from compression import CompressionMiddleware
+import tracing
+import temporal
+from admission import AdmissionController, Overloaded, parse_priority
+from dialogue import DialogueStore
+import profiler
+import memdiag
+
 # local imports (nlp/rag/mongo). We'll attempt them and raise helpful errors if missing.
 try:
-    from nlp import detect_intent_and_entity
+    from nlp import detect_intents_and_entity
 except Exception as e:
-    raise RuntimeError(f"Failed to import nlp.detect_intent_and_entity: {e}")
+    raise RuntimeError(f"Failed to import nlp.detect_intents_and_entity: {e}")
 
 try:
     # The project already had many helpers in mongo. We'll import module and use safe getattr() later.
@@ -39,6 +82,54 @@ except Exception as e:
     # allow missing mongo — we will fallback to in-memory store
     mongo = None
 
+try:
+    import indexes
+except Exception as e:
+    indexes = None
+
+try:
+    # background-materialized appointment digests (needs mongo)
+    from digests import AppointmentDigests, target_dates
+    appointment_digests = AppointmentDigests() if mongo is not None else None
+except Exception as e:
+    appointment_digests = None
+
+try:
+    # incrementally maintained patient_summaries view (needs mongo)
+    from summaries import SummaryMaintainer
+    summary_maintainer = SummaryMaintainer() if mongo is not None else None
+except Exception as e:
+    summary_maintainer = None
+
+try:
+    # in-memory bed occupancy kept current from admission events (needs mongo)
+    from occupancy import OccupancyAggregator, INTENTS as OCCUPANCY_INTENTS
+    occupancy = OccupancyAggregator() if mongo is not None else None
+except Exception as e:
+    occupancy = None
+
+try:
+    # BM25 index over noteevents for note search (needs mongo)
+    from notes_index import NotesIndex, query_terms as note_query_terms
+    notes_index = NotesIndex() if mongo is not None else None
+except Exception as e:
+    notes_index = None
+
+try:
+    # vital-sign trend queries (needs mongo)
+    import vitals
+    if mongo is None:
+        vitals = None
+except Exception as e:
+    vitals = None
+
+try:
+    # opt-in anonymized /chat traffic capture for bench/replay.py (CAPTURE_PATH)
+    import capture
+    traffic_capture = capture.TrafficCapture.from_env()
+except Exception as e:
+    capture = traffic_capture = None
+
 try:
     # RAG response generator (existing)
     from rag import generate_response
@@ -95,7 +186,7 @@ if os.getenv("SPACY_TRANSFORMER", "0") == "1":
 # =========================
 # FastAPI app
 # =========================
-app = FastAPI(title="Doctor Chatbot API", version="1.1")
+app = FastAPI(title="Doctor Chatbot API", version="1.1", default_response_class=FastJSONResponse)
 
 # allow requests from your frontend / node (set origins appropriately in production)
 app.add_middleware(
@@ -106,67 +197,142 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# brotli/gzip by Accept-Encoding for bodies of at least COMPRESS_MIN_BYTES
+app.add_middleware(CompressionMiddleware, min_size=int(os.getenv("COMPRESS_MIN_BYTES", "1024")))
+
+# =========================
+# Metrics middleware
+# =========================
+def _endpoint_label(path: str) -> str:
+    # bounded label set: never the raw path (conversation ids would explode cardinality)
+    if path in ("/chat", "/conversations", "/healthz", "/metrics"):
+        return path
+    if path.startswith("/conversations/") and path.endswith("/messages"):
+        return "/conversations/{id}/messages"
+    return "other"
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    endpoint = _endpoint_label(request.url.path)
+    status = "5xx"
+    t0 = time.perf_counter()
+    metrics.IN_FLIGHT.inc(endpoint=endpoint)
+    try:
+        response = await call_next(request)
+        status = f"{response.status_code // 100}xx"
+        return response
+    finally:
+        metrics.IN_FLIGHT.dec(endpoint=endpoint)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint=endpoint)
+        metrics.REQUESTS_TOTAL.inc(endpoint=endpoint, status=status)
+
+# requests matching an /admin/profile?requests=N session are sampled while in flight
+@app.middleware("http")
+async def track_profiled_requests(request: Request, call_next):
+    session = profiler.PROFILER.track(request.url.path)
+    if session is None:
+        return await call_next(request)
+    try:
+        return await call_next(request)
+    finally:
+        session.finish()
+
 # =========================
 # Config
 # =========================
 USE_MONGO_FOR_CONV = os.getenv("USE_MONGO_FOR_CONV", "0") == "1"
 PYTHON_CONV_ENDPOINT_PREFIX = os.getenv("PYTHON_CONV_PREFIX", "/conversations")
+ENSURE_INDEXES = os.getenv("ENSURE_INDEXES", "0") == "1"
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 # =========================
-# In-memory conversation store (dev fallback)
-# Thread-safe via asyncio.Lock
+# Local conversation store (used when USE_MONGO_FOR_CONV is off)
+# CONV_BACKEND=memory -> sharded, bounded per-worker store (default)
+# CONV_BACKEND=sqlite -> WAL-mode SQLite file shared by all workers on the host
 # =========================
-_IN_MEMORY_CONV: Dict[str, Dict[str, Any]] = {}
-_store_lock = asyncio.Lock()
+CONV_BACKEND = os.getenv("CONV_BACKEND", "memory").lower()
+
+if CONV_BACKEND == "sqlite":
+    conversation_store = SQLiteConversationStore(os.getenv("CONV_SQLITE_PATH", str(BASE / "data" / "conversations.db")))
+else:
+    conversation_store = InMemoryConversationStore(
+        shards=int(os.getenv("CONV_SHARDS", "16")),
+        max_conversations=int(os.getenv("CONV_MAX_CONVERSATIONS", "10000")),
+        max_messages=int(os.getenv("CONV_MAX_MESSAGES", "500")),
+        ttl_seconds=float(os.getenv("CONV_TTL_SECONDS", str(24 * 3600))),
+    )
+
+metrics.REGISTRY.gauge("chatbot_conversation_store_conversations", "Conversations held by the local store.",
+                       fn=lambda: conversation_store.stats()["conversations"])
+
+# =========================
+# /chat admission control (bounded concurrency + bounded priority queue)
+# =========================
+chat_admission = AdmissionController(
+    max_concurrency=int(os.getenv("CHAT_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("CHAT_MAX_QUEUE", "64")),
+    max_wait=float(os.getenv("CHAT_MAX_QUEUE_WAIT_S", "20")),
+)
+
+# =========================
+# Per-conversation dialogue state (follow-ups, record reuse, prefetch)
+# =========================
+dialogue_store = DialogueStore(
+    max_conversations=int(os.getenv("DIALOGUE_MAX_CONVERSATIONS", "5000")),
+    ttl_seconds=float(os.getenv("DIALOGUE_TTL_S", "1800")),
+    max_records=int(os.getenv("DIALOGUE_MAX_RECORDS", "16")),
+    record_ttl=float(os.getenv("DIALOGUE_RECORD_TTL_S", "120")),
+    max_prefetch=int(os.getenv("DIALOGUE_MAX_PREFETCH", "32")),
+)
+# no speculative reads while real queries are waiting for a slot
+dialogue_store.busy = lambda: any(chat_admission.queue_depths().values())
 
 def make_cid() -> str:
-    return "cid_" + os.urandom(6).hex() + "_" + str(int(datetime.utcnow().timestamp() * 1000))
+    return new_id()
 
 def _now_ts() -> str:
     return datetime.utcnow().isoformat()
 
 async def create_local_conversation(user: Optional[dict], title: Optional[str] = None) -> Dict[str, Any]:
-    async with _store_lock:
-        cid = make_cid()
-        convo = {
-            "id": cid,
-            "title": title or "Conversation",
-            "createdAt": _now_ts(),
-            "createdBy": user.get("id") if user else "anonymous",
-            "messages": [],  # list of { id, sender, text, ts }
-        }
-        _IN_MEMORY_CONV[cid] = convo
-        return convo
+    return await conversation_store.create(user, title)
 
 async def append_local_message(convo_id: str, sender: str, text: str) -> Optional[Dict[str, Any]]:
-    async with _store_lock:
-        convo = _IN_MEMORY_CONV.get(convo_id)
-        if not convo:
-            return None
-        mid = make_cid()
-        msg = {"id": mid, "sender": sender, "text": text, "ts": _now_ts()}
-        convo["messages"].append(msg)
-        return msg
-
-async def list_local_conversations() -> List[Dict[str, Any]]:
-    async with _store_lock:
-        return [
-            {
-                "id": c["id"],
-                "title": c["title"],
-                "createdAt": c["createdAt"],
-                "createdBy": c["createdBy"],
-                "messageCount": len(c.get("messages", [])),
-            }
-            for c in _IN_MEMORY_CONV.values()
-        ]
-
-async def get_local_messages(convo_id: str) -> Optional[List[Dict[str, Any]]]:
-    async with _store_lock:
-        convo = _IN_MEMORY_CONV.get(convo_id)
-        if not convo:
-            return None
-        return convo.get("messages", []).copy()
+    return await conversation_store.append(convo_id, sender, text)
+
+async def append_local_exchange(convo_id: str, user_text: str, bot_text: str) -> Optional[List[Dict[str, Any]]]:
+    # one batched write (a single transaction on the sqlite backend)
+    return await conversation_store.append_many(convo_id, [("user", user_text), ("bot", bot_text)])
+
+async def list_local_conversations(limit: int = 50, before: Optional[str] = None,
+                                   after: Optional[str] = None) -> List[Dict[str, Any]]:
+    return await conversation_store.list(limit, before, after)
+
+async def get_local_messages(convo_id: str, limit: int = 100, before: Optional[str] = None,
+                             after: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+    return await conversation_store.messages(convo_id, limit, before, after)
+
+async def persist_exchange(convo_id: Optional[str], user_text: str, bot_text: str, cid: str):
+    if not convo_id:
+        return
+    with tracing.span("persist"):
+        # Persist user message + bot reply together in the local store
+        if not USE_MONGO_FOR_CONV:
+            await append_local_exchange(convo_id, user_text, bot_text)
+
+        # If mongo persistence is enabled & mongo provides helpers, call them (best-effort).
+        # save_message only queues; the write-behind flusher persists in batches.
+        elif mongo is not None:
+            try:
+                if hasattr(mongo, "save_message"):
+                    await mongo.save_message(convo_id, "user", user_text, {"correlationId": cid})
+                    await mongo.save_message(convo_id, "bot", bot_text, {"correlationId": cid})
+            except Exception as e:
+                logger.warning("[%s] mongo.save_message failed: %s", cid, e)
+
+async def conversation_exists(convo_id: str) -> bool:
+    if USE_MONGO_FOR_CONV and mongo is not None and hasattr(mongo, "conversation_version"):
+        return await mongo.conversation_version(convo_id) is not None
+    return await conversation_store.version(convo_id) is not None
 
 # =========================
 # NLP / Business logic
@@ -182,93 +348,320 @@ EXTRA_INTENTS = [
     "notes_for_admission",
 ]
 
-async def process_query(user_query: str) -> str:
+async def _fetch(helper: str, *args):
+    """Calls a mongo.py helper if present, timing it per helper."""
+    fn = getattr(mongo, helper, None) if mongo is not None else None
+    if fn is None:
+        return None
+    with metrics.MONGO_HELPER_SECONDS.time(helper=helper), tracing.span(f"mongo.{helper}", stage="mongo"):
+        return await fn(*args)
+
+async def _fetch_for(state, helper: str, *args):
+    """_fetch, reusing this conversation's fresh (or in-flight/prefetched) result for the same call."""
+    if state is None:
+        return await _fetch(helper, *args)
+    return await state.fetch(helper, args, lambda: _fetch(helper, *args))
+
+async def _generate(user_query: str, data, on_token=None) -> str:
+    """
+    Runs the blocking RAG call on the default thread pool so it doesn't stall
+    the event loop. Time spent waiting for a worker thread is recorded as
+    llm.queue_wait, separately from llm.generation inside rag.py.
+    """
+    submitted = time.perf_counter()
+
+    def run():
+        tracing.record("llm.queue_wait", time.perf_counter() - submitted, stage="llm_queue_wait")
+        if on_token is not None:
+            return generate_response(user_query, data, on_token=on_token)
+        return generate_response(user_query, data)
+
+    return await asyncio.to_thread(run)
+
+def _digest_answer(date_str: str, label: str) -> Optional[str]:
+    """Pre-rendered appointment digest for today/tomorrow, or None to fall back to the live query."""
+    if appointment_digests is None:
+        return None
+    with tracing.span("digest"):
+        return appointment_digests.answer(date_str, label)
+
+_PATIENT_ID = re.compile(r"^P\d+$", re.IGNORECASE)
+
+def _shared(refs: dict, key, factory):
+    """One in-flight lookup per key for the whole request, shared by concurrent intent handlers."""
+    task = refs.get(key)
+    if task is None:
+        task = refs[key] = asyncio.ensure_future(factory())
+    return task
+
+async def _patient_id(entity: str, refs: dict, state=None) -> Optional[str]:
+    """Resolves a patient ID or (partial) name to a patient_id, once per request."""
+    if _PATIENT_ID.match(entity.strip()):
+        pid = entity.strip().upper()
+        if state is not None:
+            state.note_patient(pid)
+        return pid
+    if state is not None and state.patient_id and entity == state.patient_name:
+        return state.patient_id
+    ref = await _shared(refs, ("patient", entity.lower()), lambda: _fetch_for(state, "get_patient_ref", entity))
+    if state is not None and ref:
+        state.note_patient(ref.get("patient_id"), ref.get("name"))
+    return (ref or {}).get("patient_id")
+
+def _admission_id(entity: Optional[str], state) -> Optional[str]:
+    """The admission named in the question, else the one this conversation is about."""
+    if entity and not (state is not None and entity == state.patient_name):
+        return entity
+    return state.admission_id if state is not None else None
+
+def _note_patient_record(state, data):
+    """Remembers the patient (and active/latest admission) from a patient_info result."""
+    if state is None or not isinstance(data, dict):
+        return
+    patient = data.get("patient") or data  # get_patient_history / get_patient_summary
+    state.note_patient(patient.get("patient_id"), patient.get("name"))
+    admissions = data.get("activeAdmissions") or data.get("recentAdmissions") or data.get("admissions") or []
+    if "admissions" in data:
+        # history pages are oldest first
+        admissions = [a for a in admissions if not a.get("dischtime")] or admissions[::-1]
+    if admissions and admissions[0].get("admission_id"):
+        state.admission_id = admissions[0]["admission_id"]
+
+# intent -> helpers (taking a patient_id) likely to be asked next; started in
+# the background while the current answer is generated
+PREFETCH_AFTER = {
+    "patient_info": ("get_admissions_for_patient", "get_lab_applications_for_patient"),
+    "admissions_for_patient": ("get_prescriptions_for_patient", "get_lab_applications_for_patient"),
+    "admission_info": ("get_prescriptions_for_patient", "get_lab_applications_for_patient"),
+    "lab_results": ("get_prescriptions_for_patient",),
+    "lab_applications_for_patient": ("get_prescriptions_for_patient",),
+    "prescriptions": ("get_lab_applications_for_patient",),
+    "active_medications": ("get_lab_applications_for_patient",),
+}
+
+def _prefetch_next(state, intents):
+    if state is None or not state.patient_id or mongo is None:
+        return
+    pid = state.patient_id
+    for intent in intents:
+        for helper in PREFETCH_AFTER.get(intent, ()):
+            state.prefetch(helper, (pid,), lambda helper=helper: _fetch(helper, pid))
+
+# intent -> mongo helper taking a patient_id (entity may be a name or an ID)
+PATIENT_HELPERS = {
+    "admissions_for_patient": "get_admissions_for_patient",
+    "admission_info": "get_admissions_for_patient",
+    "lab_applications_for_patient": "get_lab_applications_for_patient",
+    "lab_results": "get_lab_applications_for_patient",
+    "prescriptions": "get_prescriptions_for_patient",
+    "active_medications": "get_prescriptions_for_patient",
+}
+
+# intent -> mongo helper taking an admission ID
+ADMISSION_HELPERS = {
+    "diagnosis_for_admission": "get_diagnosis_for_admission",
+    "prescriptions_for_admission": "get_prescriptions_for_admission",
+    "notes_for_admission": "get_notes_for_admission",
+}
+
+# intents answered from the notes index with highlighted snippets instead of whole notes
+NOTE_INTENTS = ("search_notes", "doctor_notes", "notes_for_admission")
+
+async def _search_notes(intent: str, entity: Optional[str], refs: dict, state, query: str) -> Tuple[str, Any]:
+    """
+    search_notes looks across every patient unless one is named;
+    doctor_notes is scoped to a patient and notes_for_admission to an
+    admission. A date expression in the question limits charttime. Without
+    search terms the newest notes in scope are listed.
+    """
+    with tracing.span("temporal"):
+        span = temporal.resolve(query)
+    pid = aid = None
+    if intent == "notes_for_admission":
+        aid = _admission_id(entity, state)
+        if not aid:
+            return "needs_input", "⚠️ Need admission ID."
+        if state is not None:
+            state.admission_id = aid
+    elif entity and temporal.resolve(entity) is None:
+        pid = await _patient_id(entity, refs, state)
+        if not pid and intent == "doctor_notes":
+            return "needs_input", f"⚠️ No patient found matching '{entity}'."
+    elif intent == "doctor_notes":
+        return "needs_input", "⚠️ Please specify a patient."
+    if intent == "search_notes" and not pid and not note_query_terms(query):
+        return "needs_input", "⚠️ What should I look for in the notes (e.g. 'who had a fall last week')?"
+
+    # the patient's name is how the note is scoped, not something to find in its text
+    terms = re.sub(re.escape(entity), " ", query, flags=re.IGNORECASE) if entity else query
+    with metrics.MONGO_HELPER_SECONDS.time(helper="notes_search"), tracing.span("notes.search", stage="mongo"):
+        hits = await notes_index.find(terms, pid, aid, *(span or (None, None)))
+    data = {"search": {"terms": note_query_terms(terms), "patient_id": pid, "admission_id": aid},
+            "matches": hits or "No matching notes."}
+    if span:
+        data["search"]["range"] = {"from": span.start.isoformat(), "to": (span.end - timedelta(days=1)).isoformat()}
+    if not notes_index.caught_up:
+        data["search"]["indexComplete"] = False
+    return "answered", data
+
+async def _resolve_intent(intent: str, entity: Optional[str], refs: dict, state=None, query: str = "") -> Tuple[str, Any]:
+    """
+    Runs the data path for one intent. Returns (outcome, payload):
+    ("answered", data) for the LLM, ("digest"/"occupancy", text) for a
+    pre-rendered answer, ("needs_input", prompt) when the entity is missing
+    or unusable, and ("fallback", None) for intents without a data path.
+    """
+    if intent in ("appointments_today", "appointments"):
+        answer = _digest_answer(datetime.today().strftime("%Y-%m-%d"), "today")
+        if answer:
+            return "digest", answer
+        return "answered", await _fetch("get_todays_appointments")
+    if intent == "appointments_on_date":
+        # the whole question sees ranges ("between monday and thursday") the NER entity may cut short
+        with tracing.span("temporal"):
+            span = temporal.resolve(query) or temporal.resolve(entity)
+        if span is None and entity:
+            # rare phrasings only; dateparser costs milliseconds per call
+            parsed = dateparser.parse(entity, settings={"DATE_ORDER": "DMY"})
+            span = temporal.DateRange(parsed.date(), parsed.date() + timedelta(days=1)) if parsed else None
+        if span is None:
+            if not entity:
+                return "needs_input", "⚠️ Please mention a specific date (e.g., 'on June 21st')."
+            return "needs_input", "⚠️ Couldn't parse the date."
+        start_str, end_str = span.iso()
+        if span.days > 1:
+            last_day = (span.end - timedelta(days=1)).isoformat()
+            return "answered", {"range": {"from": start_str, "to": last_day},
+                                "appointments": await _fetch("get_appointments_in_range", start_str, end_str)}
+        if appointment_digests is not None:
+            for label, day in target_dates().items():
+                answer = _digest_answer(start_str, label) if day == start_str else None
+                if answer:
+                    return "digest", answer
+        return "answered", await _fetch("get_appointments_on_date", start_str)
+    if intent in ("staff", "staff_info"):
+        return "answered", await _fetch("get_all_staff")
+    if intent == "lab_items_list":
+        return "answered", await _fetch("get_lab_items_list")
+    if intent == "patient_info":
+        if not entity:
+            return "needs_input", "⚠️ Please specify a patient name."
+        data = await _fetch_for(state, "get_patient_summary", entity) if summary_maintainer is not None else None
+        tracing.annotate(patient_summary="hit" if data else "miss")
+        if not data:
+            data = await _fetch_for(state, "get_patient_history", entity)
+            # not materialized yet: build it in the background for the next ask
+            pid = ((data or {}).get("patient") or {}).get("patient_id")
+            if summary_maintainer is not None and pid:
+                summary_maintainer.mark_dirty(pid)
+        _note_patient_record(state, data)
+        return "answered", data
+    if intent in ("get_patient_dob", "get_patient_contact"):
+        if not entity:
+            return "needs_input", "⚠️ Please specify a patient."
+        return "answered", await _fetch_for(state, intent, entity)
+    if intent in PATIENT_HELPERS:
+        if not entity:
+            return "needs_input", "⚠️ Need patient name or ID."
+        pid = await _patient_id(entity, refs, state)
+        if not pid:
+            return "needs_input", f"⚠️ No patient found matching '{entity}'."
+        return "answered", await _fetch_for(state, PATIENT_HELPERS[intent], pid)
+    if notes_index is not None and intent in NOTE_INTENTS:
+        return await _search_notes(intent, entity, refs, state, query)
+    if intent in ADMISSION_HELPERS:
+        aid = _admission_id(entity, state)
+        if not aid:
+            return "needs_input", "⚠️ Need admission ID."
+        if state is not None:
+            state.admission_id = aid
+        return "answered", await _fetch_for(state, ADMISSION_HELPERS[intent], aid)
+    if occupancy is not None and intent in OCCUPANCY_INTENTS:
+        with tracing.span("occupancy"):
+            answer = occupancy.answer(intent, entity)
+        if answer:
+            return "occupancy", answer
+        return "needs_input", "⏳ Bed occupancy is still loading, please try again in a moment."
+    if vitals is not None and intent in vitals.INTENT_METRICS:
+        if not entity:
+            return "needs_input", "⚠️ Please specify a patient."
+        # vitals are keyed by the Node patient's UUID, so they are resolved by its first/last name or UUID
+        patient = await _shared(refs, ("vitals_patient", entity.lower()),
+                                lambda: _fetch_for(state, "get_vitals_patient_ref", entity))
+        if not patient:
+            return "needs_input", f"⚠️ No patient found matching '{entity}'."
+        with metrics.MONGO_HELPER_SECONDS.time(helper="vital_trends"), tracing.span("mongo.vital_trends", stage="mongo"):
+            return "answered", await vitals.vital_trends(patient, vitals.INTENT_METRICS[intent])
+    return "fallback", None
+
+async def process_query(user_query: str, emit=None, conversation_id: Optional[str] = None) -> str:
+    """
+    With a `conversation_id`, follow-ups ("and his labs?") reuse the
+    conversation's patient without NER, recently fetched records are reused,
+    and likely next reads are prefetched (see dialogue.py).
+
+    Compound questions ("Ravi's prescriptions and lab results") resolve every
+    detected intent concurrently, sharing entity lookups, and are answered
+    with one LLM call over the combined data.
+
+    `emit`, if given, receives progress events as dicts ({"type": "status", ...}
+    and streamed {"type": "token", "text": ...}); it may be called from a
+    worker thread, so it must be thread-safe. The full reply is returned either way.
+    """
     logger.debug("[MAIN] Query: %s", user_query)
-    intent, entity = detect_intent_and_entity(user_query)
-    logger.debug("[MAIN] NLP → intent: %s, entity: %s", intent, entity)
+    state = dialogue_store.get(conversation_id)
+    follow_up = state.follow_up_entity(user_query) if state is not None else None
+    if follow_up:
+        tracing.annotate(follow_up=True)
+    with tracing.span("nlp", stage="nlp"):
+        intents, entity = detect_intents_and_entity(user_query, follow_up)
+    logger.debug("[MAIN] NLP → intents: %s, entity: %s", intents, entity)
+    if traffic_capture is not None:
+        capture.note_entity(entity)
+    on_token = None
+    if emit is not None:
+        emit({"type": "status", "stage": "understood", "intent": intents[0], "intents": intents, "entity": entity})
+        on_token = lambda text: emit({"type": "token", "text": text})
 
+    outcomes = {intent: "error" for intent in intents}
     try:
-        data = None
-        if intent in ("appointments_today", "appointments"):
-            data = await mongo.get_todays_appointments() if mongo and hasattr(mongo, "get_todays_appointments") else None
-        elif intent == "appointments_on_date":
-            if not entity:
-                return "⚠️ Please mention a specific date (e.g., 'on June 21st')."
-            ent = entity.lower()
-            parsed_date = (
-                datetime.today() + timedelta(days=1)
-                if ent == "tomorrow"
-                else datetime.today()
-                if ent == "today"
-                else dateparser.parse(entity)
-            )
-            if not parsed_date:
-                return "⚠️ Couldn't parse the date."
-            if mongo and hasattr(mongo, "get_appointments_on_date"):
-                data = await mongo.get_appointments_on_date(parsed_date.strftime("%Y-%m-%d"))
-            else:
-                data = None
-        elif intent in ("staff", "staff_info"):
-            data = await mongo.get_all_staff() if mongo and hasattr(mongo, "get_all_staff") else None
-        elif intent == "patient_info":
-            if not entity:
-                return "⚠️ Please specify a patient name."
-            data = await mongo.get_patient_history(entity) if mongo and hasattr(mongo, "get_patient_history") else None
-        elif intent == "get_patient_dob":
-            if not entity:
-                return "⚠️ Please specify a patient."
-            data = await mongo.get_patient_dob(entity) if mongo and hasattr(mongo, "get_patient_dob") else None
-        elif intent == "get_patient_contact":
-            if not entity:
-                return "⚠️ Please specify a patient."
-            data = await mongo.get_patient_contact(entity) if mongo and hasattr(mongo, "get_patient_contact") else None
-        elif intent == "admissions_for_patient":
-            if not entity:
-                return "⚠️ Need patient ID."
-            data = await mongo.get_admissions_for_patient(entity) if mongo and hasattr(mongo, "get_admissions_for_patient") else None
-        elif intent == "lab_applications_for_patient":
-            if not entity:
-                return "⚠️ Need patient ID."
-            data = await mongo.get_lab_applications_for_patient(entity) if mongo and hasattr(mongo, "get_lab_applications_for_patient") else None
-        elif intent == "lab_items_list":
-            data = await mongo.get_lab_items_list() if mongo and hasattr(mongo, "get_lab_items_list") else None
-        elif intent == "diagnosis_for_admission":
-            if not entity:
-                return "⚠️ Need admission ID."
-            data = await mongo.get_diagnosis_for_admission(entity) if mongo and hasattr(mongo, "get_diagnosis_for_admission") else None
-        elif intent == "prescriptions_for_admission":
-            if not entity:
-                return "⚠️ Need admission ID."
-            data = await mongo.get_prescriptions_for_admission(entity) if mongo and hasattr(mongo, "get_prescriptions_for_admission") else None
-        elif intent == "notes_for_admission":
-            if not entity:
-                return "⚠️ Need admission ID."
-            data = await mongo.get_notes_for_admission(entity) if mongo and hasattr(mongo, "get_notes_for_admission") else None
-        else:
+        refs = {}
+        results = await asyncio.gather(*(_resolve_intent(intent, entity, refs, state, user_query) for intent in intents))
+        if state is not None:
+            state.note_turn(intents[0], entity)
+            _prefetch_next(state, intents)
+        outcomes = {intent: outcome for intent, (outcome, _) in zip(intents, results)}
+        data = {intent: payload for intent, (outcome, payload) in zip(intents, results) if outcome == "answered"}
+        texts = {intent: payload for intent, (outcome, payload) in zip(intents, results)
+                 if outcome not in ("answered", "fallback")}
+
+        if not data and not texts:
             # fallback to a generic RAG response if available
             if generate_response:
-                return generate_response(user_query, None)
+                return await _generate(user_query, None, on_token)
             return "🤖 Sorry, I didn’t understand. Ask about appointments, staff, or patient records."
+        if not data or not generate_response:
+            # pre-rendered answers / prompts need no LLM call; if rag is missing,
+            # data falls back to a simple JSON summary
+            parts = list(texts.values())
+            parts += [f"Result for intent '{i}': {d if d is not None else 'no data available'}" for i, d in data.items()]
+            return "\n\n".join(parts)
 
-        # generate_response may be sync or async in your project — keep existing call style
-        if generate_response:
-            # If generate_response is asyncable, detect and await (best-effort)
-            try:
-                result = generate_response(user_query, data)
-                if callable(getattr(result, "then", None)):  # not perfect but safe fallback
-                    # some libs return awaitable-like objects; attempt await
-                    result = await result
-                return result
-            except TypeError:
-                # generate_response is likely synchronous
-                return generate_response(user_query, data)
-        else:
-            # If rag missing, fallback to simple JSON summary
-            return f"Result for intent '{intent}': {data if data is not None else 'no data available'}"
+        if emit is not None:
+            emit({"type": "status", "stage": "generating"})
+        if len(data) == 1 and not texts:
+            return await _generate(user_query, next(iter(data.values())), on_token)
+        # one combined call; rendered answers ride along as context sections
+        return await _generate(user_query, {**data, **texts}, on_token)
 
     except Exception as e:
-        logger.exception("[MAIN] Error processing %s: %s", intent, e)
+        outcomes = {intent: "error" for intent in intents}
+        logger.exception("[MAIN] Error processing %s: %s", intents, e)
         return "❌ Internal error, please try again later."
+    finally:
+        for intent, outcome in outcomes.items():
+            metrics.QUERIES_TOTAL.inc(intent=intent, outcome=outcome)
+        tracing.annotate(intent=intents[0], intents=intents, outcome=outcomes[intents[0]])
 
 # =========================
 # Pydantic models
@@ -293,19 +686,155 @@ class CreateConversationRequest(BaseModel):
 def _normalize_reply(reply_text: str, cid: str) -> Dict[str, Any]:
     return {"reply": reply_text, "meta": {"cid": cid, "ts": _now_ts()}}
 
+# =========================
+# Helper: pagination + conditional GET
+# =========================
+def _page_info(items: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+    # items carry their own opaque "cursor"; clients echo them back as before/after
+    return {
+        "limit": limit,
+        "count": len(items),
+        "first": items[0].get("cursor") if items else None,
+        "last": items[-1].get("cursor") if items else None,
+        "full": len(items) >= limit,
+    }
+
+def _etag(*parts) -> str:
+    return 'W/"' + hashlib.sha1(repr(parts).encode()).hexdigest()[:20] + '"'
+
+def _not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {t.strip() for t in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
 # =========================
 # Endpoints
 # =========================
 @app.get("/healthz")
 async def healthz():
     try:
-        return {"ok": True}
+        health = {"ok": True, "conversationStore": conversation_store.stats(), "chatAdmission": chat_admission.stats(),
+                  "dialogue": dialogue_store.stats()}
+        if mongo is not None and hasattr(mongo, "reference_cache_stats"):
+            health["referenceCache"] = mongo.reference_cache_stats()
+        if mongo is not None and hasattr(mongo, "pool_stats"):
+            health["mongoPool"] = mongo.pool_stats()
+        if appointment_digests is not None:
+            health["appointmentDigests"] = appointment_digests.stats()
+        if occupancy is not None:
+            health["occupancy"] = occupancy.stats()
+        if summary_maintainer is not None:
+            health["patientSummaries"] = summary_maintainer.stats()
+        if notes_index is not None:
+            health["notesIndex"] = notes_index.stats()
+        if traffic_capture is not None:
+            health["trafficCapture"] = traffic_capture.stats()
+        health["profiler"] = profiler.PROFILER.stats()
+        health["memory"] = {**memdiag.process_memory(), **memory_diagnostics.stats()}
+        return health
     except Exception as e:
         logger.exception("Health check failed: %s", e)
         return {"ok": False, "details": str(e)}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+def _require_admin(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+async def profile_endpoint(seconds: float = Query(30, gt=0), interval_ms: float = Query(10, ge=1),
+                           requests: int = Query(0, ge=0), path: str = Query("/chat"),
+                           idle: bool = False, threads: bool = False,
+                           x_admin_token: Optional[str] = Header(None)):
+    """
+    Samples every thread of this worker for `seconds`, or, with `requests=N`, only while the next N
+    requests under `path` are in flight (`seconds` is then the timeout). `idle` keeps threads parked
+    waiting for work; `threads` keeps one root per thread instead of per pool.
+    """
+    _require_admin(x_admin_token)
+    try:
+        session = await asyncio.to_thread(profiler.PROFILER.run, seconds, interval_ms / 1000, path, requests,
+                                          idle, threads)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except profiler.Busy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(session.collapsed(), headers=session.headers())
+
+memory_diagnostics = memdiag.MemoryDiagnostics()
+
+def _memory_stores() -> dict:
+    # read on the event loop: the stores are mutated there without locks
+    stores = {"conversationStore": conversation_store.stats(), "dialogue": dialogue_store.stats(),
+              "temporalCache": temporal.cache_info()._asdict()}
+    if mongo is not None and hasattr(mongo, "memory_stats"):
+        stores["mongo"] = mongo.memory_stats()
+    if notes_index is not None:
+        stores["notesIndex"] = notes_index.stats()
+    if occupancy is not None:
+        stores["occupancy"] = occupancy.stats()
+    if appointment_digests is not None:
+        stores["appointmentDigests"] = appointment_digests.stats()
+    if traffic_capture is not None:
+        stores["trafficCapture"] = traffic_capture.stats()
+    return stores
+
+@app.get("/admin/memory")
+async def memory_endpoint(top: int = Query(20, ge=1, le=200), group: str = Query("lineno"),
+                          x_admin_token: Optional[str] = Header(None)):
+    """
+    RSS and peak, sizes of the in-process stores and caches, gc counters, and, while tracemalloc is on,
+    the top allocators grouped by `group` (lineno | filename | traceback).
+    """
+    _require_admin(x_admin_token)
+    try:
+        return await asyncio.to_thread(memory_diagnostics.report, _memory_stores(), top, group)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/admin/memory/tracemalloc")
+async def tracemalloc_endpoint(enable: bool = True, seconds: float = Query(600, gt=0), frames: int = Query(1, ge=1),
+                               x_admin_token: Optional[str] = Header(None)):
+    """
+    Starts tracemalloc for a bounded window (it stops itself after `seconds`), or stops it with enable=false.
+    """
+    _require_admin(x_admin_token)
+    if not enable:
+        return memory_diagnostics.stop_tracing()
+    try:
+        return memory_diagnostics.start_tracing(seconds, frames)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/admin/memory/snapshots")
+async def memory_snapshot_endpoint(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    return await asyncio.to_thread(memory_diagnostics.take_snapshot, _memory_stores())
+
+@app.get("/admin/memory/diff")
+async def memory_diff_endpoint(base: int, target: Optional[int] = None, top: int = Query(20, ge=1, le=200),
+                               group: str = Query("lineno"), x_admin_token: Optional[str] = Header(None)):
+    """
+    Growth between snapshot `base` and snapshot `target` (default: a new snapshot taken now).
+    """
+    _require_admin(x_admin_token)
+    try:
+        return await asyncio.to_thread(memory_diagnostics.diff, base, target, _memory_stores(), top, group)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(req: ChatRequest, x_correlation_id: Optional[str] = Header(None), request: Request = None):
+async def chat_endpoint(req: ChatRequest, x_correlation_id: Optional[str] = Header(None),
+                        x_debug_timing: Optional[str] = Header(None), x_priority: Optional[str] = Header(None),
+                        request: Request = None):
     cid = x_correlation_id or make_cid()
     t0 = datetime.utcnow()
     logger.info("[%s] /chat called. user=%s", cid, getattr(request.state, "user", None) or "unknown")
@@ -328,38 +857,178 @@ async def chat_endpoint(req: ChatRequest, x_correlation_id: Optional[str] = Head
     except Exception:
         user_info = {}
 
-    # process the query
-    try:
-        # persist user message (mongo or local) if conversation present or create new conversation
-        conversation_id = req.conversationId
-        # If provided and using local fallback, append message
-        if conversation_id and not USE_MONGO_FOR_CONV:
-            await append_local_message(conversation_id, "user", message)
+    # process the query; every stage below records a span on this request's trace
+    with tracing.request_trace(cid) as trace:
+        status = "ok"
+        try:
+            conversation_id = req.conversationId
 
-        reply = await process_query(message)
+            priority = parse_priority(x_priority)
+            try:
+                async with chat_admission.slot(priority) as waited:
+                    tracing.record("admission.queue_wait", waited)
+                    tracing.annotate(priority=priority)
+                    reply = await process_query(message, conversation_id=conversation_id)
+            except Overloaded as e:
+                status = "rejected"
+                retry_after = max(1, int(e.retry_after + 0.999))
+                logger.warning("[%s] /chat shed (%s, priority=%s, retry in %ss)", cid, e.reason, priority, retry_after)
+                raise HTTPException(status_code=429, detail=f"Server busy: {e.reason}",
+                                    headers={"Retry-After": str(retry_after)})
 
-        # Persist bot reply
-        if conversation_id and not USE_MONGO_FOR_CONV:
-            await append_local_message(conversation_id, "bot", reply)
+            await persist_exchange(conversation_id, message, reply, cid)
 
-        # If mongo persistence is enabled & mongo provides helpers, call them (best-effort)
-        if USE_MONGO_FOR_CONV and mongo is not None:
+            latency_ms = int((datetime.utcnow() - t0).total_seconds() * 1000)
+            meta = {"latencyMs": latency_ms, "cid": cid}
+            # X-Debug-Timing: 1 returns the per-stage breakdown to the caller
+            if x_debug_timing and x_debug_timing.lower() not in ("0", "false", "no"):
+                meta["timing"] = trace.breakdown()
+
+            logger.info("[%s] reply ready (latency=%dms)", cid, latency_ms)
+
+            return {"reply": reply, "conversationId": conversation_id, "meta": meta}
+        except HTTPException:
+            raise
+        except Exception as e:
+            status = "error"
+            logger.exception("[%s] Error in /chat: %s", cid, e)
+            raise HTTPException(status_code=500, detail="Internal error")
+        finally:
+            # one structured line per request, whatever the outcome
+            logger.info(trace.log_line(endpoint="/chat", status=status))
+            if traffic_capture is not None:
+                traffic_capture.record(trace, message, status, parse_priority(x_priority), req.conversationId)
+
+# =========================
+# WebSocket chat channel
+# =========================
+WS_HEARTBEAT_S = float(os.getenv("WS_HEARTBEAT_S", "20"))
+WS_MAX_PIPELINE = int(os.getenv("WS_MAX_PIPELINE", "16"))
+
+@app.websocket("/ws/conversations/{convo_id}")
+async def chat_socket(websocket: WebSocket, convo_id: str):
+    """
+    One connection per conversation (e.g. a whole ward round). Client frames:
+        {"type": "message", "id": "<client id>", "text": "...", "priority": "clinical"}
+        {"type": "ping"} / {"type": "pong"}
+    Server frames, each tagged with the message id where relevant:
+        ready, status (accepted/queued/processing/understood/generating),
+        token (streamed LLM text), final, error (status + retryAfter), ping, pong
+    Messages may be pipelined; they are answered in order through the same
+    admission control, process_query and persistence path as POST /chat.
+    """
+    conn_cid = websocket.headers.get("x-correlation-id") or make_cid()
+    debug_timing = (websocket.headers.get("x-debug-timing") or websocket.query_params.get("debug_timing") or "0") \
+        .lower() not in ("0", "false", "no")
+    await websocket.accept()
+    if not await conversation_exists(convo_id):
+        await websocket.send_json({"type": "error", "status": 404, "detail": "Conversation not found"})
+        await websocket.close(code=4404)
+        return
+
+    loop = asyncio.get_running_loop()
+    outbox: asyncio.Queue = asyncio.Queue()
+    inbox: asyncio.Queue = asyncio.Queue(maxsize=WS_MAX_PIPELINE)
+
+    def push(frame: dict):
+        # token callbacks arrive on the RAG worker thread, so always hop onto the loop
+        loop.call_soon_threadsafe(outbox.put_nowait, frame)
+
+    async def sender():
+        try:
+            while True:
+                await websocket.send_json(await outbox.get())
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # socket already closed; the receive loop notices and cleans up
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_S)
+            push({"type": "ping", "ts": _now_ts()})
+
+    async def answer(msg_id: str, text: str, priority: str):
+        cid = f"{conn_cid}:{msg_id}"
+        t0 = time.perf_counter()
+        with tracing.request_trace(cid) as trace:
+            status = "ok"
             try:
-                if conversation_id and hasattr(mongo, "save_message"):
-                    # expected: save_message(conversationId, sender, text, meta)
-                    await mongo.save_message(conversation_id, "bot", reply, {"ts": _now_ts()})
+                push({"type": "status", "id": msg_id, "stage": "queued"})
+                async with chat_admission.slot(priority) as waited:
+                    tracing.record("admission.queue_wait", waited)
+                    tracing.annotate(priority=priority)
+                    push({"type": "status", "id": msg_id, "stage": "processing"})
+                    reply = await process_query(text, emit=lambda event: push({**event, "id": msg_id}),
+                                                conversation_id=convo_id)
+                await persist_exchange(convo_id, text, reply, cid)
+                meta = {"cid": cid, "latencyMs": int((time.perf_counter() - t0) * 1000)}
+                if debug_timing:
+                    meta["timing"] = trace.breakdown()
+                push({"type": "final", "id": msg_id, "reply": reply, "conversationId": convo_id, "meta": meta})
+            except Overloaded as e:
+                status = "rejected"
+                push({"type": "error", "id": msg_id, "status": 429, "detail": f"Server busy: {e.reason}",
+                      "retryAfter": max(1, int(e.retry_after + 0.999))})
             except Exception as e:
-                logger.warning("[%s] mongo.save_message failed: %s", cid, e)
+                status = "error"
+                logger.exception("[%s] Error in websocket chat: %s", cid, e)
+                push({"type": "error", "id": msg_id, "status": 500, "detail": "Internal error"})
+            finally:
+                logger.info(trace.log_line(endpoint="/ws/conversations/{id}", status=status))
 
-        latency_ms = int((datetime.utcnow() - t0).total_seconds() * 1000)
-        meta = {"latencyMs": latency_ms}
+    async def worker():
+        # answered strictly in order so the conversation history stays coherent
+        while True:
+            await answer(*await inbox.get())
 
-        logger.info("[%s] reply ready (latency=%dms)", cid, latency_ms)
-
-        return {"reply": reply, "conversationId": conversation_id, "meta": meta}
-    except Exception as e:
-        logger.exception("[%s] Error in /chat: %s", cid, e)
-        raise HTTPException(status_code=500, detail="Internal error")
+    logger.info("[%s] websocket opened for conversation %s", conn_cid, convo_id)
+    metrics.IN_FLIGHT.inc(endpoint="/ws/conversations/{id}")
+    tasks = [asyncio.create_task(sender()), asyncio.create_task(heartbeat()), asyncio.create_task(worker())]
+    push({"type": "ready", "conversationId": convo_id, "cid": conn_cid, "heartbeatS": WS_HEARTBEAT_S})
+    try:
+        while True:
+            try:
+                frame = await asyncio.wait_for(websocket.receive_json(), timeout=3 * WS_HEARTBEAT_S)
+            except asyncio.TimeoutError:
+                logger.info("[%s] websocket heartbeat timeout", conn_cid)
+                await websocket.close(code=4408)
+                break
+            except (ValueError, KeyError):
+                # KeyError: a binary frame has no "text" for receive_json to decode
+                push({"type": "error", "status": 400, "detail": "Frames must be JSON text frames"})
+                continue
+            kind = frame.get("type") if isinstance(frame, dict) else None
+            if kind == "ping":
+                push({"type": "pong", "ts": _now_ts()})
+            elif kind == "pong":
+                continue
+            elif kind == "message":
+                msg_id = str(frame.get("id") or new_id())
+                try:
+                    text = (frame.get("text") or "").strip()
+                    priority = parse_priority(frame.get("priority"))
+                except AttributeError:
+                    push({"type": "error", "id": msg_id, "status": 400,
+                          "detail": "`text` and `priority` must be strings"})
+                    continue
+                if not text:
+                    push({"type": "error", "id": msg_id, "status": 400, "detail": "`text` is required"})
+                    continue
+                try:
+                    inbox.put_nowait((msg_id, text, priority))
+                except asyncio.QueueFull:
+                    push({"type": "error", "id": msg_id, "status": 429,
+                          "detail": "Too many pipelined messages", "retryAfter": 1})
+                    continue
+                push({"type": "status", "id": msg_id, "stage": "accepted", "pending": inbox.qsize()})
+            else:
+                push({"type": "error", "status": 400, "detail": f"Unknown frame type: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        metrics.IN_FLIGHT.dec(endpoint="/ws/conversations/{id}")
+        logger.info("[%s] websocket closed for conversation %s", conn_cid, convo_id)
 
 @app.post("/conversations")
 async def create_conversation(req: CreateConversationRequest, x_correlation_id: Optional[str] = Header(None), request: Request = None):
@@ -382,31 +1051,70 @@ async def create_conversation(req: CreateConversationRequest, x_correlation_id:
         raise HTTPException(status_code=500, detail="Failed to create conversation")
 
 @app.get("/conversations")
-async def list_conversations(x_correlation_id: Optional[str] = Header(None), request: Request = None):
+async def list_conversations(
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    x_correlation_id: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    request: Request = None,
+):
     cid = x_correlation_id or make_cid()
     try:
         if USE_MONGO_FOR_CONV and mongo is not None and hasattr(mongo, "list_conversations"):
-            convs = await mongo.list_conversations()
-            return {"success": True, "conversations": convs}
-        convs = await list_local_conversations()
-        return {"success": True, "conversations": convs}
+            convs = await mongo.list_conversations(limit, before, after)
+        else:
+            convs = await list_local_conversations(limit, before, after)
+
+        # the page is small; hashing its summaries is far cheaper than re-sending it
+        etag = _etag(limit, before, after, [(c["id"], c.get("updatedAt"), c.get("messageCount")) for c in convs])
+        if _not_modified(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        # returning the Response directly skips FastAPI's jsonable_encoder pass
+        return FastJSONResponse({"success": True, "conversations": convs, "page": _page_info(convs, limit)},
+                                headers={"ETag": etag, "Cache-Control": "no-cache"})
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("[%s] list_conversations failed: %s", cid, e)
         raise HTTPException(status_code=500, detail="Failed to list conversations")
 
 @app.get("/conversations/{convo_id}/messages")
-async def get_conversation_messages(convo_id: str, x_correlation_id: Optional[str] = Header(None), request: Request = None):
+async def get_conversation_messages(
+    convo_id: str,
+    limit: int = Query(100, ge=1, le=500),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    x_correlation_id: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    request: Request = None,
+):
     cid = x_correlation_id or make_cid()
     try:
-        if USE_MONGO_FOR_CONV and mongo is not None and hasattr(mongo, "get_conversation_messages"):
-            msgs = await mongo.get_conversation_messages(convo_id)
-            return {"success": True, "messages": msgs}
-        msgs = await get_local_messages(convo_id)
+        use_mongo = USE_MONGO_FOR_CONV and mongo is not None and hasattr(mongo, "get_conversation_messages")
+
+        # check the version token before touching (or serializing) any messages
+        if use_mongo:
+            version = await mongo.conversation_version(convo_id) if hasattr(mongo, "conversation_version") else None
+        else:
+            version = await conversation_store.version(convo_id)
+        etag = _etag(convo_id, version, limit, before, after) if version is not None else None
+        if etag and _not_modified(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+        if use_mongo:
+            msgs = await mongo.get_conversation_messages(convo_id, limit, before, after)
+        else:
+            msgs = await get_local_messages(convo_id, limit, before, after)
         if msgs is None:
             raise HTTPException(status_code=404, detail="Conversation not found")
-        return {"success": True, "messages": msgs}
+
+        headers = {"ETag": etag, "Cache-Control": "no-cache"} if etag else None
+        return FastJSONResponse({"success": True, "messages": msgs, "page": _page_info(msgs, limit)}, headers=headers)
     except HTTPException:
         raise
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("[%s] get_conversation_messages failed: %s", cid, e)
         raise HTTPException(status_code=500, detail="Failed to fetch conversation messages")
@@ -414,10 +1122,73 @@ async def get_conversation_messages(convo_id: str, x_correlation_id: Optional[st
 # =========================
 # Startup / Shutdown hooks
 # =========================
+_index_task = None
+
+async def _ensure_indexes():
+    try:
+        await indexes.ensure_indexes(mongo.get_db())
+        logger.info("MongoDB indexes verified.")
+    except Exception as e:
+        logger.warning("Index setup failed (continuing without): %s", e)
+
 @app.on_event("startup")
 async def on_startup():
+    global notes_index, _index_task
     logger.info("Chatbot service starting up. CWD=%s", BASE)
+    if mongo is not None and hasattr(mongo, "init_client"):
+        mongo.init_client()
+    if ENSURE_INDEXES and mongo is not None and indexes is not None:
+        # index builds on large collections take minutes; never hold up startup for them
+        _index_task = asyncio.create_task(_ensure_indexes())
+    if mongo is not None and hasattr(mongo, "warm_reference_cache"):
+        await mongo.warm_reference_cache()
+        mongo.start_reference_cache_watchers()
+    if USE_MONGO_FOR_CONV and mongo is not None and hasattr(mongo, "start_conversation_writer"):
+        mongo.start_conversation_writer()
+    if appointment_digests is not None:
+        try:
+            await appointment_digests.refresh()
+        except Exception as e:
+            logger.warning("Appointment digest warm-up failed (will retry in background): %s", e)
+        appointment_digests.start()
+    if occupancy is not None:
+        try:
+            await occupancy.reconcile()
+        except Exception as e:
+            logger.warning("Occupancy load failed (will retry in background): %s", e)
+        occupancy.start()
+    if summary_maintainer is not None:
+        summary_maintainer.start()
+    if notes_index is not None:
+        try:
+            notes_index.load()
+            notes_index.start()
+        except Exception as e:
+            logger.warning("Notes index unavailable (note intents use the raw notes): %s", e)
+            notes_index = None
+    if traffic_capture is not None:
+        traffic_capture.start()
 
 @app.on_event("shutdown")
 async def on_shutdown():
     logger.info("Chatbot service shutting down.")
+    if _index_task is not None and not _index_task.done():
+        _index_task.cancel()
+    if appointment_digests is not None:
+        await appointment_digests.stop()
+    if summary_maintainer is not None:
+        await summary_maintainer.stop()
+    if occupancy is not None:
+        await occupancy.stop()
+    if notes_index is not None:
+        await notes_index.stop()
+    if traffic_capture is not None:
+        await traffic_capture.stop()
+    if mongo is not None and hasattr(mongo, "stop_reference_cache_watchers"):
+        await mongo.stop_reference_cache_watchers()
+    if USE_MONGO_FOR_CONV and mongo is not None and hasattr(mongo, "stop_conversation_writer"):
+        await mongo.stop_conversation_writer()
+    if mongo is not None and hasattr(mongo, "close_client"):
+        mongo.close_client()
+    if hasattr(conversation_store, "close"):
+        conversation_store.close()
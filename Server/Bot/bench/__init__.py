@@ -0,0 +1,4 @@
+"""
+Offline tooling for the chatbot service: synthetic data and benchmarks.
+Run modules from Server/Bot, e.g. `python -m bench.synthetic_data --help`.
+"""
@@ -0,0 +1,106 @@
+"""
+In-memory vs SQLite (WAL) conversation store benchmark.
+
+Creates --conversations conversations, appends --exchanges user/bot pairs to
+each with --concurrency writers in flight, then times list() and
+messages() reads. Reports p50/p99 per operation and throughput.
+
+    python -m bench.conversation_store
+    python -m bench.conversation_store --conversations 2000 --exchanges 20 --concurrency 64
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+from conversation_store import InMemoryConversationStore, SQLiteConversationStore
+
+
+def _summary(latencies: list, wall: float) -> dict:
+    ordered = sorted(latencies)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+    return {
+        "ops": len(ordered),
+        "p50_ms": pick(0.50),
+        "p99_ms": pick(0.99),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "ops_per_s": round(len(ordered) / wall, 1),
+    }
+
+
+async def _timed(ops, concurrency: int) -> dict:
+    latencies = []
+    queue = asyncio.Queue()
+    for op in ops:
+        queue.put_nowait(op)
+
+    async def worker():
+        while not queue.empty():
+            op = queue.get_nowait()
+            t0 = time.perf_counter()
+            await op()
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return _summary(latencies, time.perf_counter() - t0)
+
+
+async def bench_store(store, args, rng: random.Random) -> dict:
+    ids = [c["id"] for c in await asyncio.gather(*(store.create({"id": "bench"}, f"c{i}") for i in range(args.conversations)))]
+    text = "x" * args.message_bytes
+
+    appends = [
+        (lambda cid=cid: store.append_many(cid, [("user", text), ("bot", text)]))
+        for cid in ids for _ in range(args.exchanges)
+    ]
+    rng.shuffle(appends)
+    reads = [(lambda cid=rng.choice(ids): store.messages(cid)) for _ in range(args.reads)]
+    lists = [(lambda: store.list(50)) for _ in range(args.reads)]
+
+    return {
+        "append_exchange": await _timed(appends, args.concurrency),
+        "messages": await _timed(reads, args.concurrency),
+        "list_50": await _timed(lists, args.concurrency),
+        "stats": store.stats(),
+    }
+
+
+async def run(args) -> dict:
+    results = {}
+    memory = InMemoryConversationStore(max_conversations=args.conversations * 2, max_messages=args.exchanges * 2 + 10)
+    results["memory"] = await bench_store(memory, args, random.Random(args.seed))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_store = SQLiteConversationStore(args.sqlite_path or os.path.join(tmp, "bench.db"))
+        results["sqlite"] = await bench_store(sqlite_store, args, random.Random(args.seed))
+        sqlite_store.close()
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark in-memory vs SQLite conversation stores.")
+    parser.add_argument("--conversations", type=int, default=500)
+    parser.add_argument("--exchanges", type=int, default=10, help="user/bot pairs per conversation")
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--message-bytes", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--sqlite-path", help="use this file instead of a temp dir (e.g. on the deploy disk)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    for backend, ops in results.items():
+        print(f"[{backend}]")
+        for op, summary in ops.items():
+            print(f"  {op:16s} " + "  ".join(f"{k}={v}" for k, v in summary.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
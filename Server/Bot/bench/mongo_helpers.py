@@ -0,0 +1,143 @@
+"""
+Concurrent latency benchmark for the mongo.py helpers.
+
+Samples real arguments (names, patient/admission ids, dates) from the
+target database, then calls each helper `--requests` times with
+`--concurrency` in flight and reports p50/p99/mean and throughput.
+
+    python -m bench.synthetic_data --db hms_bench --drop
+    python indexes.py --apply                      # with MONGO_DB_NAME=hms_bench
+    python -m bench.mongo_helpers --db hms_bench --concurrency 32 --requests 2000
+    python -m bench.mongo_helpers --db hms_bench --json results.json --only get_patient_history
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import contextlib
+import statistics
+
+
+def _percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def _sample(db, collection: str, field: str, size: int) -> list:
+    docs = await db[collection].aggregate([
+        {"$sample": {"size": size}},
+        {"$project": {field: 1, "_id": 0}},
+    ]).to_list(length=size)
+    return [d[field] for d in docs if d.get(field)]
+
+
+async def _run_helper(fn, args_pool: list, requests: int, concurrency: int, rng: random.Random) -> dict:
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(rng.choice(args_pool) if args_pool else ())
+
+    async def worker():
+        nonlocal errors
+        while True:
+            try:
+                args = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            t0 = time.perf_counter()
+            try:
+                await fn(*args)
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - t0
+
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "p50_ms": round(_percentile(ordered, 0.50), 2),
+        "p99_ms": round(_percentile(ordered, 0.99), 2),
+        "mean_ms": round(statistics.fmean(ordered), 2),
+        "max_ms": round(ordered[-1], 2),
+        "throughput_rps": round(len(ordered) / wall, 1),
+    }
+
+
+async def run(args) -> dict:
+    import mongo  # imported late so --uri/--db reach config.py
+
+    db = mongo.get_db()
+    rng = random.Random(args.seed)
+    names = await _sample(db, "patients", "name", 200)
+    pids = await _sample(db, "patients", "patient_id", 200)
+    aids = await _sample(db, "admissions", "admission_id", 200)
+    dates = await _sample(db, "appointments", "date", 200)
+
+    # (helper, argument tuples); empty pool == no-argument helper
+    suite = [
+        ("get_patient_history", [(n.split()[0],) for n in names]),
+        ("get_patient_dob", [(n,) for n in names]),
+        ("get_patient_contact", [(n,) for n in names]),
+        ("get_todays_appointments", []),
+        ("get_appointments_on_date", [(d,) for d in dates]),
+        ("get_all_staff", []),
+        ("get_admissions_for_patient", [(p,) for p in pids]),
+        ("get_lab_applications_for_patient", [(p,) for p in pids]),
+        ("get_lab_items_list", []),
+        ("get_diagnosis_for_admission", [(a,) for a in aids]),
+        ("get_prescriptions_for_admission", [(a,) for a in aids]),
+        ("get_notes_for_admission", [(a,) for a in aids]),
+    ]
+    if args.only:
+        suite = [s for s in suite if s[0] in args.only]
+
+    results = {}
+    # log_data() prints every result; keep that cost in the numbers but off the terminal
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name, pool in suite:
+            results[name] = await _run_helper(getattr(mongo, name), pool, args.requests, args.concurrency, rng)
+            print(f"{name:34s} " + "  ".join(f"{k}={v}" for k, v in results[name].items()), file=sys.stderr)
+
+    results["_meta"] = {
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "seed": args.seed,
+        "db": args.db,
+        "referenceCache": mongo.reference_cache_stats(),
+        "mongoPool": mongo.pool_stats(),
+    }
+    mongo.close_client()
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark mongo.py helpers under concurrency.")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="hms_bench")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000, help="calls per helper")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--only", nargs="*", help="benchmark only these helpers")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args(argv)
+
+    os.environ["MANGODB_URl"] = args.uri
+    os.environ["MONGO_DB_NAME"] = args.db
+
+    results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2, default=str)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
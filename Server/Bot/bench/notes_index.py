@@ -0,0 +1,108 @@
+"""
+BM25 notes index benchmark: build, flush/merge and query latency over
+synthetic notes (no MongoDB needed).
+
+Notes are generated from the synthetic_data vocabulary plus a few rare
+"event" phrases, indexed into a temporary directory, and a fixed set of
+queries (with and without patient/date filters) is timed.
+
+    python -m bench.notes_index
+    python -m bench.notes_index --notes 200000 --repeat 50 --json notes_index.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+import notes_index
+from bench.synthetic_data import NOTE_WORDS, NOTE_CATEGORIES
+
+EVENTS = ["patient had a fall from bed", "new onset chest pain", "pressure ulcer noted on sacrum",
+          "allergic reaction to ceftriaxone", "hypoglycaemia episode treated"]
+QUERIES = [
+    ("fall", {}),
+    ("who had a fall", {"days": 7}),
+    ("chest pain", {"patient": True}),
+    ("allergic reaction ceftriaxone", {}),
+    ("abdominal pain nausea", {}),
+    ("", {"patient": True}),
+]
+
+def _notes(count: int, patients: int, seed: int):
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    for i in range(count):
+        words = [rng.choice(NOTE_WORDS) for _ in range(rng.randint(80, 400))]
+        if rng.random() < 0.02:
+            words.insert(rng.randrange(len(words)), rng.choice(EVENTS))
+        pid = f"P{rng.randrange(patients):05d}"
+        yield {"_id": ObjectId(), "patient_id": pid, "admission_id": f"A{pid[1:]}-{i % 3}",
+               "charttime": start + timedelta(minutes=30 * i), "category": rng.choice(NOTE_CATEGORIES),
+               "text": " ".join(words)}
+
+def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as path:
+        index = notes_index.NotesIndex(path, flush_docs=args.flush_docs)
+        index.load()
+        t0 = time.perf_counter()
+        for doc in _notes(args.notes, args.patients, args.seed):
+            index.add(doc)
+            if index.mem.n >= index.flush_docs and index.flush():
+                index.merge()
+        index.flush()
+        index.merge()
+        build_s = time.perf_counter() - t0
+        size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+        results = {"notes": args.notes, "build_s": round(build_s, 2), "index_bytes": size, "queries": {}}
+        last = datetime(2025, 1, 1) + timedelta(minutes=30 * args.notes)
+        for query, opts in QUERIES:
+            kwargs = {}
+            if opts.get("patient"):
+                kwargs["patient_id"] = "P00001"
+            if opts.get("days"):
+                kwargs["start"], kwargs["end"] = last - timedelta(days=opts["days"]), last
+            samples, hits = [], []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                hits = index.search(query, limit=10, **kwargs)
+                samples.append((time.perf_counter() - t0) * 1000)
+            label = query or "(list)"
+            if kwargs:
+                label += " " + ",".join(sorted(kwargs))
+            results["queries"][label] = {"median_ms": round(statistics.median(samples), 2),
+                                         "max_ms": round(max(samples), 2), "hits": len(hits)}
+        for seg in index.segments:
+            seg.close()
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the BM25 notes index.")
+    parser.add_argument("--notes", type=int, default=50000)
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--flush-docs", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print(f"indexed {results['notes']} notes in {results['build_s']}s, {results['index_bytes'] / 1e6:.1f} MB on disk")
+    for label, r in results["queries"].items():
+        print(f"  {label:40s} median={r['median_ms']}ms max={r['max_ms']}ms hits={r['hits']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
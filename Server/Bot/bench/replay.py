@@ -0,0 +1,329 @@
+"""
+Replays a /chat traffic capture (see capture.py) against the build in the
+current directory, using local stand-ins for the external services, and
+compares two replays.
+
+    # a local Mongo with the synthetic dataset; captured IDs map onto its first patients
+    python -m bench.synthetic_data --db hms_bench --patients 10000 --drop
+    # replay the same capture against each build (e.g. two git worktrees)
+    python -m bench.replay run capture.jsonl --db hms_bench --label main --out main.json
+    python -m bench.replay run capture.jsonl --db hms_bench --label branch --out branch.json
+    # latency distributions and intent decisions side by side; exit 1 on regression
+    python -m bench.replay compare main.json branch.json --threshold 0.10
+
+Stand-ins:
+- Mongo: MANGODB_URl / MONGO_DB_NAME point at --uri / --db before app.py is
+  imported. Index creation and traffic capture are switched off, and
+  conversations stay in the local in-memory store.
+- Azure OpenAI: rag.client is replaced by a stub. Its completion call
+  sleeps for the captured request's llm.generation time (or --llm-ms), scaled
+  by --llm-scale, then returns a fixed reply. Prompt building and
+  serialization still run, but no tokens are bought.
+The NLP models are the real ones, because intent decisions are part of what
+gets compared.
+
+Requests go through app.chat_endpoint, so admission control, dialogue state
+and persistence all behave as they do in production. With --speed N > 0,
+each request is sent at its captured arrival offset divided by N (open
+loop). With --speed 0, requests are sent back to back by --concurrency
+workers (closed loop).
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess
+import contextvars
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+
+# ---------------------------- Capture ----------------------------
+
+def load_capture(path: str) -> list:
+    """Request records in arrival order; a capture restarted into the same file continues the timeline."""
+    requests, offset, last = [], 0.0, 0.0
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("type") == "capture":
+                offset = last
+            elif record.get("type") == "request":
+                record["at"] = record["at"] + offset
+                last = record["at"]
+                requests.append(record)
+    requests.sort(key=lambda r: r["at"])
+    return requests
+
+# ---------------------------- Azure stand-in ----------------------------
+
+_llm_ms: contextvars.ContextVar = contextvars.ContextVar("replay_llm_ms", default=None)
+STUB_REPLY = "Replay stub reply."
+
+class _StubCompletions:
+    def __init__(self, default_ms: float, scale: float):
+        self.default_ms = default_ms
+        self.scale = scale
+        self.calls = 0
+
+    def create(self, stream: bool = False, **kwargs):
+        # runs on the RAG worker thread, which inherits the request's context
+        ms = _llm_ms.get()
+        time.sleep((self.default_ms if ms is None else ms) * self.scale / 1000)
+        self.calls += 1
+        if stream:
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=STUB_REPLY))])])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=STUB_REPLY))])
+
+class StubAzureClient:
+    def __init__(self, default_ms: float = 800, scale: float = 1.0):
+        self.chat = SimpleNamespace(completions=_StubCompletions(default_ms, scale))
+
+# ---------------------------- Replay ----------------------------
+
+def _load_app(args):
+    os.environ["MANGODB_URl"] = args.uri
+    os.environ["MONGO_DB_NAME"] = args.db
+    os.environ["ENSURE_INDEXES"] = "0"
+    os.environ["USE_MONGO_FOR_CONV"] = "0"
+    os.environ["CONV_BACKEND"] = "memory"
+    os.environ.pop("CAPTURE_PATH", None)
+    import app
+    import rag
+    rag.client = StubAzureClient(args.llm_ms, args.llm_scale)
+    return app
+
+def _spans(timing: dict) -> dict:
+    spans = {}
+    for s in timing.get("spans") or ():
+        spans[s["name"]] = round(spans.get(s["name"], 0) + s["ms"], 2)
+    return spans
+
+async def _send(app, seq: int, record: dict) -> dict:
+    from fastapi import HTTPException
+
+    _llm_ms.set((record.get("spans") or {}).get("llm.generation"))
+    request = SimpleNamespace(state=SimpleNamespace(user=None))
+    status, timing = "ok", {}
+    t0 = time.perf_counter()
+    try:
+        response = await app.chat_endpoint(
+            app.ChatRequest(message=record["message"], conversationId=record.get("conversation")),
+            x_correlation_id=f"replay-{seq}", x_debug_timing="1", x_priority=record.get("priority"),
+            request=request)
+        timing = response["meta"].get("timing") or {}
+    except HTTPException as e:
+        status = "rejected" if e.status_code == 429 else "error"
+    return {
+        "seq": seq,
+        "at": record["at"],
+        "message": record["message"],
+        "status": status,
+        "latencyMs": round((time.perf_counter() - t0) * 1000, 2),
+        "intents": timing.get("intents"),
+        "outcome": timing.get("outcome"),
+        "spans": _spans(timing),
+        "captured": {"intents": record.get("intents"), "latencyMs": record.get("latencyMs"),
+                     "status": record.get("status")},
+    }
+
+async def replay(app, requests: list, speed: float, concurrency: int) -> list:
+    results = [None] * len(requests)
+
+    async def one(seq, record, due):
+        result = await _send(app, seq, record)
+        result["lateMs"] = round(max(0.0, sent[seq] - due) * 1000, 2)
+        results[seq] = result
+
+    sent = {}
+    start = time.perf_counter()
+    if speed > 0:
+        tasks = []
+        for seq, record in enumerate(requests):
+            due = record["at"] / speed
+            delay = due - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sent[seq] = time.perf_counter() - start
+            tasks.append(asyncio.create_task(one(seq, record, due)))
+        await asyncio.gather(*tasks)
+    else:
+        queue = asyncio.Queue()
+        for item in enumerate(requests):
+            queue.put_nowait(item)
+
+        async def worker():
+            while not queue.empty():
+                seq, record = queue.get_nowait()
+                sent[seq] = time.perf_counter() - start
+                await one(seq, record, sent[seq])
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return results
+
+# ---------------------------- Summary ----------------------------
+
+def _dist(values: list) -> dict:
+    if not values:
+        return {"n": 0}
+    ordered = sorted(values)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+    return {"n": len(ordered), "p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99),
+            "mean": round(statistics.fmean(ordered), 2), "max": round(ordered[-1], 2)}
+
+def summarize(results: list) -> dict:
+    ok = [r for r in results if r["status"] == "ok"]
+    by_intent, by_stage = {}, {}
+    for r in ok:
+        by_intent.setdefault((r["intents"] or ["unknown"])[0], []).append(r["latencyMs"])
+        for name, ms in r["spans"].items():
+            by_stage.setdefault(name, []).append(ms)
+    compared = [r for r in ok if r["intents"] and r["captured"]["intents"]]
+    agree = sum(1 for r in compared if r["intents"] == r["captured"]["intents"])
+    return {
+        "requests": len(results),
+        "statuses": dict(Counter(r["status"] for r in results)),
+        "latencyMs": _dist([r["latencyMs"] for r in ok]),
+        "capturedLatencyMs": _dist([r["captured"]["latencyMs"] for r in ok if r["captured"]["latencyMs"] is not None]),
+        "lateMs": _dist([r["lateMs"] for r in results]),
+        "byIntent": {intent: _dist(values) for intent, values in sorted(by_intent.items())},
+        "stages": {name: _dist(values) for name, values in sorted(by_stage.items())},
+        "intentAgreementWithCapture": round(agree / len(compared), 4) if compared else None,
+    }
+
+def _build_id() -> str:
+    if os.getenv("BUILD_ID"):
+        return os.getenv("BUILD_ID")
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def _run(args) -> dict:
+    requests = load_capture(args.capture)
+    if args.limit:
+        requests = requests[:args.limit]
+    app = _load_app(args)
+    await app.on_startup()
+    try:
+        if args.warmup:
+            await replay(app, requests[:args.warmup], 0, 1)
+        t0 = time.perf_counter()
+        results = await replay(app, requests, args.speed, args.concurrency)
+        wall = time.perf_counter() - t0
+    finally:
+        await app.on_shutdown()
+    return {
+        "label": args.label or _build_id() or "replay",
+        "build": _build_id(),
+        "capture": os.path.abspath(args.capture),
+        "speed": args.speed,
+        "startedAt": datetime.utcnow().isoformat(),
+        "wallS": round(wall, 2),
+        "summary": summarize(results),
+        "results": results,
+    }
+
+# ---------------------------- Compare ----------------------------
+
+def _row(name: str, a, b) -> str:
+    if a is None or b is None:
+        return f"  {name:44s} {a if a is not None else '-':>10} {b if b is not None else '-':>10}"
+    change = (b - a) / a if a else 0.0
+    return f"  {name:44s} {a:>10.1f} {b:>10.1f} {change:>+8.1%}"
+
+def compare(a: dict, b: dict, threshold: float, max_intent_changes: float, min_n: int = 5) -> int:
+    sa, sb = a["summary"], b["summary"]
+    print(f"  {'':44s} {a['label'][:10]:>10} {b['label'][:10]:>10} {'change':>8}")
+    print("latency (ms)")
+    for q in ("p50", "p90", "p99", "mean", "max"):
+        print(_row(q, sa["latencyMs"].get(q), sb["latencyMs"].get(q)))
+    print("statuses", sa["statuses"], "->", sb["statuses"])
+
+    print("by intent (p50 / p99 ms)")
+    for intent in sorted(set(sa["byIntent"]) & set(sb["byIntent"])):
+        da, db = sa["byIntent"][intent], sb["byIntent"][intent]
+        if min(da["n"], db["n"]) >= min_n:
+            print(_row(f"{intent} p50 (n={db['n']})", da["p50"], db["p50"]))
+            print(_row(f"{intent} p99", da["p99"], db["p99"]))
+    print("by stage (p50 ms)")
+    for stage in sorted(set(sa["stages"]) & set(sb["stages"])):
+        if min(sa["stages"][stage]["n"], sb["stages"][stage]["n"]) >= min_n:
+            print(_row(stage, sa["stages"][stage]["p50"], sb["stages"][stage]["p50"]))
+
+    pairs = [(x, y) for x, y in zip(a["results"], b["results"]) if x["status"] == y["status"] == "ok"]
+    changed = [(x, y) for x, y in pairs if x["intents"] != y["intents"]]
+    change_rate = len(changed) / len(pairs) if pairs else 0.0
+    print(f"intent decisions: {len(changed)} of {len(pairs)} changed ({change_rate:.1%}); agreement with capture "
+          f"{sa['intentAgreementWithCapture']} -> {sb['intentAgreementWithCapture']}")
+    for x, y in changed[:20]:
+        print(f"  #{x['seq']} {x['message'][:60]!r}: {x['intents']} -> {y['intents']}")
+
+    failures = []
+    for q in ("p50", "p99"):
+        before, after = sa["latencyMs"].get(q), sb["latencyMs"].get(q)
+        if before and after and (after - before) / before > threshold:
+            failures.append(f"{q} latency {before}ms -> {after}ms")
+    if change_rate > max_intent_changes:
+        failures.append(f"{change_rate:.1%} of intent decisions changed")
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    return 1 if failures else 0
+
+# ---------------------------- CLI ----------------------------
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay captured /chat traffic and compare builds.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="replay a capture against this build")
+    run.add_argument("capture")
+    run.add_argument("--uri", default="mongodb://localhost:27017")
+    run.add_argument("--db", default="hms_bench")
+    run.add_argument("--label", help="name for this build in comparisons (default: git commit)")
+    run.add_argument("--out", help="write the full results to this file")
+    run.add_argument("--speed", type=float, default=1.0, help="time scale; 2 = twice as fast, 0 = back to back")
+    run.add_argument("--concurrency", type=int, default=1, help="workers when --speed 0")
+    run.add_argument("--llm-ms", type=float, default=800, help="stub LLM time for requests without a captured one")
+    run.add_argument("--llm-scale", type=float, default=1.0, help="multiplier on stub LLM time (0 = instant)")
+    run.add_argument("--warmup", type=int, default=5, help="replay this many requests first, unmeasured")
+    run.add_argument("--limit", type=int, help="replay only the first N requests")
+
+    cmp_ = sub.add_parser("compare", help="compare two replay results")
+    cmp_.add_argument("baseline")
+    cmp_.add_argument("candidate")
+    cmp_.add_argument("--threshold", type=float, default=0.10, help="allowed relative p50/p99 latency growth")
+    cmp_.add_argument("--max-intent-changes", type=float, default=0.02,
+                      help="allowed fraction of requests whose intents changed")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        with open(args.candidate, encoding="utf-8") as fh:
+            candidate = json.load(fh)
+        return compare(baseline, candidate, args.threshold, args.max_intent_changes)
+
+    result = asyncio.run(_run(args))
+    summary = result["summary"]
+    print(f"[{result['label']}] {summary['requests']} requests in {result['wallS']}s {summary['statuses']}")
+    print(f"  latency ms   {summary['latencyMs']}")
+    print(f"  captured ms  {summary['capturedLatencyMs']}")
+    print(f"  send lag ms  {summary['lateMs']}")
+    print(f"  intent agreement with capture: {summary['intentAgreementWithCapture']}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=2, default=str)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
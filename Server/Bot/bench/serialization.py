@@ -0,0 +1,168 @@
+"""
+JSON serialization and response compression benchmark.
+
+Builds representative payloads for both services (a conversation message
+page and a patient history from the chatbot, a 20-file /process result from
+the image-processor), then reports per-encoder CPU time and, for each
+compression setting, bytes on the wire and compression time.
+
+    python -m bench.serialization
+    python -m bench.serialization --repeat 200 --json serialization.json
+"""
+
+import sys
+import json
+import time
+import gzip
+import random
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+import fastjson
+from compression import brotli
+from bench.synthetic_data import FIRST_NAMES, LAST_NAMES, DRUGS, LAB_ITEMS, NOTE_WORDS, WARDS, ICD_CODES
+
+# ---------------------------- Payloads ----------------------------
+
+def _words(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(NOTE_WORDS) for _ in range(n))
+
+def conversation_page(rng: random.Random, messages: int = 200) -> dict:
+    start = datetime(2025, 6, 1, 9, 0)
+    msgs = []
+    for i in range(messages):
+        msgs.append({
+            "id": str(ObjectId()),
+            "sender": "user" if i % 2 == 0 else "bot",
+            "text": _words(rng, 12 if i % 2 == 0 else 70),
+            "ts": start + timedelta(seconds=40 * i),
+            "seq": i + 1,
+            "meta": {"correlationId": f"cid_{ObjectId()}"},
+        })
+    return {"success": True, "messages": msgs, "page": {"limit": messages, "count": messages}}
+
+def patient_history(rng: random.Random, admissions: int = 12) -> dict:
+    pid = rng.randint(10000, 99999)
+    admit0 = datetime(2022, 1, 1)
+    adms, rx, notes, dx = [], [], [], []
+    for a in range(admissions):
+        aid = pid * 100 + a
+        admit = admit0 + timedelta(days=60 * a)
+        adms.append({"_id": ObjectId(), "patient_id": pid, "admission_id": aid, "admittime": admit,
+                     "dischtime": admit + timedelta(days=rng.randint(2, 9)), "ward": rng.choice(WARDS),
+                     "admission_type": "EMERGENCY", "diagnosis": rng.choice(ICD_CODES)[1]})
+        for _ in range(15):
+            drug, dose, unit, route = rng.choice(DRUGS)
+            rx.append({"_id": ObjectId(), "patient_id": pid, "admission_id": aid, "drug": drug,
+                       "dose_val_rx": dose, "dose_unit_rx": unit, "route": route,
+                       "startdate": admit, "enddate": admit + timedelta(days=3)})
+        for _ in range(4):
+            notes.append({"_id": ObjectId(), "patient_id": pid, "admission_id": aid, "category": "Progress note",
+                          "charttime": admit + timedelta(hours=rng.randint(1, 96)), "text": _words(rng, 220)})
+        code, title = rng.choice(ICD_CODES)
+        dx.append({"_id": ObjectId(), "admission_id": aid, "icd_code": code, "long_title": title})
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    return {"patient": {"_id": ObjectId(), "patient_id": pid, "name": name, "dob": datetime(1970, 5, 17)},
+            "admissions": adms, "prescriptions": rx, "notes": notes, "diagnoses": dx}
+
+def process_results(rng: random.Random, files: int = 20) -> dict:
+    results = []
+    for i in range(files):
+        cbc = {}
+        for _itemid, label, _fluid, _category, unit, (lo, hi) in LAB_ITEMS:
+            cbc[label.lower()] = {"value": round(rng.uniform(lo, hi), 2), "unit": unit}
+        pages = "\n\n".join(f"--- Page {p} (conf: {rng.uniform(70, 95):.2f}) ---\n{_words(rng, 450)}" for p in range(1, 4))
+        results.append({
+            "file": f"report_{i}.pdf",
+            "job_id": f"{ObjectId()}",
+            "status": "success",
+            "ocr_text": json.dumps({"text": pages, "confidence": 84.2, "pages": 3}, indent=2),
+            "structured_data": {"cbc": cbc, "metadata": {"patient_name": rng.choice(FIRST_NAMES),
+                                                         "report_date": "2025-06-01"}},
+            "db_status": f"Inserted patient report successfully: {ObjectId()}",
+            "message": "",
+        })
+    return {"results": results}
+
+# ---------------------------- Encoders ----------------------------
+
+def _encoders() -> dict:
+    encoders = {
+        "json(default=str)": lambda c: json.dumps(c, default=str).encode("utf-8"),
+        f"fastjson[{fastjson.BACKEND}]": fastjson.dumps,
+    }
+    try:
+        from fastapi.encoders import jsonable_encoder
+        # FastAPI's default path for a returned dict: jsonable_encoder walk, then json.dumps
+        encoders["fastapi default"] = lambda c: json.dumps(
+            jsonable_encoder(c, custom_encoder={ObjectId: str}), ensure_ascii=False, allow_nan=False,
+            separators=(",", ":")).encode("utf-8")
+    except ImportError:
+        pass
+    return encoders
+
+def _compressors() -> dict:
+    compressors = {
+        "identity": lambda b: b,
+        "gzip-1": lambda b: gzip.compress(b, compresslevel=1),
+        "gzip-6": lambda b: gzip.compress(b, compresslevel=6),
+    }
+    if brotli is not None:
+        compressors["br-4"] = lambda b: brotli.compress(b, quality=4)
+        compressors["br-11"] = lambda b: brotli.compress(b, quality=11)
+    return compressors
+
+def _time_ms(fn, arg, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(arg)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return {"median_ms": round(statistics.median(samples), 3), "min_ms": round(min(samples), 3), "out": out}
+
+def run(args) -> dict:
+    rng = random.Random(args.seed)
+    payloads = {
+        "bot: conversation page (200 msgs)": conversation_page(rng),
+        "bot: patient history": patient_history(rng),
+        "image-processor: /process x20": process_results(rng),
+    }
+    results = {}
+    for name, payload in payloads.items():
+        entry = {"encode": {}, "wire": {}}
+        for enc_name, enc in _encoders().items():
+            timed = _time_ms(enc, payload, args.repeat)
+            entry["encode"][enc_name] = {k: v for k, v in timed.items() if k != "out"}
+        body = fastjson.dumps(payload)  # what the services now put on the wire
+        for comp_name, comp in _compressors().items():
+            timed = _time_ms(comp, body, max(1, args.repeat // 4))
+            entry["wire"][comp_name] = {"bytes": len(timed["out"]), "ratio": round(len(body) / len(timed["out"]), 2),
+                                        "median_ms": timed["median_ms"]}
+        results[name] = entry
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark JSON encoders and response compression.")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    for payload, entry in results.items():
+        print(f"[{payload}]")
+        for enc, r in entry["encode"].items():
+            print(f"  encode  {enc:22s} median={r['median_ms']}ms min={r['min_ms']}ms")
+        for comp, r in entry["wire"].items():
+            print(f"  wire    {comp:22s} bytes={r['bytes']} ratio={r['ratio']}x median={r['median_ms']}ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
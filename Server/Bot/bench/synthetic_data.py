@@ -0,0 +1,297 @@
+"""
+Seeded synthetic hospital dataset for the collections read by mongo.py.
+
+Fills a local mongod with realistic volumes (defaults: 100k patients,
+~1.75M prescriptions, ~1.4M notes, appointments spread over 3 years).
+Documents are generated lazily and inserted in batches, so memory stays
+flat regardless of scale. The same --seed always produces the same data.
+
+    python -m bench.synthetic_data --uri mongodb://localhost:27017 --db hms_bench --drop
+    python -m bench.synthetic_data --patients 10000 --years 1     # quick run
+    python -m bench.synthetic_data --patients 10000 --vitals-interval-min 15   # with vitals
+"""
+
+import sys
+import time
+import uuid
+import random
+import argparse
+from datetime import datetime, timedelta
+from pymongo import MongoClient
+
+from vocabulary import FIRST_NAMES, LAST_NAMES, DEPARTMENTS, WARDS, STAFF_ROLES
+
+ADMISSION_TYPES = ["EMERGENCY", "ELECTIVE", "URGENT"]
+DRUGS = [
+    ("Pantoprazole", "40", "mg", "IV"), ("Ondansetron", "4", "mg", "IV"), ("Paracetamol", "650", "mg", "PO"),
+    ("Metformin", "500", "mg", "PO"), ("Ceftriaxone", "1", "g", "IV"), ("Rifaximin", "550", "mg", "PO"),
+    ("Lactulose", "15", "mL", "PO"), ("Ursodeoxycholic acid", "300", "mg", "PO"), ("Furosemide", "40", "mg", "PO"),
+    ("Spironolactone", "100", "mg", "PO"), ("Omeprazole", "20", "mg", "PO"), ("Metronidazole", "400", "mg", "PO"),
+]
+ICD_CODES = [
+    ("K21.9", "Gastro-esophageal reflux disease without esophagitis"), ("K70.30", "Alcoholic cirrhosis of liver"),
+    ("K80.20", "Calculus of gallbladder without obstruction"), ("K85.90", "Acute pancreatitis, unspecified"),
+    ("K92.2", "Gastrointestinal hemorrhage, unspecified"), ("E11.9", "Type 2 diabetes mellitus"),
+    ("I10", "Essential hypertension"), ("K29.70", "Gastritis, unspecified"), ("B18.1", "Chronic viral hepatitis B"),
+    ("K50.90", "Crohn's disease, unspecified"),
+]
+LAB_ITEMS = [
+    (50912, "Creatinine", "Blood", "Chemistry", "mg/dL", (0.5, 3.0)),
+    (50885, "Bilirubin, Total", "Blood", "Chemistry", "mg/dL", (0.2, 8.0)),
+    (50861, "Alanine Aminotransferase (ALT)", "Blood", "Chemistry", "IU/L", (10, 300)),
+    (50878, "Asparate Aminotransferase (AST)", "Blood", "Chemistry", "IU/L", (10, 300)),
+    (51222, "Hemoglobin", "Blood", "Hematology", "g/dL", (7, 17)),
+    (51301, "White Blood Cells", "Blood", "Hematology", "K/uL", (3, 20)),
+    (51265, "Platelet Count", "Blood", "Hematology", "K/uL", (50, 450)),
+    (50931, "Glucose", "Blood", "Chemistry", "mg/dL", (60, 300)),
+    (50983, "Sodium", "Blood", "Chemistry", "mEq/L", (125, 150)),
+    (50971, "Potassium", "Blood", "Chemistry", "mEq/L", (2.8, 6.0)),
+]
+NOTE_CATEGORIES = ["Nursing", "Physician", "Discharge summary", "Radiology", "Nutrition", "Progress note"]
+NOTE_WORDS = (
+    "patient stable afebrile tolerating oral diet abdominal pain tenderness epigastric mild nausea vomiting "
+    "bowel sounds present jaundice improving bilirubin trending down ultrasound shows gallbladder sludge "
+    "no ascites plan continue pantoprazole review labs tomorrow fall risk assessed ambulating with support "
+    "endoscopy scheduled consent obtained vitals within normal limits urine output adequate discharge planned"
+).split()
+# metric -> (baseline, random-walk step, lower clamp, upper clamp)
+VITAL_SIGNS = {
+    "temperature": (37.0, 0.08, 34.5, 41.0),
+    "spo2": (97.0, 0.4, 82.0, 100.0),
+    "heart_rate": (82.0, 2.5, 38.0, 170.0),
+    "resp_rate": (16.0, 0.6, 6.0, 36.0),
+    "sbp": (124.0, 3.0, 70.0, 210.0),
+    "dbp": (78.0, 2.0, 35.0, 130.0),
+}
+
+
+class Generator:
+    def __init__(self, seed: int, patients: int, years: int, end: datetime, vitals_interval_min: int = 0):
+        self.rng = random.Random(seed)
+        # separate stream so enabling vitals doesn't change the other collections
+        self.vitals_rng = random.Random(seed + 1)
+        self.vitals_interval = timedelta(minutes=vitals_interval_min) if vitals_interval_min > 0 else None
+        self.patients = patients
+        self.start = end - timedelta(days=365 * years)
+        self.end = end
+        self.span_s = int((end - self.start).total_seconds())
+
+    def _when(self) -> datetime:
+        return self.start + timedelta(seconds=self.rng.randrange(self.span_s))
+
+    def _name(self) -> str:
+        return f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+
+    def _note_text(self) -> str:
+        return " ".join(self.rng.choice(NOTE_WORDS) for _ in range(self.rng.randint(80, 400)))
+
+    def vitals(self, pid: str, admit: datetime, until: datetime):
+        """Charted vitals for one admission, one PatientVitals document (Server/Models/PatientVitals.js) per round."""
+        rng = self.vitals_rng
+        level = {m: base for m, (base, _step, _lo, _hi) in VITAL_SIGNS.items()}
+        # roughly one admission in five runs a fever with falling saturation for a day or two
+        episode_start = admit + timedelta(hours=rng.randint(12, 96)) if rng.random() < 0.2 else None
+        t = admit
+        while t <= until:
+            in_episode = episode_start is not None and episode_start <= t < episode_start + timedelta(hours=36)
+            values = {}
+            for metric, (base, step, lo, hi) in VITAL_SIGNS.items():
+                drift = (base - level[metric]) * 0.1  # revert towards baseline
+                if in_episode and metric in ("temperature", "heart_rate", "resp_rate"):
+                    drift += step * 0.6
+                elif in_episode and metric == "spo2":
+                    drift -= step * 0.5
+                level[metric] = min(hi, max(lo, level[metric] + drift + rng.gauss(0, step)))
+                values[metric] = round(level[metric], 1) if metric == "temperature" else round(level[metric])
+            yield {
+                "patientId": pid,
+                "appointmentId": None,
+                "recordedBy": f"S{rng.randrange(500):05d}",
+                "bloodPressure": {"systolic": values["sbp"], "diastolic": values["dbp"],
+                                  "reading": f"{values['sbp']}/{values['dbp']}"},
+                "heartRate": values["heart_rate"],
+                "temperature": {"value": values["temperature"], "unit": "C"},
+                "respiratoryRate": values["resp_rate"],
+                "oxygenSaturation": values["spo2"],
+                "notes": "",
+                "abnormalFlags": [],
+                "recordedAt": t,
+                "location": "Ward",
+                "createdAt": t,
+                "updatedAt": t,
+            }
+            t += self.vitals_interval
+
+    def staff(self, count: int = 500):
+        for i in range(count):
+            yield {
+                "staff_id": f"S{i:05d}",
+                "name": self._name(),
+                "role": self.rng.choice(STAFF_ROLES),
+                "department": self.rng.choice(DEPARTMENTS),
+                "contact": f"+91 9{self.rng.randrange(10**8, 10**9)}",
+                "shift": self.rng.choice(["Morning", "Evening", "Night"]),
+                "status": "active" if self.rng.random() < 0.9 else "inactive",
+            }
+
+    def lab_items(self):
+        for itemid, label, fluid, category, _unit, _range in LAB_ITEMS:
+            yield {"itemid": itemid, "label": label, "fluid": fluid, "category": category}
+
+    def patients_and_children(self):
+        """Yields (collection, document) pairs for each patient and everything hanging off them."""
+        rng = self.rng
+        for p in range(self.patients):
+            pid = f"P{p:07d}"
+            name = self._name()
+            first, last = name.split(" ", 1)
+            # the Node Patient fields (Server/Models/Patient.js) as well, since vitals are keyed by its UUID _id
+            node_id = str(uuid.uuid5(uuid.NAMESPACE_OID, pid))
+            yield "patients", {
+                "_id": node_id,
+                "firstName": first,
+                "lastName": last,
+                "patient_id": pid,
+                "name": name,
+                "dob": (datetime(1940, 1, 1) + timedelta(days=rng.randrange(365 * 80))).strftime("%Y-%m-%d"),
+                "gender": rng.choice(["M", "F"]),
+                "contact": f"+91 9{rng.randrange(10**8, 10**9)}",
+                "address": f"{rng.randint(1, 300)}, {rng.choice(['Karur', 'Trichy', 'Erode', 'Salem'])}",
+            }
+            for a in range(rng.choices([1, 2, 3, 4], weights=[50, 30, 15, 5])[0]):
+                aid = f"A{p:07d}{a}"
+                admit = self._when()
+                discharged = admit + timedelta(hours=rng.randint(6, 24 * 14))
+                still_in = discharged > self.end
+                yield "admissions", {
+                    "patient_id": pid,
+                    "admission_id": aid,
+                    "admittime": admit,
+                    "dischtime": None if still_in else discharged,
+                    "admission_type": rng.choice(ADMISSION_TYPES),
+                    "ward": rng.choice(WARDS),
+                    "diagnosis": rng.choice(ICD_CODES)[1],
+                    "status": "admitted" if still_in else "discharged",
+                }
+                for seq in range(rng.randint(2, 6)):
+                    code, title = rng.choice(ICD_CODES)
+                    yield "diagnosis_icd", {"patient_id": pid, "admission_id": aid, "seq_num": seq + 1,
+                                            "icd_code": code, "long_title": title}
+                for _ in range(rng.randint(5, 15)):
+                    drug, dose, unit, route = rng.choice(DRUGS)
+                    start = admit + timedelta(hours=rng.randint(0, 48))
+                    yield "prescriptions", {"patient_id": pid, "admission_id": aid, "drug": drug,
+                                            "dose_val_rx": dose, "dose_unit_rx": unit, "route": route,
+                                            "startdate": start, "enddate": start + timedelta(days=rng.randint(1, 10))}
+                for _ in range(rng.randint(4, 16)):
+                    itemid, label, _fluid, _cat, unit, (lo, hi) = rng.choice(LAB_ITEMS)
+                    value = round(rng.uniform(lo, hi), 2)
+                    yield "application", {"patient_id": pid, "admission_id": aid, "itemid": itemid,
+                                          "test_name": label, "charttime": admit + timedelta(hours=rng.randint(0, 72)),
+                                          "value": str(value), "valuenum": value, "valueuom": unit,
+                                          "flag": "abnormal" if value > (lo + hi) * 0.75 else None}
+                for _ in range(rng.randint(3, 13)):
+                    charted = admit + timedelta(hours=rng.randint(0, 96))
+                    yield "noteevents", {"patient_id": pid, "admission_id": aid, "chartdate": charted.date().isoformat(),
+                                         "charttime": charted, "category": rng.choice(NOTE_CATEGORIES),
+                                         "description": "Report", "text": self._note_text()}
+                if self.vitals_interval:
+                    until = min(discharged, self.end, admit + timedelta(days=21))
+                    for doc in self.vitals(node_id, admit, until):
+                        yield "patientvitals", doc
+
+    def appointments(self, per_day: int):
+        rng = self.rng
+        day = self.start
+        while day <= self.end + timedelta(days=30):
+            date = day.strftime("%Y-%m-%d")
+            for _ in range(max(0, int(rng.gauss(per_day, per_day * 0.2)))):
+                yield {
+                    "date": date,
+                    "time": f"{rng.randint(8, 19):02d}:{rng.choice(['00', '15', '30', '45'])}",
+                    "patient_id": f"P{rng.randrange(self.patients):07d}",
+                    "patient_name": self._name(),
+                    "doctor": f"Dr. {self._name()}",
+                    "department": rng.choice(DEPARTMENTS),
+                    "status": rng.choice(["scheduled", "completed", "cancelled", "no-show"]),
+                    "reason": rng.choice(["Follow-up", "Consultation", "Post-op review", "Lab review"]),
+                }
+            day += timedelta(days=1)
+
+
+class BatchWriter:
+    def __init__(self, db, batch_size: int):
+        self.db = db
+        self.batch_size = batch_size
+        self.buffers = {}
+        self.counts = {}
+
+    def add(self, collection: str, doc: dict):
+        buf = self.buffers.setdefault(collection, [])
+        buf.append(doc)
+        if len(buf) >= self.batch_size:
+            self._flush(collection)
+
+    def _flush(self, collection: str):
+        buf = self.buffers.get(collection)
+        if buf:
+            self.db[collection].insert_many(buf, ordered=False)
+            self.counts[collection] = self.counts.get(collection, 0) + len(buf)
+            self.buffers[collection] = []
+
+    def close(self):
+        for collection in list(self.buffers):
+            self._flush(collection)
+
+
+COLLECTIONS = ["patients", "admissions", "prescriptions", "diagnosis_icd", "application",
+               "noteevents", "appointments", "staff", "d_labitems", "patientvitals"]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a seeded synthetic hospital dataset.")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="hms_bench")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--patients", type=int, default=100_000)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--appointments-per-day", type=int, default=180)
+    parser.add_argument("--vitals-interval-min", type=int, default=0,
+                        help="chart vitals every N minutes during each admission (0 = no vitals)")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--end-date", default="2025-01-01", help="last day of generated history (YYYY-MM-DD)")
+    parser.add_argument("--drop", action="store_true", help="drop the target collections first")
+    args = parser.parse_args(argv)
+
+    client = MongoClient(args.uri)
+    db = client[args.db]
+    if args.drop:
+        for name in COLLECTIONS:
+            db.drop_collection(name)
+
+    gen = Generator(args.seed, args.patients, args.years, datetime.fromisoformat(args.end_date),
+                    args.vitals_interval_min)
+    writer = BatchWriter(db, args.batch_size)
+    t0 = time.perf_counter()
+
+    for doc in gen.staff():
+        writer.add("staff", doc)
+    for doc in gen.lab_items():
+        writer.add("d_labitems", doc)
+    for i, (collection, doc) in enumerate(gen.patients_and_children()):
+        writer.add(collection, doc)
+        if i and i % 500_000 == 0:
+            print(f"  ... {i:,} documents ({time.perf_counter() - t0:.0f}s)", file=sys.stderr)
+    for doc in gen.appointments(args.appointments_per_day):
+        writer.add("appointments", doc)
+    writer.close()
+
+    elapsed = time.perf_counter() - t0
+    for collection in COLLECTIONS:
+        print(f"{collection:15s} {writer.counts.get(collection, 0):>12,}")
+    print(f"Generated in {elapsed:.1f}s into {args.db}. Apply indexes with: python indexes.py --apply")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
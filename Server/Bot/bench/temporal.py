@@ -0,0 +1,79 @@
+"""
+Date-expression resolution benchmark: temporal.resolve vs dateparser.parse.
+
+Runs a set of doctor-style date phrases through both resolvers and reports
+per-call time (cold = first call, warm = repeated, i.e. LRU hits for
+temporal) plus what each one returned.
+
+    python -m bench.temporal
+    python -m bench.temporal --repeat 2000 --json temporal.json
+"""
+
+import sys
+import json
+import time
+import argparse
+import statistics
+from datetime import date
+
+import temporal
+
+PHRASES = [
+    "today", "tomorrow", "day after tomorrow", "next week", "this weekend", "next monday",
+    "between monday and thursday", "from 21/06 to 25/06", "21/06/2025", "21-6-25", "21st June",
+    "June 21, 2025", "next 3 days", "last month", "in 2 days",
+]
+
+def _time_us(fn, arg, repeat: int) -> dict:
+    t0 = time.perf_counter()
+    out = fn(arg)
+    cold = (time.perf_counter() - t0) * 1e6
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return {"cold_us": round(cold, 1), "warm_median_us": round(statistics.median(samples), 2), "out": out}
+
+def run(args) -> dict:
+    resolvers = {"temporal": lambda text: temporal.resolve(text)}
+    try:
+        import dateparser
+        resolvers["dateparser"] = lambda text: dateparser.parse(text, settings={"DATE_ORDER": "DMY"})
+    except ImportError:
+        pass
+
+    results = {}
+    for phrase in PHRASES:
+        entry = {}
+        for name, fn in resolvers.items():
+            timed = _time_us(fn, phrase, args.repeat)
+            out = timed.pop("out")
+            if isinstance(out, temporal.DateRange):
+                timed["result"] = f"[{out.start}, {out.end})"
+            else:
+                timed["result"] = out.date().isoformat() if out is not None else None
+            entry[name] = timed
+        results[phrase] = entry
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark date-expression resolution.")
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args(argv)
+
+    print(f"(today = {date.today()})")
+    results = run(args)
+    for phrase, entry in results.items():
+        print(f"[{phrase}]")
+        for name, r in entry.items():
+            print(f"  {name:11s} cold={r['cold_us']}us warm={r['warm_median_us']}us -> {r['result']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""
+Opt-in, anonymized capture of /chat traffic for offline replay
+(bench/replay.py).
+
+Setting CAPTURE_PATH turns capture on; with several workers, put "{pid}" in
+it to get one file per worker. The first line written is a header,
+{"type": "capture", "version": 1, "startedAt", "build", "sample"}. After that,
+each sampled /chat request adds one line:
+
+    {"type": "request", "at": <seconds since capture start>, "conversation": <pseudonym>,
+     "message": <anonymized text>, "priority", "intents", "outcome", "status",
+     "latencyMs", "spans": {<span name>: ms}}
+
+Text is anonymized before it is queued, so raw identifiers are never
+buffered or written:
+- patient and admission IDs become IDs in the synthetic dataset's shapes
+  (P%07d, A%07d0), chosen by a keyed hash;
+- the resolved entity, and every other capitalised word not in KEEP_WORDS
+  (sentence-initial ones included), become "First Last" names from the
+  synthetic name lists, also by keyed hash. A lower-case name is only caught
+  when NER resolved it as the entity;
+- calendar dates (every form temporal.py reads) keep their shape but become
+  01/01/2000-style dates; phone numbers, e-mail addresses and runs of 4 or
+  more digits (MRNs, years) are masked;
+- conversation IDs become keyed hashes. Follow-up structure survives this,
+  because every turn of a conversation maps to the same pseudonym.
+
+The key is CAPTURE_SALT. If it is unset, a random key is used per process,
+so pseudonyms are only consistent within one worker. IDs land in the first
+CAPTURE_PATIENT_SPACE synthetic patients, so a replay against
+`python -m bench.synthetic_data --patients <space>` resolves them to real
+records.
+
+CAPTURE_SAMPLE (0..1) sets the fraction of requests kept. A background task
+writes buffered lines every CAPTURE_FLUSH_S seconds. Capture stops by itself
+once the file reaches CAPTURE_MAX_MB.
+"""
+
+import os
+import re
+import hmac
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import contextvars
+from datetime import datetime
+from typing import Optional
+
+import metrics
+import temporal
+from vocabulary import FIRST_NAMES, LAST_NAMES, DEPARTMENTS, WARDS, STAFF_ROLES
+
+# ---------------------------- Logging Setup ----------------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+if not logger.handlers:
+    handler = logging.FileHandler("logs/chatbot.log", encoding="utf-8")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+CAPTURE_VERSION = 1
+
+CAPTURED = metrics.REGISTRY.counter(
+    "chatbot_capture_requests_total",
+    "/chat requests seen by traffic capture, by result (captured, sampled_out, dropped).",
+    ("result",),
+)
+
+# ---------------------------- Anonymization ----------------------------
+
+# capitalised words that are vocabulary, not names
+KEEP_WORDS = frozenset(
+    w.lower() for w in (
+        " ".join(DEPARTMENTS + WARDS + STAFF_ROLES).split()
+        + list(temporal.WEEKDAYS) + list(temporal.MONTHS)
+        + "I Dr Please Show What Who Whom Which When Where How Is Are Was Any List Get Give Tell Find Search "
+          "Can Could Do Does Did Has Have Had Will Would Should My Me The A An For All Of In On At To With "
+          "And Also Then Today Tomorrow Yesterday Next Last This Ward Room Bed Patient Patients Lab Labs "
+          "Notes Note Prescriptions Admission Admissions Appointments Staff Hospital Hello Hi Thanks".split()
+    )
+)
+
+_EMAIL = r"(?P<email>[\w.+-]+@[\w-]+\.[\w.]+)"
+_PHONE = r"(?P<phone>(?<![\w/.-])\+?\d[\d ()-]{8,}\d(?![\w/.-]))"
+_LONG_NUMBER = r"(?P<number>\b\d{4,}\b)"
+_PATIENT_ID = r"(?P<patient>\b[Pp]\d+\b)"
+_ADMISSION_ID = r"(?P<admission>\b[Aa]\d{3,}\b)"
+_NAME = r"(?P<name>\b[A-Z][a-z]+(?:[ \t]+[A-Z][a-z]+)*)"
+_FIXED = "|".join((_EMAIL, _PHONE, _LONG_NUMBER, _PATIENT_ID, _ADMISSION_ID, _NAME))
+_FIXED_RE = re.compile(_FIXED)
+_DATE_RE = re.compile(temporal.CALENDAR_DATE, re.IGNORECASE)
+
+def _mask_date(m) -> str:
+    # same form, so a replay still takes the same date path ("12/03/1980" -> "01/01/2000")
+    return re.sub(r"\d+", lambda d: "2000" if len(d.group(0)) == 4 else "01"[-len(d.group(0)):], m.group(0))
+
+
+class Anonymizer:
+    def __init__(self, salt: bytes, patient_space: int = 10000):
+        self.salt = salt
+        self.patient_space = max(1, patient_space)
+
+    def _n(self, kind: str, value: str) -> int:
+        digest = hmac.new(self.salt, f"{kind}:{value.lower()}".encode("utf-8"), hashlib.sha256).digest()
+        return int.from_bytes(digest[:8], "big")
+
+    def patient_id(self, value: str) -> str:
+        return f"P{self._n('patient', value) % self.patient_space:07d}"
+
+    def admission_id(self, value: str) -> str:
+        return f"A{self._n('admission', value) % self.patient_space:07d}0"
+
+    def name(self, value: str) -> str:
+        n = self._n("name", " ".join(value.split()))
+        return f"{FIRST_NAMES[n % len(FIRST_NAMES)]} {LAST_NAMES[n // len(FIRST_NAMES) % len(LAST_NAMES)]}"
+
+    def conversation(self, value: Optional[str]) -> Optional[str]:
+        return f"c{self._n('conversation', value):016x}" if value else None
+
+    def text(self, message: str, entity: Optional[str] = None) -> str:
+        # dates first, so a date's month name is not taken for part of a name ("Dob March 5, 1980");
+        # they are held out as private-use placeholders so the digit masking below leaves them alone
+        dates = []
+
+        def hold(m):
+            dates.append(_mask_date(m))
+            return chr(0xE000 + len(dates) - 1)
+
+        message = _DATE_RE.sub(hold, message)
+        pattern = _FIXED_RE
+        if entity and temporal.resolve(entity) is None and not all(w.lower() in KEEP_WORDS for w in entity.split()):
+            # the NER entity first, case-insensitively ("show ravi's labs")
+            pattern = re.compile(r"(?P<entity>(?i:\b" + re.escape(entity.strip()) + r"\b))|" + _FIXED)
+
+        def replace(m):
+            kind, value = m.lastgroup, m.group(0)
+            if kind == "entity":
+                return self.patient_id(value) if re.fullmatch(r"[Pp]\d+", value.strip()) else self.name(value)
+            if kind == "email":
+                return "user@example.com"
+            if kind == "number":
+                return "0" * len(value)
+            if kind == "phone":
+                digits = len(re.sub(r"\D", "", value))
+                return "0" * digits if digits >= 10 else value
+            if kind == "patient":
+                return self.patient_id(value)
+            if kind == "admission":
+                return self.admission_id(value)
+            # capitalised run ("Dr Meena", "Show Ravi", "Ravi has fever"): vocabulary words at either end stay
+            words = value.split()
+            lead = 0
+            while lead < len(words) and words[lead].lower() in KEEP_WORDS:
+                lead += 1
+            if lead == len(words):
+                return value
+            end = len(words)
+            while words[end - 1].lower() in KEEP_WORDS:
+                end -= 1
+            return " ".join(words[:lead] + [self.name(" ".join(words[lead:end]))] + words[end:])
+
+        out = pattern.sub(replace, message)
+        return re.sub("[\ue000-\uf8ff]", lambda m: dates[ord(m.group(0)) - 0xE000], out) if dates else out
+
+# ---------------------------- Capture ----------------------------
+
+_entity: contextvars.ContextVar = contextvars.ContextVar("capture_entity", default=None)
+
+def note_entity(entity: Optional[str]):
+    """Remembers the request's resolved entity so record() can anonymize it (called from process_query)."""
+    _entity.set(entity)
+
+
+class TrafficCapture:
+    def __init__(self, path: str, salt: Optional[bytes] = None, sample: float = 1.0, max_bytes: int = 256 * 2**20,
+                 flush_interval: float = 1.0, patient_space: int = 10000, build: Optional[str] = None):
+        self.path = path
+        self.sample = sample
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.build = build
+        self.anonymizer = Anonymizer(salt or os.urandom(32), patient_space)
+        self.t0 = time.perf_counter()
+        self.captured = 0
+        self.write_failures = 0
+        self.active = True
+        self._lines = []
+        self._bytes = os.path.getsize(path) if os.path.exists(path) else 0
+        self._task = None
+        self._rng = random.Random()
+        header = {"type": "capture", "version": CAPTURE_VERSION, "startedAt": datetime.utcnow().isoformat(),
+                  "build": build, "sample": sample}
+        self._lines.append(json.dumps(header, separators=(",", ":")))
+
+    @classmethod
+    def from_env(cls) -> Optional["TrafficCapture"]:
+        path = os.getenv("CAPTURE_PATH")
+        if not path:
+            return None
+        # one file per uvicorn worker: each has its own clock origin and pseudonym key
+        path = path.replace("{pid}", str(os.getpid()))
+        salt = os.getenv("CAPTURE_SALT")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return cls(
+            path,
+            salt=salt.encode("utf-8") if salt else None,
+            sample=float(os.getenv("CAPTURE_SAMPLE", "1")),
+            max_bytes=int(float(os.getenv("CAPTURE_MAX_MB", "256")) * 2**20),
+            flush_interval=float(os.getenv("CAPTURE_FLUSH_S", "1")),
+            patient_space=int(os.getenv("CAPTURE_PATIENT_SPACE", "10000")),
+            build=os.getenv("BUILD_ID") or os.getenv("GIT_COMMIT"),
+        )
+
+    def record(self, trace, message: str, status: str, priority: str = "normal",
+               conversation_id: Optional[str] = None):
+        """Queues one anonymized /chat request; `trace` is its tracing.RequestTrace."""
+        if not self.active:
+            CAPTURED.inc(result="dropped")
+            return
+        if self.sample < 1 and self._rng.random() >= self.sample:
+            CAPTURED.inc(result="sampled_out")
+            return
+        spans = {}
+        for s in trace.spans:
+            spans[s["name"]] = round(spans.get(s["name"], 0) + s["ms"], 2)
+        line = {
+            "type": "request",
+            "at": round(trace.t0 - self.t0, 4),
+            "conversation": self.anonymizer.conversation(conversation_id),
+            "message": self.anonymizer.text(message, _entity.get()),
+            "priority": priority,
+            "intents": trace.attrs.get("intents"),
+            "outcome": trace.attrs.get("outcome"),
+            "followUp": bool(trace.attrs.get("follow_up")),
+            "status": status,
+            "latencyMs": trace.elapsed_ms(),
+            "spans": spans,
+        }
+        self._lines.append(json.dumps(line, default=str, separators=(",", ":")))
+        self.captured += 1
+        CAPTURED.inc(result="captured")
+
+    def _write(self, lines: list):
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        with open(self.path, "ab") as fh:
+            fh.write(data)
+        self._bytes += len(data)
+        if self._bytes >= self.max_bytes and self.active:
+            self.active = False
+            logger.warning("[CAPTURE] %s reached %d bytes; capture stopped.", self.path, self._bytes)
+
+    async def flush(self):
+        if self._lines:
+            lines, self._lines = self._lines, []
+            await asyncio.to_thread(self._write, lines)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except OSError as e:
+                self.write_failures += 1
+                logger.warning("[CAPTURE] Write to %s failed: %s", self.path, e)
+
+    def start(self):
+        if self._task is None:
+            logger.info("[CAPTURE] Capturing /chat traffic to %s (sample=%s)", self.path, self.sample)
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {"path": self.path, "active": self.active, "captured": self.captured, "sample": self.sample,
+                "bytes": self._bytes, "pending": len(self._lines), "writeFailures": self.write_failures}
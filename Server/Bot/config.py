@@ -13,6 +13,15 @@ if MONGO_URI:
 else:
     print("[ERROR] MongoDB URI is missing in .env")
 
+# MongoDB connection pool (same variable names as the Node gateway)
+MONGO_POOL_MAX = int(os.getenv("MONGO_POOL_MAX", "50"))
+MONGO_POOL_MIN = int(os.getenv("MONGO_POOL_MIN", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "45000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+
 # Azure OpenAI
 AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -23,3 +32,46 @@ if AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_DEPLOYMENT an
     print("[DEBUG] Azure OpenAI config loaded successfully.")
 else:
     print("[ERROR] One or more Azure OpenAI variables are missing in .env")
+
+# Reference data cache (seconds)
+CACHE_TTL_STAFF = float(os.getenv("CACHE_TTL_STAFF", "300"))
+CACHE_TTL_LABITEMS = float(os.getenv("CACHE_TTL_LABITEMS", "3600"))
+CACHE_VERSION_POLL_INTERVAL = float(os.getenv("CACHE_VERSION_POLL_INTERVAL", "30"))
+
+# Conversation persistence (write-behind to Mongo when USE_MONGO_FOR_CONV=1)
+CONV_FLUSH_BATCH = int(os.getenv("CONV_FLUSH_BATCH", "50"))
+CONV_FLUSH_INTERVAL_MS = int(os.getenv("CONV_FLUSH_INTERVAL_MS", "500"))
+CONV_MAX_PENDING = int(os.getenv("CONV_MAX_PENDING", "10000"))
+
+# Appointment digests (today/tomorrow), rebuilt on this schedule and on change events
+DIGEST_REFRESH_INTERVAL = float(os.getenv("DIGEST_REFRESH_INTERVAL", "300"))
+DIGEST_DEBOUNCE_MS = int(os.getenv("DIGEST_DEBOUNCE_MS", "500"))
+
+# patient_summaries materialized view: rebuild debounce/batch, delta-poll interval without change streams,
+# and the age past which a summary is treated as missing (0 = served whatever its age)
+SUMMARY_DEBOUNCE_MS = int(os.getenv("SUMMARY_DEBOUNCE_MS", "1000"))
+SUMMARY_BATCH = int(os.getenv("SUMMARY_BATCH", "50"))
+SUMMARY_POLL_INTERVAL = float(os.getenv("SUMMARY_POLL_INTERVAL", "30"))
+SUMMARY_MAX_AGE_S = float(os.getenv("SUMMARY_MAX_AGE_S", "900"))
+
+# Vital-sign trends: look-back window (ending at the latest reading) and max points returned per metric
+VITALS_WINDOW_DAYS = float(os.getenv("VITALS_WINDOW_DAYS", "14"))
+VITALS_POINTS = int(os.getenv("VITALS_POINTS", "48"))
+
+# Bed occupancy: ward capacities ("ICU=20,HDU=12,General Ward A=40"), reconciliation
+# interval with change streams, and without them (reconciliation is then the only update path)
+WARD_CAPACITY = {
+    ward.strip(): int(beds)
+    for ward, _, beds in (item.partition("=") for item in os.getenv("WARD_CAPACITY", "").split(","))
+    if ward.strip() and beds.strip().isdigit()
+}
+OCCUPANCY_RECONCILE_INTERVAL = float(os.getenv("OCCUPANCY_RECONCILE_INTERVAL", "300"))
+OCCUPANCY_POLL_INTERVAL = float(os.getenv("OCCUPANCY_POLL_INTERVAL", "30"))
+
+# BM25 notes index (notes_index.py): directory, flush after N notes or seconds, merge above
+# this many segment files, delta-poll interval without change streams
+NOTES_INDEX_DIR = os.getenv("NOTES_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "notes_index"))
+NOTES_INDEX_FLUSH_DOCS = int(os.getenv("NOTES_INDEX_FLUSH_DOCS", "5000"))
+NOTES_INDEX_FLUSH_INTERVAL = float(os.getenv("NOTES_INDEX_FLUSH_INTERVAL", "30"))
+NOTES_INDEX_MAX_SEGMENTS = int(os.getenv("NOTES_INDEX_MAX_SEGMENTS", "8"))
+NOTES_INDEX_POLL_INTERVAL = float(os.getenv("NOTES_INDEX_POLL_INTERVAL", "30"))
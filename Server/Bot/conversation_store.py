@@ -0,0 +1,476 @@
+"""
+Conversation stores for the chatbot service (used by app.py when
+USE_MONGO_FOR_CONV is off). Both backends expose the same async API:
+create / append / append_many / list / messages / stats.
+
+InMemoryConversationStore:
+- conversations are sharded by id, each shard with its own asyncio.Lock
+- bounded: max conversations (LRU), max messages per conversation, idle TTL
+- each shard keeps its conversations in recency order, so listing merges the
+  shard tails and costs O(page size * log shards) instead of O(n)
+
+SQLiteConversationStore:
+- one local SQLite file in WAL mode, shared by every uvicorn worker on the host
+- one connection per executor thread; fixed SQL strings hit sqlite3's
+  per-connection prepared-statement cache
+- an exchange (user message + reply) is written in a single transaction
+- messages indexed on (conversation_id, ts, seq) and (conversation_id, seq)
+
+Paging (both backends):
+- list(limit, before, after): newest first; cursor is "<updatedAt>|<id>"
+- messages(convo_id, limit, before, after): oldest first; cursor is the message seq.
+  Without a cursor the newest `limit` messages are returned.
+- every returned item carries its own "cursor"; version() gives a cheap change
+  token for conditional GETs without reading the messages
+"""
+
+import os
+import sys
+import time
+import zlib
+import json
+import heapq
+import sqlite3
+import asyncio
+import threading
+from pathlib import Path
+from collections import OrderedDict, deque
+from datetime import datetime
+from itertools import islice, takewhile, dropwhile
+from typing import Optional, Dict, Any, List, Iterable, Tuple
+
+# rough per-object overheads used for memory accounting
+_CONV_OVERHEAD_BYTES = 600
+_MSG_OVERHEAD_BYTES = 350
+
+
+def new_id() -> str:
+    return "cid_" + os.urandom(6).hex() + "_" + str(int(datetime.utcnow().timestamp() * 1000))
+
+
+def _now_ts() -> str:
+    # fixed width so timestamps (and cursors built from them) sort as strings
+    return datetime.utcnow().isoformat(timespec="microseconds")
+
+
+def conversation_cursor(summary: Dict[str, Any]) -> str:
+    return f"{summary['updatedAt']}|{summary['id']}"
+
+
+class InvalidCursor(ValueError):
+    """A before/after cursor that no page ever returned (answered 400 by the endpoints)."""
+
+
+def parse_conversation_cursor(cursor: str) -> Tuple[str, str]:
+    updated_at, _, cid = cursor.partition("|")
+    try:
+        datetime.fromisoformat(updated_at)
+    except ValueError:
+        raise InvalidCursor(f"Invalid conversation cursor: {cursor!r}") from None
+    if not cid:
+        raise InvalidCursor(f"Invalid conversation cursor: {cursor!r}")
+    return updated_at, cid
+
+
+def _parse_seq_cursor(cursor: str) -> int:
+    try:
+        return int(cursor)
+    except ValueError:
+        raise InvalidCursor(f"Invalid message cursor: {cursor!r}") from None
+
+
+def _message_bytes(msg: Dict[str, Any]) -> int:
+    return _MSG_OVERHEAD_BYTES + sys.getsizeof(msg["text"])
+
+
+class _Shard:
+    __slots__ = ("lock", "convs", "bytes")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # cid -> conversation, least recently used first
+        self.convs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.bytes = 0
+
+
+class InMemoryConversationStore:
+    def __init__(self, shards: int = 16, max_conversations: int = 10000,
+                 max_messages: int = 500, ttl_seconds: float = 24 * 3600):
+        self._shards = [_Shard() for _ in range(shards)]
+        self.max_per_shard = max(1, -(-max_conversations // shards))
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.evicted_conversations = 0
+        self.evicted_messages = 0
+        self.version_counter = 0  # bumped on every mutation
+
+    # -------------------- internals --------------------
+    def _shard(self, convo_id: str) -> _Shard:
+        return self._shards[zlib.crc32(convo_id.encode()) % len(self._shards)]
+
+    def _expired(self, convo: Dict[str, Any], now: float) -> bool:
+        return now - convo["touched"] > self.ttl_seconds
+
+    def _drop(self, shard: _Shard, convo_id: str):
+        convo = shard.convs.pop(convo_id)
+        shard.bytes -= convo["bytes"]
+        self.evicted_conversations += 1
+        self.version_counter += 1
+
+    def _evict(self, shard: _Shard, now: float):
+        # oldest entries sit at the front, so eviction stops at the first live one
+        while shard.convs:
+            oldest_id, oldest = next(iter(shard.convs.items()))
+            if len(shard.convs) > self.max_per_shard or self._expired(oldest, now):
+                self._drop(shard, oldest_id)
+            else:
+                break
+
+    def _live(self, convo_id: str) -> Optional[Dict[str, Any]]:
+        shard = self._shard(convo_id)
+        convo = shard.convs.get(convo_id)
+        if convo is None or self._expired(convo, time.monotonic()):
+            return None
+        return convo
+
+    @staticmethod
+    def _summary(convo: Dict[str, Any]) -> Dict[str, Any]:
+        summary = {
+            "id": convo["id"],
+            "title": convo["title"],
+            "createdAt": convo["createdAt"],
+            "createdBy": convo["createdBy"],
+            "updatedAt": convo["updatedAt"],
+            "messageCount": len(convo["messages"]),
+        }
+        summary["cursor"] = conversation_cursor(summary)
+        return summary
+
+    # -------------------- public API --------------------
+    async def create(self, user: Optional[dict], title: Optional[str] = None,
+                     metadata: Optional[dict] = None) -> Dict[str, Any]:
+        cid = new_id()
+        ts = _now_ts()
+        convo = {
+            "id": cid,
+            "title": title or "Conversation",
+            "createdAt": ts,
+            "updatedAt": ts,
+            "createdBy": user.get("id") if user else "anonymous",
+            "metadata": metadata or {},
+            "messages": deque(maxlen=self.max_messages),  # { id, sender, text, ts }
+            "touched": time.monotonic(),
+            "bytes": _CONV_OVERHEAD_BYTES,
+            "seq": 0,
+        }
+        shard = self._shard(cid)
+        async with shard.lock:
+            self.version_counter += 1
+            shard.convs[cid] = convo
+            shard.bytes += convo["bytes"]
+            self._evict(shard, convo["touched"])
+        return {**self._summary(convo), "messages": []}
+
+    async def append(self, convo_id: str, sender: str, text: str) -> Optional[Dict[str, Any]]:
+        msgs = await self.append_many(convo_id, [(sender, text)])
+        return msgs[0] if msgs else None
+
+    async def append_many(self, convo_id: str, items: Iterable[Tuple[str, str]]) -> Optional[List[Dict[str, Any]]]:
+        shard = self._shard(convo_id)
+        async with shard.lock:
+            now = time.monotonic()
+            convo = shard.convs.get(convo_id)
+            if convo is None:
+                return None
+            if self._expired(convo, now):
+                self._drop(shard, convo_id)
+                return None
+
+            messages = convo["messages"]
+            added = []
+            for sender, text in items:
+                convo["seq"] += 1
+                msg = {"id": new_id(), "sender": sender, "text": text, "ts": _now_ts(),
+                       "seq": convo["seq"], "cursor": str(convo["seq"])}
+                if len(messages) == messages.maxlen:
+                    dropped = _message_bytes(messages[0])
+                    convo["bytes"] -= dropped
+                    shard.bytes -= dropped
+                    self.evicted_messages += 1
+                messages.append(msg)
+                size = _message_bytes(msg)
+                convo["bytes"] += size
+                shard.bytes += size
+                added.append(msg)
+
+            if added:
+                self.version_counter += 1
+                convo["touched"] = now
+                convo["updatedAt"] = added[-1]["ts"]
+                shard.convs.move_to_end(convo_id)
+            self._evict(shard, now)
+            return added
+
+    async def list(self, limit: int = 50, before: Optional[str] = None,
+                   after: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Most recently active first. No awaits inside, so no shard lock is needed."""
+        now = time.monotonic()
+        newest_first = (
+            (c for c in reversed(shard.convs.values()) if not self._expired(c, now))
+            for shard in self._shards
+        )
+        merged = heapq.merge(*newest_first, key=lambda c: c["touched"], reverse=True)
+        key = lambda c: (c["updatedAt"], c["id"])
+        if after:
+            # walk only the conversations newer than the cursor; keep the oldest `limit`
+            bound = parse_conversation_cursor(after)
+            page = list(takewhile(lambda c: key(c) > bound, merged))[-limit:]
+        else:
+            if before:
+                bound = parse_conversation_cursor(before)
+                merged = dropwhile(lambda c: key(c) >= bound, merged)
+            page = list(islice(merged, limit))
+        return [self._summary(c) for c in page]
+
+    async def messages(self, convo_id: str, limit: int = 100, before: Optional[str] = None,
+                       after: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        after_seq = _parse_seq_cursor(after) if after else None
+        before_seq = _parse_seq_cursor(before) if before else None
+        convo = self._live(convo_id)
+        if convo is None:
+            return None
+        messages = convo["messages"]
+        if not messages:
+            return []
+        first_seq = messages[0]["seq"]
+        # seqs are contiguous inside the deque, so a cursor maps straight to an index
+        if after_seq is not None:
+            start = max(0, after_seq + 1 - first_seq)
+            return list(islice(messages, start, start + limit))
+        end = len(messages) if before_seq is None else max(0, before_seq - first_seq)
+        return list(islice(messages, max(0, end - limit), end))
+
+    async def version(self, convo_id: Optional[str] = None):
+        """Change token: the conversation's last seq, or a store-wide counter."""
+        if convo_id is None:
+            return self.version_counter
+        convo = self._live(convo_id)
+        return None if convo is None else convo["seq"]
+
+    def stats(self) -> Dict[str, Any]:
+        conversations = sum(len(s.convs) for s in self._shards)
+        return {
+            "backend": "memory",
+            "shards": len(self._shards),
+            "conversations": conversations,
+            "messages": sum(len(c["messages"]) for s in self._shards for c in s.convs.values()),
+            "approxBytes": sum(s.bytes for s in self._shards),
+            "maxConversations": self.max_per_shard * len(self._shards),
+            "maxMessagesPerConversation": self.max_messages,
+            "ttlSeconds": self.ttl_seconds,
+            "evictedConversations": self.evicted_conversations,
+            "evictedMessages": self.evicted_messages,
+        }
+
+
+class SQLiteConversationStore:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id            TEXT PRIMARY KEY,
+            title         TEXT NOT NULL,
+            created_at    TEXT NOT NULL,
+            created_by    TEXT NOT NULL,
+            updated_at    TEXT NOT NULL,
+            metadata      TEXT NOT NULL DEFAULT '{}',
+            message_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at DESC);
+        CREATE TABLE IF NOT EXISTS messages (
+            seq             INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT NOT NULL,
+            id              TEXT NOT NULL,
+            sender          TEXT NOT NULL,
+            text            TEXT NOT NULL,
+            ts              TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS messages_conversation_ts ON messages (conversation_id, ts, seq);
+        CREATE INDEX IF NOT EXISTS messages_conversation_seq ON messages (conversation_id, seq);
+    """
+    SQL_INSERT_CONV = ("INSERT INTO conversations (id, title, created_at, created_by, updated_at, metadata) "
+                       "VALUES (?, ?, ?, ?, ?, ?)")
+    SQL_CONV_EXISTS = "SELECT 1 FROM conversations WHERE id = ?"
+    SQL_INSERT_MSG = "INSERT INTO messages (conversation_id, id, sender, text, ts) VALUES (?, ?, ?, ?, ?)"
+    SQL_TOUCH_CONV = ("UPDATE conversations SET message_count = message_count + ?, updated_at = ? "
+                      "WHERE id = ?")
+    _CONV_COLUMNS = "SELECT id, title, created_at, created_by, updated_at, message_count FROM conversations "
+    SQL_LIST = _CONV_COLUMNS + "ORDER BY updated_at DESC, id DESC LIMIT ?"
+    SQL_LIST_BEFORE = _CONV_COLUMNS + "WHERE (updated_at, id) < (?, ?) ORDER BY updated_at DESC, id DESC LIMIT ?"
+    SQL_LIST_AFTER = _CONV_COLUMNS + "WHERE (updated_at, id) > (?, ?) ORDER BY updated_at ASC, id ASC LIMIT ?"
+    _MSG_COLUMNS = "SELECT id, sender, text, ts, seq FROM messages WHERE conversation_id = ? "
+    SQL_MESSAGES_TAIL = _MSG_COLUMNS + "ORDER BY seq DESC LIMIT ?"
+    SQL_MESSAGES_BEFORE = _MSG_COLUMNS + "AND seq < ? ORDER BY seq DESC LIMIT ?"
+    SQL_MESSAGES_AFTER = _MSG_COLUMNS + "AND seq > ? ORDER BY seq ASC LIMIT ?"
+    SQL_LAST_SEQS = "SELECT seq FROM messages WHERE conversation_id = ? ORDER BY seq DESC LIMIT ?"
+    SQL_VERSION = "SELECT message_count, updated_at FROM conversations WHERE id = ?"
+    SQL_STORE_VERSION = "SELECT COUNT(*), MAX(updated_at) FROM conversations"
+    SQL_COUNTS = "SELECT COUNT(*), COALESCE(SUM(message_count), 0) FROM conversations"
+    # stats() serves cached counts; older than this, it recounts on a worker thread
+    STATS_MAX_AGE_S = 30.0
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = str(path)
+        self.busy_timeout_ms = busy_timeout_ms
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._conns: List[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        self._conn().executescript(self.SCHEMA)
+        self._counts_lock = threading.Lock()
+        self._counts_task = None
+        self._recount()
+
+    # -------------------- internals (run in executor threads) --------------------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000,
+                                   isolation_level=None, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def _create(self, user: Optional[dict], title: Optional[str], metadata: Optional[dict]) -> Dict[str, Any]:
+        cid = new_id()
+        ts = _now_ts()
+        created_by = user.get("id") if user else "anonymous"
+        title = title or "Conversation"
+        self._conn().execute(self.SQL_INSERT_CONV, (cid, title, ts, created_by, ts, json.dumps(metadata or {})))
+        self._add_counts(1, 0)
+        return {"id": cid, "title": title, "createdAt": ts, "createdBy": created_by,
+                "updatedAt": ts, "messageCount": 0, "messages": []}
+
+    def _append_many(self, convo_id: str, items: List[Tuple[str, str]]) -> Optional[List[Dict[str, Any]]]:
+        conn = self._conn()
+        msgs = [{"id": new_id(), "sender": sender, "text": text, "ts": _now_ts()} for sender, text in items]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute(self.SQL_CONV_EXISTS, (convo_id,)).fetchone() is None:
+                conn.execute("ROLLBACK")
+                return None
+            conn.executemany(self.SQL_INSERT_MSG, [(convo_id, m["id"], m["sender"], m["text"], m["ts"]) for m in msgs])
+            if msgs:
+                conn.execute(self.SQL_TOUCH_CONV, (len(msgs), msgs[-1]["ts"], convo_id))
+                # still inside the write transaction, so the newest seqs are ours
+                seqs = [r[0] for r in conn.execute(self.SQL_LAST_SEQS, (convo_id, len(msgs))).fetchall()][::-1]
+                for m, seq in zip(msgs, seqs):
+                    m["seq"], m["cursor"] = seq, str(seq)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._add_counts(0, len(msgs))
+        return msgs
+
+    def _list(self, limit: int, before: Optional[str], after: Optional[str]) -> List[Dict[str, Any]]:
+        conn = self._conn()
+        if after:
+            rows = conn.execute(self.SQL_LIST_AFTER, (*parse_conversation_cursor(after), limit)).fetchall()[::-1]
+        elif before:
+            rows = conn.execute(self.SQL_LIST_BEFORE, (*parse_conversation_cursor(before), limit)).fetchall()
+        else:
+            rows = conn.execute(self.SQL_LIST, (limit,)).fetchall()
+        page = []
+        for r in rows:
+            summary = {"id": r[0], "title": r[1], "createdAt": r[2], "createdBy": r[3],
+                       "updatedAt": r[4], "messageCount": r[5]}
+            summary["cursor"] = conversation_cursor(summary)
+            page.append(summary)
+        return page
+
+    def _messages(self, convo_id: str, limit: int, before: Optional[str],
+                  after: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        conn = self._conn()
+        if after:
+            rows = conn.execute(self.SQL_MESSAGES_AFTER, (convo_id, _parse_seq_cursor(after), limit)).fetchall()
+        elif before:
+            rows = conn.execute(self.SQL_MESSAGES_BEFORE, (convo_id, _parse_seq_cursor(before), limit)).fetchall()[::-1]
+        else:
+            rows = conn.execute(self.SQL_MESSAGES_TAIL, (convo_id, limit)).fetchall()[::-1]
+        if not rows and conn.execute(self.SQL_CONV_EXISTS, (convo_id,)).fetchone() is None:
+            return None
+        return [{"id": r[0], "sender": r[1], "text": r[2], "ts": r[3], "seq": r[4], "cursor": str(r[4])}
+                for r in rows]
+
+    def _version(self, convo_id: Optional[str]):
+        conn = self._conn()
+        if convo_id is None:
+            return tuple(conn.execute(self.SQL_STORE_VERSION).fetchone())
+        row = conn.execute(self.SQL_VERSION, (convo_id,)).fetchone()
+        return None if row is None else tuple(row)
+
+    def _recount(self):
+        # a full scan of conversations; other workers write the same file, so this is the only exact count
+        conversations, messages = self._conn().execute(self.SQL_COUNTS).fetchone()
+        with self._counts_lock:
+            self._conversations, self._messages = conversations, messages
+            self._counted_at = time.monotonic()
+
+    def _add_counts(self, conversations: int, messages: int):
+        with self._counts_lock:
+            self._conversations += conversations
+            self._messages += messages
+
+    async def _recount_async(self):
+        try:
+            await asyncio.to_thread(self._recount)
+        finally:
+            self._counts_task = None
+
+    # -------------------- public API --------------------
+    async def create(self, user: Optional[dict], title: Optional[str] = None,
+                     metadata: Optional[dict] = None) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._create, user, title, metadata)
+
+    async def append(self, convo_id: str, sender: str, text: str) -> Optional[Dict[str, Any]]:
+        msgs = await self.append_many(convo_id, [(sender, text)])
+        return msgs[0] if msgs else None
+
+    async def append_many(self, convo_id: str, items: Iterable[Tuple[str, str]]) -> Optional[List[Dict[str, Any]]]:
+        return await asyncio.to_thread(self._append_many, convo_id, list(items))
+
+    async def list(self, limit: int = 50, before: Optional[str] = None,
+                   after: Optional[str] = None) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._list, limit, before, after)
+
+    async def messages(self, convo_id: str, limit: int = 100, before: Optional[str] = None,
+                       after: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        return await asyncio.to_thread(self._messages, convo_id, limit, before, after)
+
+    async def version(self, convo_id: Optional[str] = None):
+        return await asyncio.to_thread(self._version, convo_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Never queries on the caller's thread: /metrics, /healthz and /admin/memory call it on the loop."""
+        with self._counts_lock:
+            conversations, messages, age = self._conversations, self._messages, time.monotonic() - self._counted_at
+        if age > self.STATS_MAX_AGE_S and self._counts_task is None:
+            try:
+                self._counts_task = asyncio.get_running_loop().create_task(self._recount_async())
+            except RuntimeError:
+                pass  # no loop (CLI use): keep the cached counts
+        size = sum(os.path.getsize(p) for p in (self.path, self.path + "-wal") if os.path.exists(p))
+        return {"backend": "sqlite", "path": self.path, "conversations": conversations,
+                "messages": messages, "countedAgoS": round(age, 1), "fileBytes": size}
+
+    def close(self):
+        with self._conns_lock:
+            for conn in self._conns:
+                try:
+                    conn.close()
+                except sqlite3.ProgrammingError:
+                    pass  # owned by another thread; released with the process
+            self._conns.clear()
@@ -0,0 +1,204 @@
+"""
+Per-conversation dialogue state for the chatbot.
+
+Each conversation remembers the last resolved patient and admission, the
+last intent/entity, and the Mongo results it fetched recently, so that:
+- pronoun follow-ups ("and his prescriptions?") reuse the patient without
+  running NER again,
+- a helper already called with the same arguments (or prefetched) is not
+  queried again while its result is fresh,
+- likely next reads (admissions/labs after patient_info) can be started in
+  the background while the LLM is writing the current answer.
+
+Bounded: at most `max_conversations` states (LRU), each idle for at most
+`ttl_seconds`, each holding at most `max_records` results of age up to
+`record_ttl`. All access happens on the event loop with no awaits between
+read and write, so no lock is needed.
+"""
+
+import re
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import metrics
+
+# ---------------------------- Logging Setup ----------------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+if not logger.handlers:
+    handler = logging.FileHandler("logs/chatbot.log", encoding="utf-8")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+# ---------------------------- Follow-up Detection ----------------------------
+
+_PRONOUN = re.compile(
+    r"\b(?:he|she|him|his|her|hers|they|them|their|this patient|that patient|the patient|same patient)\b",
+    re.IGNORECASE,
+)
+# elliptical follow-ups: "and the labs?", "what about prescriptions"
+_ELLIPSIS = re.compile(r"^\s*(?:and|also|what about|how about|then)\b", re.IGNORECASE)
+
+_PATIENT_ID = re.compile(r"\bP\d+\b", re.IGNORECASE)
+
+def _names_someone(text: str) -> bool:
+    """A capitalised word after the first (e.g. "Ravi's") or a patient ID: let NER handle it."""
+    words = [w.strip("?.,!;:'\"") for w in text.split()[1:]]
+    return bool(_PATIENT_ID.search(text)) or any(
+        w[:1].isupper() and not w.isupper() and w.replace("'s", "").isalpha() for w in words)
+
+def is_follow_up(text: str) -> bool:
+    return bool(_PRONOUN.search(text) or _ELLIPSIS.match(text)) and not _names_someone(text)
+
+# ---------------------------- Metrics ----------------------------
+
+RECORD_LOOKUPS = metrics.REGISTRY.counter(
+    "chatbot_dialogue_record_lookups_total",
+    "Mongo helper calls through dialogue state, by result (hit, prefetched, miss).",
+    ("result",),
+)
+FOLLOW_UPS = metrics.REGISTRY.counter(
+    "chatbot_dialogue_follow_ups_total",
+    "Follow-up questions answered with the conversation's remembered patient.",
+)
+
+# ---------------------------- State ----------------------------
+
+class DialogueState:
+    __slots__ = ("patient_id", "patient_name", "admission_id", "last_intent", "last_entity",
+                 "records", "touched", "turns", "_store")
+
+    def __init__(self, store: "DialogueStore"):
+        self.patient_id: Optional[str] = None
+        self.patient_name: Optional[str] = None
+        self.admission_id: Optional[str] = None
+        self.last_intent: Optional[str] = None
+        self.last_entity: Optional[str] = None
+        # (helper, args) -> (fetched_at, future, prefetched), oldest first
+        self.records: "OrderedDict[Tuple[str, tuple], Tuple[float, asyncio.Future, bool]]" = OrderedDict()
+        self.touched = time.monotonic()
+        self.turns = 0
+        self._store = store
+
+    def follow_up_entity(self, text: str) -> Optional[str]:
+        """The remembered patient, if `text` refers back to them."""
+        if (self.patient_name or self.patient_id) and is_follow_up(text):
+            FOLLOW_UPS.inc()
+            return self.patient_name or self.patient_id
+        return None
+
+    def note_patient(self, patient_id: Optional[str], name: Optional[str] = None):
+        if not patient_id:
+            return
+        if patient_id != self.patient_id:
+            self.admission_id = None
+            self.patient_name = name
+        elif name:
+            self.patient_name = name
+        self.patient_id = patient_id
+
+    def note_turn(self, intent: str, entity: Optional[str]):
+        self.last_intent = intent
+        self.last_entity = entity
+        self.turns += 1
+
+    # --- record cache ---
+    def _fresh(self, key) -> Optional[Tuple[float, asyncio.Future, bool]]:
+        entry = self.records.get(key)
+        if entry is None:
+            return None
+        fetched_at, future, _ = entry
+        failed = future.done() and (future.cancelled() or future.exception() is not None)
+        if failed or time.monotonic() - fetched_at > self._store.record_ttl:
+            del self.records[key]
+            return None
+        return entry
+
+    def _start(self, key, fetch: Callable[[], Awaitable[Any]], prefetched: bool) -> asyncio.Future:
+        future = asyncio.ensure_future(fetch())
+        # a failed prefetch nobody awaits must not log "exception never retrieved"
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.records[key] = (time.monotonic(), future, prefetched)
+        while len(self.records) > self._store.max_records:
+            self.records.popitem(last=False)
+        return future
+
+    async def fetch(self, helper: str, args: tuple, fetch: Callable[[], Awaitable[Any]]):
+        """Result of helper(*args), reusing a fresh (or in-flight) earlier call."""
+        key = (helper, args)
+        entry = self._fresh(key)
+        if entry is not None:
+            RECORD_LOOKUPS.inc(result="prefetched" if entry[2] else "hit")
+            self.records.move_to_end(key)
+            return await asyncio.shield(entry[1])
+        RECORD_LOOKUPS.inc(result="miss")
+        return await asyncio.shield(self._start(key, fetch, prefetched=False))
+
+    def prefetch(self, helper: str, args: tuple, fetch: Callable[[], Awaitable[Any]]) -> bool:
+        """Starts helper(*args) in the background unless already cached or the prefetch budget is spent."""
+        key = (helper, args)
+        if self._fresh(key) is not None or not self._store.prefetch_allowed():
+            return False
+        logger.debug("[DIALOGUE] Prefetching %s%s", helper, args)
+        future = self._start(key, fetch, prefetched=True)
+        self._store.prefetching += 1
+        future.add_done_callback(self._store.prefetch_done)
+        return True
+
+
+class DialogueStore:
+    def __init__(self, max_conversations: int = 5000, ttl_seconds: float = 1800,
+                 max_records: int = 16, record_ttl: float = 120, max_prefetch: int = 32):
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self.max_records = max_records
+        self.record_ttl = record_ttl
+        self.max_prefetch = max_prefetch
+        self.prefetching = 0
+        self.evicted = 0
+        # extra veto for prefetching, e.g. "the /chat queue is not empty"
+        self.busy: Callable[[], bool] = lambda: False
+        self._states: "OrderedDict[str, DialogueState]" = OrderedDict()
+
+        metrics.REGISTRY.gauge("chatbot_dialogue_states", "Conversations with live dialogue state.",
+                               fn=lambda: len(self._states))
+
+    def _evict(self, now: float):
+        while self._states:
+            oldest = next(iter(self._states.values()))
+            if len(self._states) > self.max_conversations or now - oldest.touched > self.ttl_seconds:
+                self._states.popitem(last=False)
+                self.evicted += 1
+            else:
+                break
+
+    def get(self, convo_id: Optional[str]) -> Optional[DialogueState]:
+        """State for a conversation (created on first use); None without a conversation id."""
+        if not convo_id:
+            return None
+        now = time.monotonic()
+        state = self._states.get(convo_id)
+        if state is None or now - state.touched > self.ttl_seconds:
+            state = self._states[convo_id] = DialogueState(self)
+        state.touched = now
+        self._states.move_to_end(convo_id)
+        self._evict(now)
+        return state
+
+    def prefetch_allowed(self) -> bool:
+        return self.prefetching < self.max_prefetch and not self.busy()
+
+    def prefetch_done(self, _future):
+        self.prefetching -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "conversations": len(self._states),
+            "maxConversations": self.max_conversations,
+            "records": sum(len(s.records) for s in self._states.values()),
+            "prefetching": self.prefetching,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,200 @@
+"""
+Precomputed appointment digests for today and tomorrow.
+
+"Appointments today" is the most common question at shift start, so instead
+of querying and summarising per message, a background task materializes a
+digest per day: counts by status, appointments grouped by department and
+doctor, and a pre-rendered answer. Digests are rebuilt on a schedule and,
+when change streams are available, shortly after any appointment change.
+Reads are a dict lookup; a miss (cold start, day rollover) returns None
+and the caller falls back to the live query.
+"""
+
+import time
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo.errors import PyMongoError, OperationFailure
+
+import mongo
+import metrics
+from config import DIGEST_REFRESH_INTERVAL, DIGEST_DEBOUNCE_MS
+
+# -------------------- Logging Setup --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+if not logger.handlers:
+    handler = logging.FileHandler("logs/chatbot.log", encoding="utf-8")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+DIGEST_LOOKUPS = metrics.REGISTRY.counter(
+    "chatbot_appointment_digest_lookups_total",
+    "Appointment digest lookups by result (hit, miss).",
+    ("result",),
+)
+
+MAX_DOCTORS_PER_DEPARTMENT = 8
+
+# -------------------- Building & Rendering --------------------
+
+def target_dates(now: Optional[datetime] = None) -> Dict[str, str]:
+    now = now or datetime.today()
+    return {
+        "today": now.strftime("%Y-%m-%d"),
+        "tomorrow": (now + timedelta(days=1)).strftime("%Y-%m-%d"),
+    }
+
+def build_digest(date_str: str, label: str, appointments: List[dict]) -> dict:
+    by_status = Counter((a.get("status") or "scheduled").lower() for a in appointments)
+    departments = defaultdict(lambda: defaultdict(list))
+    for a in appointments:
+        departments[a.get("department") or "Unassigned"][a.get("doctor") or "Unassigned"].append({
+            "time": a.get("time"),
+            "patient_id": a.get("patient_id"),
+            "patient_name": a.get("patient_name"),
+            "reason": a.get("reason"),
+            "status": a.get("status"),
+        })
+
+    grouped = []
+    for dept, doctors in sorted(departments.items(), key=lambda kv: -sum(len(v) for v in kv[1].values())):
+        docs = []
+        for doctor, slots in sorted(doctors.items(), key=lambda kv: -len(kv[1])):
+            slots.sort(key=lambda s: s["time"] or "")
+            docs.append({"doctor": doctor, "count": len(slots), "first": slots[0]["time"], "appointments": slots})
+        grouped.append({"department": dept, "count": sum(d["count"] for d in docs), "doctors": docs})
+
+    digest = {
+        "date": date_str,
+        "label": label,
+        "total": len(appointments),
+        "byStatus": dict(by_status),
+        "departments": grouped,
+        "generatedAt": datetime.utcnow().isoformat(timespec="seconds"),
+    }
+    digest["answer"] = render_answer(digest)
+    return digest
+
+def render_answer(digest: dict) -> str:
+    label, date_str = digest["label"], digest["date"]
+    if not digest["total"]:
+        return f"📅 No appointments are scheduled for {label} ({date_str})."
+
+    status = ", ".join(f"{n} {s}" for s, n in sorted(digest["byStatus"].items(), key=lambda kv: -kv[1]))
+    lines = [f"📅 Appointments for {label} ({date_str}): {digest['total']} total — {status}.", "", "By department:"]
+    for dept in digest["departments"]:
+        doctors = dept["doctors"][:MAX_DOCTORS_PER_DEPARTMENT]
+        shown = "; ".join(f"{d['doctor']} — {d['count']} (from {d['first'] or 'n/a'})" for d in doctors)
+        more = len(dept["doctors"]) - len(doctors)
+        lines.append(f"• {dept['department']} ({dept['count']}): {shown}" + (f"; +{more} more" if more > 0 else ""))
+    return "\n".join(lines)
+
+# -------------------- Background Materializer --------------------
+
+class AppointmentDigests:
+    def __init__(self, refresh_interval: float = DIGEST_REFRESH_INTERVAL, debounce: float = DIGEST_DEBOUNCE_MS / 1000):
+        self.refresh_interval = refresh_interval
+        self.debounce = debounce
+        self.refreshes = 0
+        self.change_events = 0
+        self.last_refresh_ms = None
+        self.mode = "schedule"
+        self._digests: Dict[str, dict] = {}
+        self._dirty = asyncio.Event()
+        self._tasks = []
+
+    # --- reads ---
+    def get(self, date_str: str, label: str) -> Optional[dict]:
+        digest = self._digests.get(date_str)
+        # after midnight yesterday's "tomorrow" digest is today's; its wording is stale
+        if digest is None or digest["label"] != label:
+            DIGEST_LOOKUPS.inc(result="miss")
+            self._dirty.set()
+            return None
+        DIGEST_LOOKUPS.inc(result="hit")
+        return digest
+
+    def answer(self, date_str: str, label: str) -> Optional[str]:
+        digest = self.get(date_str, label)
+        return digest["answer"] if digest else None
+
+    # --- refresh ---
+    async def refresh(self):
+        t0 = time.perf_counter()
+        fresh = {}
+        for label, date_str in target_dates().items():
+            appointments = [doc async for doc in mongo.iter_records(
+                "appointments", {"date": date_str}, mongo.PROJECTIONS["appointments"])]
+            fresh[date_str] = build_digest(date_str, label, appointments)
+        self._digests = fresh  # swap in one step; readers never see a half-built set
+        self.refreshes += 1
+        self.last_refresh_ms = round((time.perf_counter() - t0) * 1000, 2)
+        logger.debug("[DIGEST] Refreshed %s in %sms", {d: v["total"] for d, v in fresh.items()}, self.last_refresh_ms)
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._dirty.wait(), timeout=self.refresh_interval)
+                # let a burst of edits (e.g. a rescheduled clinic) settle into one rebuild
+                await asyncio.sleep(self.debounce)
+            except asyncio.TimeoutError:
+                pass
+            self._dirty.clear()
+            try:
+                await self.refresh()
+            except PyMongoError as e:
+                logger.warning("[DIGEST] Refresh failed: %s", e)
+            except Exception as e:
+                # e.g. a malformed appointment document; keep the schedule alive
+                logger.exception("[DIGEST] Refresh failed unexpectedly: %s", e)
+
+    async def _watch(self):
+        db = mongo.get_db()
+        while True:
+            try:
+                async with db.appointments.watch(full_document="updateLookup") as stream:
+                    self.mode = "change_stream"
+                    logger.debug("[DIGEST] Change stream open on appointments")
+                    async for change in stream:
+                        date_str = (change.get("fullDocument") or {}).get("date")
+                        # the post-image only has the new date: an update or replace may have moved the
+                        # appointment off a digest day, and deletes carry no document. Only an insert for
+                        # a day without a digest can be skipped.
+                        if change.get("operationType") != "insert" or date_str is None or date_str in self._digests:
+                            self.change_events += 1
+                            self._dirty.set()
+            except OperationFailure as e:
+                # standalone mongod: scheduled refresh only
+                logger.info("[DIGEST] Change streams unavailable (%s); refreshing every %ss.", e, self.refresh_interval)
+                self.mode = "schedule"
+                return
+            except PyMongoError as e:
+                logger.warning("[DIGEST] Change stream dropped: %s", e)
+                self._dirty.set()
+                await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._refresh_loop()), asyncio.create_task(self._watch())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "dates": {d: {"label": v["label"], "total": v["total"], "generatedAt": v["generatedAt"]}
+                      for d, v in self._digests.items()},
+            "refreshes": self.refreshes,
+            "changeEvents": self.change_events,
+            "lastRefreshMs": self.last_refresh_ms,
+            "refreshIntervalS": self.refresh_interval,
+        }
@@ -0,0 +1,58 @@
+"""
+Fast JSON encoding for API responses.
+
+Uses orjson when installed (native datetime/UUID/dataclass support, several
+times faster than the stdlib) and falls back to json with a default hook.
+Both paths encode ObjectId, date/datetime, Decimal and sets the same way,
+so Mongo documents can be returned without a jsonable_encoder pass.
+
+Return FastJSONResponse(...) directly from hot endpoints: FastAPI only skips
+its own (slow) jsonable_encoder walk when the handler returns a Response.
+"""
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+# ---------------------------- Encoding ----------------------------
+
+def _default(obj: Any):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8", "replace")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+if orjson is not None:
+    _ORJSON_OPTS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTS)
+else:
+    def dumps(content: Any) -> bytes:
+        return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+# ---------------------------- Response Class ----------------------------
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,246 @@
+"""
+Declared MongoDB index spec for the chatbot collections.
+- ensure_indexes(): applies INDEX_SPEC idempotently (CLI --apply; in the background at startup with ENSURE_INDEXES=1)
+- check_query_plans(): runs explain() on every helper query in mongo.py and fails on COLLSCAN
+  (or on an in-memory SORT for the _id-paged helpers)
+
+CLI (run from Server/Bot):
+    python indexes.py --apply
+    python indexes.py --check
+"""
+
+import sys
+import asyncio
+import inspect
+import logging
+import argparse
+from datetime import datetime
+from bson import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+# -------------------- Logging Setup --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+if not logger.handlers:
+    handler = logging.FileHandler("logs/chatbot.log", encoding="utf-8")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+# -------------------- Index Spec --------------------
+# Every filter used by a mongo.py helper must be served by one of these.
+# The sparse updatedAt_1 indexes serve the patient_summaries delta poll
+# (summaries.py) when change streams are unavailable.
+INDEX_SPEC = {
+    "patients": [
+        IndexModel([("name", ASCENDING)], name="name_1"),
+        IndexModel([("patient_id", ASCENDING)], name="patient_id_1"),
+        # Node Patient documents (Server/Models/Patient.js), for get_vitals_patient_ref
+        IndexModel([("firstName", ASCENDING)], name="firstName_1"),
+        IndexModel([("updatedAt", ASCENDING)], name="updatedAt_1", sparse=True),
+    ],
+    # Paged helpers sort on _id, so each filter key is compounded with _id
+    # to avoid an in-memory SORT stage.
+    "admissions": [
+        IndexModel([("patient_id", ASCENDING), ("_id", ASCENDING)], name="patient_id_1__id_1"),
+        IndexModel([("admission_id", ASCENDING), ("_id", ASCENDING)], name="admission_id_1__id_1"),
+        IndexModel([("dischtime", ASCENDING), ("_id", ASCENDING)], name="dischtime_1__id_1"),
+        IndexModel([("updatedAt", ASCENDING)], name="updatedAt_1", sparse=True),
+    ],
+    "prescriptions": [
+        IndexModel([("patient_id", ASCENDING), ("_id", ASCENDING)], name="patient_id_1__id_1"),
+        IndexModel([("admission_id", ASCENDING), ("_id", ASCENDING)], name="admission_id_1__id_1"),
+        IndexModel([("updatedAt", ASCENDING)], name="updatedAt_1", sparse=True),
+    ],
+    "diagnosis_icd": [
+        IndexModel([("patient_id", ASCENDING), ("_id", ASCENDING)], name="patient_id_1__id_1"),
+        IndexModel([("admission_id", ASCENDING), ("_id", ASCENDING)], name="admission_id_1__id_1"),
+        IndexModel([("updatedAt", ASCENDING)], name="updatedAt_1", sparse=True),
+    ],
+    "application": [
+        IndexModel([("patient_id", ASCENDING), ("_id", ASCENDING)], name="patient_id_1__id_1"),
+        IndexModel([("updatedAt", ASCENDING)], name="updatedAt_1", sparse=True),
+    ],
+    "noteevents": [
+        IndexModel([("patient_id", ASCENDING), ("_id", ASCENDING)], name="patient_id_1__id_1"),
+        IndexModel([("admission_id", ASCENDING), ("_id", ASCENDING)], name="admission_id_1__id_1"),
+        IndexModel([("updatedAt", ASCENDING)], name="updatedAt_1", sparse=True),
+    ],
+    "appointments": [
+        IndexModel([("date", ASCENDING), ("_id", ASCENDING)], name="date_1__id_1"),
+    ],
+    # also declared by the Mongoose model (Server/Models/PatientVitals.js), under the same name
+    "patientvitals": [
+        IndexModel([("patientId", ASCENDING), ("recordedAt", DESCENDING)], name="patientId_1_recordedAt_-1"),
+    ],
+    "staff": [
+        IndexModel([("status", ASCENDING), ("_id", ASCENDING)], name="status_1__id_1"),
+    ],
+    # materialized view (summaries.py), looked up by name like `patients`
+    "patient_summaries": [
+        IndexModel([("name", ASCENDING)], name="name_1"),
+    ],
+    "conversations": [
+        IndexModel([("updatedAt", DESCENDING), ("_id", DESCENDING)], name="updatedAt_-1__id_-1"),
+    ],
+    "conversation_messages": [
+        IndexModel([("conversation_id", ASCENDING), ("ts", ASCENDING), ("_id", ASCENDING)],
+                   name="conversation_id_1_ts_1__id_1"),
+    ],
+}
+
+# -------------------- Helper Query Shapes --------------------
+# helper name -> [(collection, filter, sort)] with representative values.
+# A helper missing from this map fails the check, so new queries must be declared here.
+_BY_ID = [("_id", ASCENDING)]
+_NAME = {"name": {"$regex": "ravi", "$options": "i"}}
+
+HELPER_QUERIES = {
+    "get_patient_history": [
+        ("patients", _NAME, None),
+        ("admissions", {"patient_id": "P0001"}, _BY_ID),
+        ("prescriptions", {"patient_id": "P0001"}, _BY_ID),
+        ("diagnosis_icd", {"patient_id": "P0001"}, _BY_ID),
+        ("application", {"patient_id": "P0001"}, _BY_ID),
+        ("noteevents", {"patient_id": "P0001"}, _BY_ID),
+    ],
+    "get_patient_summary": [("patient_summaries", _NAME, None)],
+    "get_patient_ref": [("patients", _NAME, None)],
+    "get_patient_dob": [("patients", _NAME, None)],
+    "get_patient_contact": [("patients", _NAME, None)],
+    "get_todays_appointments": [("appointments", {"date": "2024-01-01"}, _BY_ID)],
+    "get_appointments_on_date": [("appointments", {"date": "2024-01-01"}, _BY_ID)],
+    "get_appointments_in_range": [
+        ("appointments", {"date": {"$gte": "2024-01-01", "$lt": "2024-01-08"}}, [("date", ASCENDING), ("_id", ASCENDING)]),
+    ],
+    "get_all_staff": [("staff", {"status": "active"}, _BY_ID)],
+    "get_admissions_for_patient": [("admissions", {"patient_id": "P0001"}, _BY_ID)],
+    "get_prescriptions_for_patient": [("prescriptions", {"patient_id": "P0001"}, _BY_ID)],
+    "get_lab_applications_for_patient": [("application", {"patient_id": "P0001"}, _BY_ID)],
+    "get_lab_items_list": [("d_labitems", {}, _BY_ID)],
+    "get_diagnosis_for_admission": [("diagnosis_icd", {"admission_id": "A0001"}, _BY_ID)],
+    "get_prescriptions_for_admission": [("prescriptions", {"admission_id": "A0001"}, _BY_ID)],
+    "get_notes_for_admission": [("noteevents", {"admission_id": "A0001"}, _BY_ID)],
+    "get_notes_by_ids": [("noteevents", {"_id": {"$in": [ObjectId("000000000000000000000000")]}}, None)],
+    # occupancy.py load/reconcile scan
+    "iter_current_admissions": [("admissions", {"dischtime": None}, _BY_ID)],
+    "get_vitals_patient_ref": [("patients", {"firstName": {"$regex": "^ravi", "$options": "i"}}, None)],
+    "get_latest_vital": [
+        ("patientvitals", {"patientId": "P0001", "oxygenSaturation": {"$type": "number"}}, [("recordedAt", DESCENDING)]),
+    ],
+    "get_vitals_series": [
+        ("patientvitals", {"patientId": "P0001", "oxygenSaturation": {"$type": "number"},
+                           "recordedAt": {"$gte": datetime(2024, 1, 1), "$lte": datetime(2024, 1, 15)}},
+         [("recordedAt", ASCENDING)]),
+    ],
+    "list_conversations": [("conversations", {}, [("updatedAt", DESCENDING), ("_id", DESCENDING)])],
+    "get_conversation_messages": [
+        ("conversation_messages", {"conversation_id": "cid_0"}, [("ts", ASCENDING), ("_id", ASCENDING)]),
+    ],
+}
+
+# Helpers that intentionally read a whole (small) reference collection.
+ALLOWED_COLLSCANS = set()
+
+
+# -------------------- Apply --------------------
+async def ensure_indexes(db) -> dict:
+    """
+    Creates every index in INDEX_SPEC. Safe to call repeatedly: existing
+    indexes with the same name and keys are a no-op on the server.
+    """
+    created = {}
+    for collection, models in INDEX_SPEC.items():
+        try:
+            names = await db[collection].create_indexes(models)
+            created[collection] = names
+            logger.debug("[INDEX] %s -> %s", collection, names)
+        except PyMongoError as e:
+            logger.error("[INDEX] Failed to apply indexes on %s: %s", collection, e)
+            created[collection] = {"error": str(e)}
+    return created
+
+
+# -------------------- Check --------------------
+def _plan_stages(plan) -> list:
+    """Collects every `stage` value in an explain() plan tree."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for val in plan.values():
+            stages.extend(_plan_stages(val))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def _helper_names(module) -> set:
+    return {
+        name for name, fn in inspect.getmembers(module, inspect.iscoroutinefunction)
+        if name.startswith("get_")
+    }
+
+
+async def check_query_plans(db, module=None) -> list:
+    """
+    Runs explain() for every declared helper query.
+    Returns a list of failure strings (empty list == all queries use an index
+    and need no in-memory sort).
+    """
+    failures = []
+
+    if module is not None:
+        for name in sorted(_helper_names(module) - set(HELPER_QUERIES)):
+            failures.append(f"{name}: helper has no declared query shape in HELPER_QUERIES")
+
+    for helper, queries in HELPER_QUERIES.items():
+        for collection, query, sort in queries:
+            cursor = db[collection].find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            try:
+                explain = await cursor.explain()
+            except PyMongoError as e:
+                failures.append(f"{helper}: explain on {collection} failed: {e}")
+                continue
+
+            stages = _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+            logger.debug("[INDEX] %s %s %s -> %s", helper, collection, query, stages)
+            if "COLLSCAN" in stages and helper not in ALLOWED_COLLSCANS:
+                failures.append(f"{helper}: COLLSCAN on {collection} for filter {query}")
+            if "SORT" in stages:
+                failures.append(f"{helper}: in-memory SORT on {collection} for filter {query}")
+    return failures
+
+
+# -------------------- CLI --------------------
+async def _main(args) -> int:
+    import mongo
+
+    db = mongo.get_db()
+    if args.apply:
+        result = await ensure_indexes(db)
+        for collection, names in result.items():
+            print(f"{collection}: {names}")
+
+    if args.check:
+        failures = await check_query_plans(db, mongo)
+        if failures:
+            for failure in failures:
+                print(f"[FAIL] {failure}")
+            return 1
+        print("[OK] All helper queries are served by an index.")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply or verify chatbot MongoDB indexes.")
+    parser.add_argument("--apply", action="store_true", help="create indexes from INDEX_SPEC")
+    parser.add_argument("--check", action="store_true", help="fail if any helper query plans a COLLSCAN")
+    args = parser.parse_args()
+    if not (args.apply or args.check):
+        parser.error("pass --apply and/or --check")
+    sys.exit(asyncio.run(_main(args)))
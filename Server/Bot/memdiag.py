@@ -0,0 +1,252 @@
+"""
+Memory accounting behind /admin/memory: RSS and peak RSS, the sizes of the
+service's in-process caches and stores, tracemalloc's top allocators, and
+snapshot diffs between two points in time.
+
+Safe to leave reachable in production:
+- RSS and peak come from /proc/self/status (VmRSS / VmHWM), or getrusage
+  for the peak elsewhere. Store sizes come from each store's stats()
+  counters. Neither costs anything until asked for.
+- tracemalloc hooks every allocation: about 14x slower on a pure allocation
+  micro-benchmark with 1 frame, much less on real requests, plus memory for
+  the traces. So it is off until started, and it stops itself after a
+  bounded window (MEMDIAG_TRACE_MAX_S). It records 1 frame by default and
+  reports its own memory.
+- A snapshot always records RSS and store sizes. While tracing, it also
+  records tracemalloc's traces, filtered of tracemalloc's and importlib's
+  own frames. At most MEMDIAG_MAX_SNAPSHOTS are kept, oldest dropped, and
+  they outlive the tracing window so they can be diffed afterwards.
+  Taking and comparing snapshots is O(traces), so callers run it on a
+  worker thread. Store sizes are passed in by the caller, which reads
+  them on the event loop, where the stores are safe to read.
+
+A leak hunt: start tracing, take a snapshot, let traffic run, take another,
+then diff them. Growing store counters point at a cache; growing
+file:line entries point at the allocation site.
+"""
+
+import os
+import gc
+import sys
+import time
+import logging
+import threading
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+import metrics
+
+# ---------------------------- Logging Setup ----------------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+if not logger.handlers:
+    handler = logging.FileHandler("logs/chatbot.log", encoding="utf-8")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+MAX_SNAPSHOTS = int(os.getenv("MEMDIAG_MAX_SNAPSHOTS", "4"))
+TRACE_MAX_S = float(os.getenv("MEMDIAG_TRACE_MAX_S", "3600"))
+GROUPS = ("lineno", "filename", "traceback")
+
+_TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+def process_memory() -> dict:
+    rss = peak = None
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if peak is None:
+        try:
+            import resource
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            peak = maxrss if sys.platform == "darwin" else maxrss * 1024
+        except ImportError:
+            pass
+    return {"rssBytes": rss, "peakRssBytes": peak}
+
+RSS_BYTES = metrics.REGISTRY.gauge(
+    "chatbot_resident_memory_bytes",
+    "Resident set size of this worker process.",
+    fn=lambda: process_memory()["rssBytes"] or 0,
+)
+PEAK_RSS_BYTES = metrics.REGISTRY.gauge(
+    "chatbot_peak_resident_memory_bytes",
+    "Peak resident set size of this worker process.",
+    fn=lambda: process_memory()["peakRssBytes"] or 0,
+)
+
+# ---------------------------- Formatting ----------------------------
+
+_STDLIB = os.path.dirname(os.__file__) + os.sep
+
+def _short_path(path: str) -> str:
+    i = path.rfind("site-packages" + os.sep)
+    if i >= 0:
+        return path[i + len("site-packages") + 1:]
+    for prefix in (os.getcwd() + os.sep, _STDLIB):
+        if path.startswith(prefix):
+            return path[len(prefix):]
+    return path
+
+def _where(traceback, group: str) -> str:
+    if group == "filename":
+        return _short_path(traceback[0].filename)
+    return " <- ".join(f"{_short_path(f.filename)}:{f.lineno}" for f in traceback)
+
+def _numeric_diff(before, after) -> Optional[dict]:
+    """Changed numeric leaves of two stats() dicts, as {key: {before, after, change}}."""
+    if isinstance(before, dict) and isinstance(after, dict):
+        out = {}
+        for key in after:
+            if key in before:
+                sub = _numeric_diff(before[key], after[key])
+                if sub:
+                    out[key] = sub
+        return out or None
+    if isinstance(before, (int, float)) and isinstance(after, (int, float)) and not isinstance(after, bool):
+        if before != after:
+            return {"before": before, "after": after, "change": round(after - before, 3)}
+    return None
+
+# ---------------------------- Diagnostics ----------------------------
+
+class MemoryDiagnostics:
+    def __init__(self, max_snapshots: int = MAX_SNAPSHOTS, trace_max_s: float = TRACE_MAX_S):
+        self.max_snapshots = max(1, max_snapshots)
+        self.trace_max_s = trace_max_s
+        self.trace_until = None
+        self._snapshots = OrderedDict()
+        self._seq = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def tracing(self) -> dict:
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        current, peak = tracemalloc.get_traced_memory()
+        return {"tracing": True, "frames": tracemalloc.get_traceback_limit(), "tracedBytes": current,
+                "tracedPeakBytes": peak, "overheadBytes": tracemalloc.get_tracemalloc_memory(),
+                "stopsInS": round(self.trace_until - time.monotonic(), 1) if self.trace_until else None}
+
+    def start_tracing(self, seconds: float, frames: int = 1) -> dict:
+        if not 0 < seconds <= self.trace_max_s:
+            raise ValueError(f"seconds must be in (0, {self.trace_max_s:g}]")
+        if not 1 <= frames <= 25:
+            raise ValueError("frames must be in [1, 25]")
+        with self._lock:
+            if tracemalloc.is_tracing() and tracemalloc.get_traceback_limit() != frames:
+                tracemalloc.stop()
+            tracemalloc.start(frames)
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(seconds, self.stop_tracing)
+            self._timer.daemon = True
+            self._timer.start()
+            self.trace_until = time.monotonic() + seconds
+        logger.info("[MEMDIAG] tracemalloc started (frames=%d) for %.0fs", frames, seconds)
+        return self.tracing()
+
+    def stop_tracing(self) -> dict:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self.trace_until = None
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+                logger.info("[MEMDIAG] tracemalloc stopped")
+        return self.tracing()
+
+    def report(self, stores: Optional[dict] = None, top: int = 20, group: str = "lineno") -> dict:
+        if group not in GROUPS:
+            raise ValueError(f"group must be one of {', '.join(GROUPS)}")
+        out = {
+            "pid": os.getpid(),
+            "process": process_memory(),
+            "stores": stores or {},
+            "gc": {"counts": gc.get_count(), "collections": [s["collections"] for s in gc.get_stats()],
+                   "uncollectable": len(gc.garbage)},
+            "tracemalloc": self.tracing(),
+            "snapshots": self.snapshots(),
+        }
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+            out["tracemalloc"]["top"] = [
+                {"where": _where(s.traceback, group), "sizeBytes": s.size, "count": s.count}
+                for s in snapshot.statistics(group)[:top]
+            ]
+        return out
+
+    def take_snapshot(self, stores: Optional[dict] = None) -> dict:
+        traces = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS) if tracemalloc.is_tracing() else None
+        snapshot = {
+            "takenAt": datetime.utcnow().isoformat(),
+            "process": process_memory(),
+            "stores": stores or {},
+            "traces": traces,
+            "tracedBytes": sum(t.size for t in traces.traces) if traces is not None else None,
+        }
+        with self._lock:
+            self._seq += 1
+            snapshot["id"] = self._seq
+            self._snapshots[self._seq] = snapshot
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return self._describe(snapshot)
+
+    def _describe(self, snapshot: dict) -> dict:
+        return {"id": snapshot["id"], "takenAt": snapshot["takenAt"], "rssBytes": snapshot["process"]["rssBytes"],
+                "tracedBytes": snapshot["tracedBytes"]}
+
+    def snapshots(self) -> list:
+        with self._lock:
+            return [self._describe(s) for s in self._snapshots.values()]
+
+    def _get(self, snapshot_id: int) -> dict:
+        with self._lock:
+            snapshot = self._snapshots.get(snapshot_id)
+        if snapshot is None:
+            raise LookupError(f"no snapshot {snapshot_id}; kept: {list(self._snapshots)}")
+        return snapshot
+
+    def diff(self, base_id: int, target_id: Optional[int] = None, stores: Optional[dict] = None, top: int = 20,
+             group: str = "lineno") -> dict:
+        """Diffs two kept snapshots; without target_id, against a fresh snapshot of `stores`."""
+        if group not in GROUPS:
+            raise ValueError(f"group must be one of {', '.join(GROUPS)}")
+        base = self._get(base_id)
+        target = self._get(target_id) if target_id is not None else self._get(self.take_snapshot(stores)["id"])
+        process = {}
+        for key in ("rssBytes", "peakRssBytes"):
+            before, after = base["process"][key], target["process"][key]
+            if before is not None and after is not None:
+                process[key] = {"before": before, "after": after, "change": after - before}
+        out = {"base": self._describe(base), "target": self._describe(target), "process": process,
+               "stores": _numeric_diff(base["stores"], target["stores"]) or {}}
+        if base["traces"] is None or target["traces"] is None:
+            out["tracemalloc"] = None
+            out["note"] = "tracemalloc was off for one of the snapshots; only RSS and store sizes are compared"
+            return out
+        stats = target["traces"].compare_to(base["traces"], group)
+        out["tracemalloc"] = {
+            "sizeChangeBytes": sum(s.size_diff for s in stats),
+            "top": [{"where": _where(s.traceback, group), "sizeChangeBytes": s.size_diff, "sizeBytes": s.size,
+                     "countChange": s.count_diff, "count": s.count} for s in stats[:top]],
+        }
+        return out
+
+    def stats(self) -> dict:
+        return {**self.tracing(), "snapshots": len(self._snapshots)}
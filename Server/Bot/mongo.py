@@ -5,12 +5,38 @@ Handles patient records, appointments, staff queries, and field‑based lookups.
 
 import logging
 import asyncio
+import calendar
 import json
-from datetime import datetime
+import re
+import time
+import threading
+from collections import deque
+from datetime import datetime, timedelta
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo.errors import PyMongoError
-from config import MONGO_URI, MONGO_DB_NAME
+from pymongo import ASCENDING, DESCENDING, InsertOne, UpdateOne, monitoring
+from bson import ObjectId
+from pymongo.errors import PyMongoError, OperationFailure, BulkWriteError
+from config import (
+    MONGO_URI,
+    MONGO_DB_NAME,
+    MONGO_POOL_MAX,
+    MONGO_POOL_MIN,
+    MONGO_MAX_IDLE_TIME_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    CACHE_TTL_STAFF,
+    CACHE_TTL_LABITEMS,
+    CACHE_VERSION_POLL_INTERVAL,
+    SUMMARY_MAX_AGE_S,
+    CONV_FLUSH_BATCH,
+    CONV_FLUSH_INTERVAL_MS,
+    CONV_MAX_PENDING,
+)
 from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
+import metrics
+from conversation_store import InvalidCursor, parse_conversation_cursor
 
 # -------------------- Logging Setup --------------------
 logger = logging.getLogger(__name__)
@@ -22,15 +48,144 @@ if not logger.handlers:
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
-# -------------------- Mongo Client Per Event Loop --------------------
-_clients = {}
+# -------------------- Pool Monitoring --------------------
+# pymongo calls listeners synchronously from its own threads, so counters
+# are guarded by a threading.Lock and kept O(1) per event.
+
+class PoolMonitor(monitoring.ConnectionPoolListener, monitoring.CommandListener):
+    SAMPLE_SIZE = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.max_in_use = 0
+        self.open_connections = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checkout_wait_ms = deque(maxlen=self.SAMPLE_SIZE)
+        self.command_ms = {}
+        self.command_failures = 0
+
+    # --- connection pool events ---
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_check_out_started(self, event): pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_ready(self, event): pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            duration = getattr(event, "duration", None)  # seconds, pymongo >= 4.7
+            if duration is not None:
+                self.checkout_wait_ms.append(duration * 1000)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+            duration = getattr(event, "duration", None)
+            if duration is not None:
+                self.checkout_wait_ms.append(duration * 1000)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    # --- command events ---
+    def started(self, event): pass
+
+    def succeeded(self, event):
+        with self._lock:
+            samples = self.command_ms.get(event.command_name)
+            if samples is None:
+                samples = self.command_ms[event.command_name] = deque(maxlen=self.SAMPLE_SIZE)
+            samples.append(event.duration_micros / 1000)
+        metrics.MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        with self._lock:
+            self.command_failures += 1
+
+    # --- reporting ---
+    @staticmethod
+    def _summary(samples) -> dict:
+        if not samples:
+            return {"count": 0}
+        ordered = sorted(samples)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+        return {"count": len(ordered), "p50": pick(0.50), "p99": pick(0.99), "max": round(ordered[-1], 3)}
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = list(self.checkout_wait_ms)
+            commands = {name: list(samples) for name, samples in self.command_ms.items()}
+            snapshot = {
+                "maxPoolSize": MONGO_POOL_MAX,
+                "inUse": self.in_use,
+                "maxInUse": self.max_in_use,
+                "openConnections": self.open_connections,
+                "checkouts": self.checkouts,
+                "checkoutFailures": self.checkout_failures,
+                "commandFailures": self.command_failures,
+            }
+        snapshot["checkoutWaitMs"] = self._summary(waits)
+        snapshot["commandLatencyMs"] = {name: self._summary(s) for name, s in commands.items()}
+        return snapshot
+
+
+pool_monitor = PoolMonitor()
+
+metrics.REGISTRY.gauge("chatbot_mongo_pool_in_use", "Checked-out MongoDB connections.",
+                       fn=lambda: pool_monitor.in_use)
+metrics.REGISTRY.gauge("chatbot_mongo_pool_open_connections", "Open MongoDB connections.",
+                       fn=lambda: pool_monitor.open_connections)
+
+# -------------------- Mongo Client Lifecycle --------------------
+# The FastAPI startup hook calls init_client() and the shutdown hook
+# close_client(). CLI tools get a client lazily on first get_db().
+_client = None
+
+def init_client() -> AsyncIOMotorClient:
+    global _client
+    if _client is None:
+        logger.debug("[MONGO] Initializing AsyncIOMotorClient (maxPoolSize=%d).", MONGO_POOL_MAX)
+        _client = AsyncIOMotorClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_POOL_MAX,
+            minPoolSize=MONGO_POOL_MIN,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+            waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            event_listeners=[pool_monitor],
+        )
+    return _client
+
+def close_client():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+        logger.debug("[MONGO] AsyncIOMotorClient closed.")
 
 def get_db():
-    loop = asyncio.get_event_loop()
-    if loop not in _clients:
-        logger.debug("[MONGO] Initializing AsyncIOMotorClient for current event loop.")
-        _clients[loop] = AsyncIOMotorClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-    return _clients[loop][MONGO_DB_NAME]
+    return init_client()[MONGO_DB_NAME]
+
+def pool_stats() -> dict:
+    return pool_monitor.stats()
 
 # -------------------- Retry Decorator --------------------
 retry_mongo = retry(
@@ -45,22 +200,117 @@ def log_data(label, data):
     logger.debug("[MONGO] %s -> %s", label, safe_data)
     print(f"[DEBUG] {label} → {safe_data}")
 
+# -------------------- Paging, Projections & Streaming --------------------
+# Helpers return one page ordered by _id. Pass the last _id of a page
+# (see next_page_after) as `after` to resume. The iter_* forms stream with
+# bounded memory. Helpers return whole documents unless the caller opts in
+# with a projection, e.g. projection=PROJECTIONS["notes"].
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_BATCH_SIZE = 50
+
+# Opt-in field sets for callers that read only these fields. The names are
+# MIMIC-style guesses, not taken from the Node models: a caller that reads
+# other fields must pass projection=None (the default) or its own set.
+PROJECTIONS = {
+    "patient": {"patient_id": 1, "name": 1, "dob": 1, "gender": 1, "contact": 1, "address": 1},
+    "admissions": {"patient_id": 1, "admission_id": 1, "admittime": 1, "dischtime": 1,
+                   "admission_type": 1, "admission_location": 1, "discharge_location": 1,
+                   "diagnosis": 1, "ward": 1, "status": 1},
+    "prescriptions": {"patient_id": 1, "admission_id": 1, "drug": 1, "dose_val_rx": 1,
+                      "dose_unit_rx": 1, "route": 1, "startdate": 1, "enddate": 1, "status": 1},
+    "diagnoses": {"patient_id": 1, "admission_id": 1, "seq_num": 1, "icd_code": 1,
+                  "icd9_code": 1, "long_title": 1, "description": 1},
+    "lab_applications": {"patient_id": 1, "admission_id": 1, "itemid": 1, "test_name": 1,
+                         "charttime": 1, "value": 1, "valuenum": 1, "valueuom": 1, "flag": 1, "status": 1},
+    "notes": {"patient_id": 1, "admission_id": 1, "chartdate": 1, "charttime": 1,
+              "category": 1, "description": 1, "text": 1},
+    "appointments": {"date": 1, "time": 1, "patient_id": 1, "patient_name": 1, "doctor": 1,
+                     "department": 1, "status": 1, "reason": 1},
+    "staff": {"name": 1, "role": 1, "designation": 1, "department": 1, "contact": 1, "shift": 1, "status": 1},
+    "lab_items": {"itemid": 1, "label": 1, "fluid": 1, "category": 1, "loinc_code": 1},
+}
+
+def _cursor_id(after):
+    """Accepts the string form of an ObjectId or a raw _id value."""
+    if isinstance(after, str) and ObjectId.is_valid(after):
+        return ObjectId(after)
+    return after
+
+def _paged_query(query: dict, after) -> dict:
+    if after is None:
+        return query
+    return {**query, "_id": {"$gt": _cursor_id(after)}}
+
+def next_page_after(docs: list, limit: int = DEFAULT_PAGE_SIZE):
+    """Cursor for the next page, or None when this page was the last."""
+    if not docs or len(docs) < limit:
+        return None
+    return str(docs[-1]["_id"])
+
+async def _find_page(collection: str, query: dict, projection=None, limit: int = DEFAULT_PAGE_SIZE,
+                     after=None, batch_size: int = DEFAULT_BATCH_SIZE) -> list:
+    db = get_db()
+    cursor = (
+        db[collection]
+        .find(_paged_query(query, after), projection)
+        .sort("_id", ASCENDING)
+        .limit(limit)
+        .batch_size(min(batch_size, limit))
+    )
+    return await cursor.to_list(length=limit)
+
+async def iter_records(collection: str, query: dict, projection=None, after=None,
+                       batch_size: int = DEFAULT_BATCH_SIZE):
+    """Async iterator over every matching document, fetched `batch_size` at a time."""
+    db = get_db()
+    cursor = (
+        db[collection]
+        .find(_paged_query(query, after), projection)
+        .sort("_id", ASCENDING)
+        .batch_size(batch_size)
+    )
+    async for doc in cursor:
+        yield doc
+
+def iter_notes_for_patient(pid: str, after=None, projection=None, batch_size: int = DEFAULT_BATCH_SIZE):
+    return iter_records("noteevents", {"patient_id": pid}, projection, after, batch_size)
+
+def iter_notes_for_admission(aid: str, after=None, projection=None, batch_size: int = DEFAULT_BATCH_SIZE):
+    return iter_records("noteevents", {"admission_id": aid}, projection, after, batch_size)
+
+def iter_prescriptions_for_patient(pid: str, after=None, projection=None, batch_size: int = DEFAULT_BATCH_SIZE):
+    return iter_records("prescriptions", {"patient_id": pid}, projection, after, batch_size)
+
+def iter_lab_applications_for_patient(pid: str, after=None, projection=None, batch_size: int = DEFAULT_BATCH_SIZE):
+    return iter_records("application", {"patient_id": pid}, projection, after, batch_size)
+
+def iter_current_admissions(projection=None, batch_size: int = 1000):
+    """Admissions still holding a bed (no dischtime); read by occupancy.py."""
+    return iter_records("admissions", {"dischtime": None}, projection, batch_size=batch_size)
+
 # -------------------- Core Queries --------------------
 
 @retry_mongo
-async def get_patient_history(name: str) -> dict:
+async def get_patient_history(name: str, limit: int = DEFAULT_PAGE_SIZE, batch_size: int = DEFAULT_BATCH_SIZE,
+                              projections: dict = None) -> dict:
+    """`projections` maps PROJECTIONS keys to field sets; missing keys return whole documents."""
+    projections = projections or {}
     db = get_db()
-    patient = await db.patients.find_one({"name": {"$regex": name, "$options": "i"}})
+    patient = await db.patients.find_one({"name": {"$regex": name, "$options": "i"}}, projections.get("patient"))
     if not patient:
         logger.info(f"[MONGO] No patient found with name: {name}")
         return {"error": "Patient not found."}
 
     pid = patient.get("patient_id")
-    admissions = await db.admissions.find({"patient_id": pid}).to_list(100)
-    prescriptions = await db.prescriptions.find({"patient_id": pid}).to_list(100)
-    diagnoses = await db.diagnosis_icd.find({"patient_id": pid}).to_list(100)
-    labs = await db.application.find({"patient_id": pid}).to_list(100)
-    notes = await db.noteevents.find({"patient_id": pid}).to_list(100)
+    page = dict(limit=limit, batch_size=batch_size)
+    admissions, prescriptions, diagnoses, labs, notes = await asyncio.gather(
+        _find_page("admissions", {"patient_id": pid}, projections.get("admissions"), **page),
+        _find_page("prescriptions", {"patient_id": pid}, projections.get("prescriptions"), **page),
+        _find_page("diagnosis_icd", {"patient_id": pid}, projections.get("diagnoses"), **page),
+        _find_page("application", {"patient_id": pid}, projections.get("lab_applications"), **page),
+        _find_page("noteevents", {"patient_id": pid}, projections.get("notes"), **page),
+    )
 
     result = {
         "patient": patient,
@@ -73,6 +323,29 @@ async def get_patient_history(name: str) -> dict:
     log_data("get_patient_history", result)
     return result
 
+@retry_mongo
+async def get_patient_summary(name: str, max_age_s: float = SUMMARY_MAX_AGE_S):
+    """
+    Materialized summary from patient_summaries (see summaries.py), or None if
+    not built yet or older than `max_age_s`. Without change streams, edits to
+    documents that carry no updatedAt never mark a summary dirty, so an old
+    one may be stale; the caller then reads the sources and queues a rebuild.
+    """
+    db = get_db()
+    query = {"name": {"$regex": name, "$options": "i"}}
+    if max_age_s > 0:
+        query["updatedAt"] = {"$gte": datetime.utcnow() - timedelta(seconds=max_age_s)}
+    result = await db.patient_summaries.find_one(query, {"_id": 0})
+    if result:
+        log_data("get_patient_summary", result)
+    return result
+
+@retry_mongo
+async def get_patient_ref(name: str):
+    """patient_id and name for a (partial) name, or None. Used to resolve an entity once per request."""
+    db = get_db()
+    return await db.patients.find_one({"name": {"$regex": name, "$options": "i"}}, {"patient_id": 1, "name": 1, "_id": 0})
+
 @retry_mongo
 async def get_patient_dob(name: str) -> dict:
     db = get_db()
@@ -88,67 +361,613 @@ async def get_patient_contact(name: str) -> dict:
     return result or {"error": "Patient not found."}
 
 @retry_mongo
-async def get_todays_appointments() -> list:
-    db = get_db()
+async def get_todays_appointments(limit: int = DEFAULT_PAGE_SIZE, after=None, projection=None,
+                                  batch_size: int = DEFAULT_BATCH_SIZE) -> list:
     today = datetime.today().strftime('%Y-%m-%d')
-    result = await db.appointments.find({"date": today}).to_list(100)
+    result = await _find_page("appointments", {"date": today}, projection, limit, after, batch_size)
     log_data("get_todays_appointments", result)
     return result
 
 @retry_mongo
-async def get_appointments_on_date(date_str: str) -> list:
-    db = get_db()
-    result = await db.appointments.find({"date": date_str}).to_list(100)
+async def get_appointments_on_date(date_str: str, limit: int = DEFAULT_PAGE_SIZE, after=None,
+                                   projection=None, batch_size: int = DEFAULT_BATCH_SIZE) -> list:
+    result = await _find_page("appointments", {"date": date_str}, projection, limit, after, batch_size)
     log_data("get_appointments_on_date", result)
     return result
 
 @retry_mongo
-async def get_all_staff() -> list:
+async def get_appointments_in_range(start_str: str, end_str: str, limit: int = DEFAULT_PAGE_SIZE, after: str = None,
+                                    projection=None, batch_size: int = DEFAULT_BATCH_SIZE) -> list:
+    """
+    Appointments with start_str <= date < end_str (YYYY-MM-DD), in (date, _id)
+    order along date_1__id_1. `after` is the "<date>|<_id>" of the last item
+    of the previous page.
+    """
     db = get_db()
-    result = await db.staff.find({"status": "active"}).to_list(100)
+    query = {"date": {"$gte": start_str, "$lt": end_str}}
+    if after:
+        last_date, _, last_id = after.partition("|")
+        query = {"$and": [query, {"$or": [{"date": {"$gt": last_date}},
+                                          {"date": last_date, "_id": {"$gt": _cursor_id(last_id)}}]}]}
+    cursor = (
+        db.appointments
+        .find(query, projection)
+        .sort([("date", ASCENDING), ("_id", ASCENDING)])
+        .limit(limit)
+        .batch_size(min(batch_size, limit))
+    )
+    result = await cursor.to_list(length=limit)
+    log_data("get_appointments_in_range", result)
+    return result
+
+@retry_mongo
+async def _load_all_staff() -> list:
+    return [doc async for doc in iter_records("staff", {"status": "active"})]
+
+async def get_all_staff() -> list:
+    result = await _REFERENCE_CACHES["staff"].get()
     log_data("get_all_staff", result)
     return result
 
 # -------------------- Extended Field Lookups --------------------
 
 @retry_mongo
-async def get_admissions_for_patient(pid: str) -> list:
-    db = get_db()
-    result = await db.admissions.find({"patient_id": pid}).to_list(100)
+async def get_admissions_for_patient(pid: str, limit: int = DEFAULT_PAGE_SIZE, after=None,
+                                     projection=None, batch_size: int = DEFAULT_BATCH_SIZE) -> list:
+    result = await _find_page("admissions", {"patient_id": pid}, projection, limit, after, batch_size)
     log_data("get_admissions_for_patient", result)
     return result
 
 @retry_mongo
-async def get_lab_applications_for_patient(pid: str) -> list:
-    db = get_db()
-    result = await db.application.find({"patient_id": pid}).to_list(100)
+async def get_prescriptions_for_patient(pid: str, limit: int = DEFAULT_PAGE_SIZE, after=None,
+                                        projection=None, batch_size: int = DEFAULT_BATCH_SIZE) -> list:
+    result = await _find_page("prescriptions", {"patient_id": pid}, projection, limit, after, batch_size)
+    log_data("get_prescriptions_for_patient", result)
+    return result
+
+@retry_mongo
+async def get_lab_applications_for_patient(pid: str, limit: int = DEFAULT_PAGE_SIZE, after=None,
+                                           projection=None, batch_size: int = DEFAULT_BATCH_SIZE) -> list:
+    result = await _find_page("application", {"patient_id": pid}, projection, limit, after, batch_size)
     log_data("get_lab_applications_for_patient", result)
     return result
 
 @retry_mongo
+async def _load_lab_items_list() -> list:
+    return [doc async for doc in iter_records("d_labitems", {})]
+
 async def get_lab_items_list() -> list:
-    db = get_db()
-    result = await db.d_labitems.find().to_list(100)
+    result = await _REFERENCE_CACHES["d_labitems"].get()
     log_data("get_lab_items_list", result)
     return result
 
 @retry_mongo
-async def get_diagnosis_for_admission(aid: str) -> list:
-    db = get_db()
-    result = await db.diagnosis_icd.find({"admission_id": aid}).to_list(100)
+async def get_diagnosis_for_admission(aid: str, limit: int = DEFAULT_PAGE_SIZE, after=None,
+                                      projection=None, batch_size: int = DEFAULT_BATCH_SIZE) -> list:
+    result = await _find_page("diagnosis_icd", {"admission_id": aid}, projection, limit, after, batch_size)
     log_data("get_diagnosis_for_admission", result)
     return result
 
 @retry_mongo
-async def get_prescriptions_for_admission(aid: str) -> list:
-    db = get_db()
-    result = await db.prescriptions.find({"admission_id": aid}).to_list(100)
+async def get_prescriptions_for_admission(aid: str, limit: int = DEFAULT_PAGE_SIZE, after=None,
+                                          projection=None, batch_size: int = DEFAULT_BATCH_SIZE) -> list:
+    result = await _find_page("prescriptions", {"admission_id": aid}, projection, limit, after, batch_size)
     log_data("get_prescriptions_for_admission", result)
     return result
 
 @retry_mongo
-async def get_notes_for_admission(aid: str) -> list:
-    db = get_db()
-    result = await db.noteevents.find({"admission_id": aid}).to_list(100)
+async def get_notes_for_admission(aid: str, limit: int = DEFAULT_PAGE_SIZE, after=None,
+                                  projection=None, batch_size: int = DEFAULT_BATCH_SIZE) -> list:
+    result = await _find_page("noteevents", {"admission_id": aid}, projection, limit, after, batch_size)
     log_data("get_notes_for_admission", result)
     return result
+
+@retry_mongo
+async def get_notes_by_ids(ids: list, projection=None) -> list:
+    """Notes by _id (in no particular order); notes_index.py fetches its hits' text with this."""
+    db = get_db()
+    result = await db.noteevents.find({"_id": {"$in": [_cursor_id(i) for i in ids]}}, projection).to_list(length=len(ids))
+    log_data("get_notes_by_ids", result)
+    return result
+
+# -------------------- Vitals Time Series --------------------
+# PatientVitals documents (Server/Models/PatientVitals.js, collection
+# `patientvitals`): one per recording, holding every vital measured then,
+# keyed by patientId, the Node Patient's UUID _id (not the patient_id the
+# other helpers use). Both helpers walk its {patientId: 1, recordedAt: -1} index.
+
+_UUID = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.IGNORECASE)
+
+@retry_mongo
+async def get_vitals_patient_ref(entity: str):
+    """The Node Patient (Server/Models/Patient.js) that keys PatientVitals: by its UUID, or by first [last] name."""
+    db = get_db()
+    entity = entity.strip()
+    if _UUID.match(entity):
+        query = {"_id": entity.lower()}
+    else:
+        first, _, last = entity.partition(" ")
+        query = {"firstName": {"$regex": f"^{re.escape(first)}", "$options": "i"}}
+        if last.strip():
+            query["lastName"] = {"$regex": f"^{re.escape(last.strip())}", "$options": "i"}
+    return await db.patients.find_one(query, {"_id": 1, "firstName": 1, "lastName": 1})
+
+# metric -> (field the recording must have, value expression); °F temperatures are converted to °C
+VITAL_FIELDS = {
+    "temperature": ("temperature.value", {"$cond": [{"$eq": ["$temperature.unit", "F"]},
+                                                    {"$divide": [{"$subtract": ["$temperature.value", 32]}, 1.8]},
+                                                    "$temperature.value"]}),
+    "spo2": ("oxygenSaturation", "$oxygenSaturation"),
+    "heart_rate": ("heartRate", "$heartRate"),
+    "resp_rate": ("respiratoryRate", "$respiratoryRate"),
+    "sbp": ("bloodPressure.systolic", "$bloodPressure.systolic"),
+    "dbp": ("bloodPressure.diastolic", "$bloodPressure.diastolic"),
+}
+
+@retry_mongo
+async def get_latest_vital(pid: str, metric: str):
+    """The patient's last recording of `metric` as {recordedAt, value}, or None."""
+    db = get_db()
+    field, value = VITAL_FIELDS[metric]
+    pipeline = [
+        {"$match": {"patientId": pid, field: {"$type": "number"}}},
+        {"$sort": {"recordedAt": -1}},
+        {"$limit": 1},
+        {"$project": {"_id": 0, "recordedAt": 1, "value": value}},
+    ]
+    result = await db.patientvitals.aggregate(pipeline).to_list(length=1)
+    return result[0] if result else None
+
+@retry_mongo
+async def get_vitals_series(pid: str, metric: str, start: datetime, end: datetime, buckets: int = 48) -> list:
+    """Recordings in [start, end] downsampled server-side into <= `buckets` equal-count min/max/mean windows."""
+    db = get_db()
+    field, value = VITAL_FIELDS[metric]
+    pipeline = [
+        {"$match": {"patientId": pid, field: {"$type": "number"}, "recordedAt": {"$gte": start, "$lte": end}}},
+        {"$sort": {"recordedAt": 1}},
+        {"$bucketAuto": {
+            "groupBy": "$recordedAt",
+            "buckets": buckets,
+            "output": {"n": {"$sum": 1}, "min": {"$min": value}, "max": {"$max": value}, "mean": {"$avg": value}},
+        }},
+    ]
+    result = await db.patientvitals.aggregate(pipeline, allowDiskUse=True).to_list(length=buckets)
+    log_data("get_vitals_series", result)
+    return result
+
+# -------------------- Reference Data Cache --------------------
+# Staff rosters and d_labitems change a few times a day, so they are served
+# from memory. Entries expire after a per-collection TTL and are invalidated
+# early by a change stream, or by polling a version stamp when change streams
+# are unavailable (standalone mongod).
+
+class ReferenceCache:
+    def __init__(self, collection: str, loader, ttl: float):
+        self.collection = collection
+        self.loader = loader
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._value = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self._value is not None and (time.monotonic() - self._loaded_at) < self.ttl
+
+    async def get(self) -> list:
+        if self._fresh():
+            self.hits += 1
+            return list(self._value)
+        # single-flight: concurrent misses wait for one load
+        async with self._lock:
+            if self._fresh():
+                self.hits += 1
+                return list(self._value)
+            self.misses += 1
+            self._value = await self.loader()
+            self._loaded_at = time.monotonic()
+            logger.debug("[CACHE] Loaded %s (%d docs)", self.collection, len(self._value))
+            return list(self._value)
+
+    def invalidate(self):
+        if self._value is not None:
+            self.invalidations += 1
+        self._value = None
+        logger.debug("[CACHE] Invalidated %s", self.collection)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hitRatio": round(self.hits / total, 4) if total else 0.0,
+            "cached": self._value is not None,
+            "docs": len(self._value) if self._value is not None else 0,
+            "ttlSeconds": self.ttl,
+        }
+
+
+_REFERENCE_CACHES = {
+    "staff": ReferenceCache("staff", _load_all_staff, CACHE_TTL_STAFF),
+    "d_labitems": ReferenceCache("d_labitems", _load_lab_items_list, CACHE_TTL_LABITEMS),
+}
+_cache_watchers = []
+
+async def _version_stamp(collection: str) -> tuple:
+    """Cheap change detector: document count, newest _id and newest updatedAt."""
+    db = get_db()
+    coll = db[collection]
+    count = await coll.estimated_document_count()
+    newest = await coll.find_one({}, {"_id": 1}, sort=[("_id", DESCENDING)])
+    updated = await coll.find_one({"updatedAt": {"$exists": True}}, {"updatedAt": 1}, sort=[("updatedAt", DESCENDING)])
+    return (
+        count,
+        newest.get("_id") if newest else None,
+        updated.get("updatedAt") if updated else None,
+    )
+
+# longest polling spell between attempts to reopen a refused change stream
+CHANGE_STREAM_RETRY_MAX_S = 1800
+
+async def _poll_version(cache: ReferenceCache, until: float = None):
+    last = None
+    while until is None or time.monotonic() < until:
+        try:
+            stamp = await _version_stamp(cache.collection)
+            if last is not None and stamp != last:
+                cache.invalidate()
+            last = stamp
+        except PyMongoError as e:
+            logger.warning("[CACHE] Version poll failed for %s: %s", cache.collection, e)
+        await asyncio.sleep(CACHE_VERSION_POLL_INTERVAL)
+
+async def _watch_collection(cache: ReferenceCache):
+    db = get_db()
+    backoff = CACHE_VERSION_POLL_INTERVAL
+    while True:
+        try:
+            async with db[cache.collection].watch() as stream:
+                logger.debug("[CACHE] Change stream open on %s", cache.collection)
+                backoff = CACHE_VERSION_POLL_INTERVAL
+                async for _change in stream:
+                    cache.invalidate()
+        except OperationFailure as e:
+            # Change streams need a replica set (and are refused mid-failover): poll the
+            # version stamp for a while, then try the stream again, backing off each time.
+            logger.info("[CACHE] Change streams unavailable for %s (%s); polling version stamp for %.0fs.",
+                        cache.collection, e, backoff)
+            cache.invalidate()
+            await _poll_version(cache, time.monotonic() + backoff)
+            backoff = min(backoff * 2, CHANGE_STREAM_RETRY_MAX_S)
+        except PyMongoError as e:
+            logger.warning("[CACHE] Change stream on %s dropped: %s", cache.collection, e)
+            cache.invalidate()
+            await asyncio.sleep(CACHE_VERSION_POLL_INTERVAL)
+
+def start_reference_cache_watchers():
+    if _cache_watchers:
+        return
+    for cache in _REFERENCE_CACHES.values():
+        _cache_watchers.append(asyncio.create_task(_watch_collection(cache)))
+
+async def stop_reference_cache_watchers():
+    for task in _cache_watchers:
+        task.cancel()
+    await asyncio.gather(*_cache_watchers, return_exceptions=True)
+    _cache_watchers.clear()
+
+async def warm_reference_cache():
+    for cache in _REFERENCE_CACHES.values():
+        try:
+            await cache.get()
+        except Exception as e:
+            logger.warning("[CACHE] Warm-up failed for %s: %s", cache.collection, e)
+
+def reference_cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in _REFERENCE_CACHES.items()}
+
+# -------------------- Conversation Persistence --------------------
+# Used by app.py when USE_MONGO_FOR_CONV=1. Messages are queued in memory and
+# written in batches (bulk_write) when CONV_FLUSH_BATCH messages are pending or
+# every CONV_FLUSH_INTERVAL_MS, so /chat never waits on a Mongo write. Reads
+# merge queued messages, and stop_conversation_writer() flushes at shutdown.
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _public_message(doc: dict) -> dict:
+    return {
+        "id": str(doc["_id"]),
+        "sender": doc["sender"],
+        "text": doc["text"],
+        "ts": _iso(doc["ts"]),
+        "meta": doc.get("meta") or {},
+    }
+
+def _public_conversation(doc: dict, pending: int = 0) -> dict:
+    return {
+        "id": doc["_id"],
+        "title": doc.get("title"),
+        "createdAt": _iso(doc.get("createdAt")),
+        "createdBy": doc.get("createdBy"),
+        "updatedAt": _iso(doc.get("updatedAt")),
+        "messageCount": doc.get("messageCount", 0) + pending,
+        "metadata": doc.get("metadata") or {},
+    }
+
+class ConversationWriter:
+    def __init__(self, max_batch: int, flush_interval: float, max_pending: int):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.flushed = 0
+        self.dropped = 0
+        self._pending = []
+        self._in_flight = []
+        # messageCount/updatedAt deltas for messages already inserted, applied separately so a
+        # failed counter write is retried on its own instead of re-inserting (and skipping) messages
+        self._counters = {}
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    def enqueue(self, doc: dict):
+        self._pending.append(doc)
+        if len(self._pending) > self.max_pending:
+            self._pending.pop(0)
+            self.dropped += 1
+            logger.error("[CONV] Write-behind queue full; dropped oldest message.")
+        if len(self._pending) >= self.max_batch:
+            self._wake.set()
+
+    def queued_for(self, conversation_id: str) -> list:
+        return [m for m in self._in_flight + self._pending if m["conversation_id"] == conversation_id]
+
+    def queued_counts(self) -> dict:
+        counts = {cid: n for cid, (n, _ts) in self._counters.items()}
+        for m in self._in_flight + self._pending:
+            counts[m["conversation_id"]] = counts.get(m["conversation_id"], 0) + 1
+        return counts
+
+    def depth(self) -> int:
+        return len(self._pending) + len(self._in_flight)
+
+    def _count(self, conversation_id: str, n: int, ts: datetime):
+        count, last_ts = self._counters.get(conversation_id, (0, ts))
+        self._counters[conversation_id] = (count + n, max(last_ts, ts))
+
+    async def _write_messages(self, db):
+        self._in_flight, self._pending = self._pending, []
+        batch = self._in_flight
+        failed = batch
+        try:
+            retry_idx = set()
+            try:
+                await db.conversation_messages.bulk_write([InsertOne(m) for m in batch], ordered=False)
+            except BulkWriteError as e:
+                # a duplicate key means an earlier attempt inserted the message but its result was
+                # lost; it was never counted, so it counts now like any other written message
+                retry_idx = {err["index"] for err in e.details.get("writeErrors", []) if err.get("code") != 11000}
+            failed = [m for i, m in enumerate(batch) if i in retry_idx]
+            written = [m for i, m in enumerate(batch) if i not in retry_idx]
+            for m in written:
+                self._count(m["conversation_id"], 1, m["ts"])
+            self.flushed += len(written)
+            logger.debug("[CONV] Flushed %d messages.", len(written))
+        except PyMongoError as e:
+            logger.warning("[CONV] Flush of %d messages failed, will retry: %s", len(batch), e)
+        finally:
+            self._pending = failed + self._pending
+            self._in_flight = []
+
+    async def _write_counters(self, db):
+        items, self._counters = list(self._counters.items()), {}
+        failed = items
+        try:
+            try:
+                await db.conversations.bulk_write([
+                    UpdateOne({"_id": cid}, {"$inc": {"messageCount": n}, "$max": {"updatedAt": ts}})
+                    for cid, (n, ts) in items
+                ], ordered=False)
+                failed = []
+            except BulkWriteError as e:
+                bad = {err["index"] for err in e.details.get("writeErrors", [])}
+                failed = [item for i, item in enumerate(items) if i in bad]
+                raise
+        except PyMongoError as e:
+            logger.warning("[CONV] Counter update for %d conversations failed, will retry: %s", len(failed), e)
+        finally:
+            for cid, (n, ts) in failed:
+                self._count(cid, n, ts)
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending and not self._counters:
+                return
+            db = get_db()
+            if self._pending:
+                await self._write_messages(db)
+            if self._counters:
+                await self._write_counters(db)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # anything unexpected leaves the batch queued; keep the writer alive
+                logger.exception("[CONV] Flush failed unexpectedly, will retry: %s", e)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.exception("[CONV] Final flush failed: %s", e)
+        if self._pending or self._counters:
+            logger.error("[CONV] %d messages and %d conversation counters could not be flushed at shutdown.",
+                         len(self._pending), len(self._counters))
+
+
+conversation_writer = ConversationWriter(CONV_FLUSH_BATCH, CONV_FLUSH_INTERVAL_MS / 1000, CONV_MAX_PENDING)
+
+metrics.REGISTRY.gauge("chatbot_conversation_writer_depth", "Messages queued or in flight in the write-behind buffer.",
+                       fn=conversation_writer.depth)
+
+def start_conversation_writer():
+    conversation_writer.start()
+
+async def stop_conversation_writer():
+    await conversation_writer.stop()
+
+def memory_stats() -> dict:
+    """What this module holds in process memory, for /admin/memory."""
+    return {
+        "clients": int(_client is not None),
+        "openConnections": pool_monitor.open_connections,
+        "referenceCacheDocs": {name: cache.stats()["docs"] for name, cache in _REFERENCE_CACHES.items()},
+        "conversationWriteQueue": conversation_writer.depth(),
+        "conversationWritesDropped": conversation_writer.dropped,
+    }
+
+@retry_mongo
+async def create_conversation(user: dict, title: str = None, metadata: dict = None) -> dict:
+    db = get_db()
+    now = datetime.utcnow()
+    doc = {
+        "_id": f"cid_{ObjectId()}",
+        "title": title or "Conversation",
+        "createdAt": now,
+        "updatedAt": now,
+        "createdBy": (user or {}).get("id", "anonymous"),
+        "metadata": metadata or {},
+        "messageCount": 0,
+    }
+    await db.conversations.insert_one(doc)
+    return _public_conversation(doc)
+
+async def save_message(conversation_id: str, sender: str, text: str, meta: dict = None) -> dict:
+    """Queues a message for the next batched flush and returns it immediately."""
+    doc = {
+        "_id": ObjectId(),
+        "conversation_id": conversation_id,
+        "sender": sender,
+        "text": text,
+        "ts": datetime.utcnow(),
+        "meta": meta or {},
+    }
+    conversation_writer.enqueue(doc)
+    return _public_message(doc)
+
+def _conversation_bound(cursor: str, op: str) -> dict:
+    updated_at, cid = parse_conversation_cursor(cursor)
+    ts = datetime.fromisoformat(updated_at)
+    return {"$or": [{"updatedAt": {op: ts}}, {"updatedAt": ts, "_id": {op: cid}}]}
+
+@retry_mongo
+async def list_conversations(limit: int = 50, before: str = None, after: str = None) -> list:
+    """Most recently updated first; `before`/`after` take a conversation's cursor."""
+    db = get_db()
+    if after:
+        cursor = db.conversations.find(_conversation_bound(after, "$gt")).sort([("updatedAt", ASCENDING), ("_id", ASCENDING)])
+    else:
+        query = _conversation_bound(before, "$lt") if before else {}
+        cursor = db.conversations.find(query).sort([("updatedAt", DESCENDING), ("_id", DESCENDING)])
+    docs = await cursor.limit(limit).to_list(length=limit)
+    if after:
+        docs.reverse()
+    pending = conversation_writer.queued_counts()
+    page = [_public_conversation(d, pending.get(d["_id"], 0)) for d in docs]
+    for item in page:
+        item["cursor"] = f"{item['updatedAt']}|{item['id']}"
+    return page
+
+_EPOCH = datetime(1970, 1, 1)
+
+def _message_key(doc: dict) -> tuple:
+    # ts is naive UTC (utcnow / BSON dates); .timestamp() would read it as local time
+    ts = doc["ts"]
+    return calendar.timegm(ts.utctimetuple()) * 1000 + ts.microsecond // 1000, doc["_id"]
+
+def _message_cursor(doc: dict) -> str:
+    ts_ms, oid = _message_key(doc)
+    return f"{ts_ms}:{oid}"
+
+def _parse_message_cursor(cursor: str) -> tuple:
+    ts_ms, _, oid = cursor.partition(":")
+    if not ts_ms.isdigit() or not ObjectId.is_valid(oid):
+        raise InvalidCursor(f"Invalid message cursor: {cursor!r}")
+    return int(ts_ms), ObjectId(oid)
+
+def _message_bound(cursor: str, op: str) -> dict:
+    ts_ms, oid = _parse_message_cursor(cursor)
+    ts = _EPOCH + timedelta(milliseconds=ts_ms)
+    return {"$or": [{"ts": {op: ts}}, {"ts": ts, "_id": {op: oid}}]}
+
+@retry_mongo
+async def get_conversation_messages(conversation_id: str, limit: int = DEFAULT_PAGE_SIZE,
+                                    before: str = None, after: str = None):
+    """
+    Oldest first, paged on (ts, _id). Without a cursor the newest `limit`
+    messages are returned; `before`/`after` take a message's cursor.
+    Returns None when the conversation does not exist.
+    """
+    db = get_db()
+    query = {"conversation_id": conversation_id}
+    order = DESCENDING
+    if after:
+        query.update(_message_bound(after, "$gt"))
+        order = ASCENDING
+    elif before:
+        query.update(_message_bound(before, "$lt"))
+    docs = await (
+        db.conversation_messages.find(query, {"conversation_id": 0})
+        .sort([("ts", order), ("_id", order)])
+        .limit(limit)
+        .to_list(length=limit)
+    )
+    if order == DESCENDING:
+        docs.reverse()
+
+    queued = conversation_writer.queued_for(conversation_id)
+    if not docs and not queued and not await db.conversations.find_one({"_id": conversation_id}, {"_id": 1}):
+        return None
+
+    if not before and queued:
+        # queued messages are newer than anything flushed
+        seen = {d["_id"] for d in docs}
+        floor = _parse_message_cursor(after) if after else None
+        docs.extend(sorted(
+            (m for m in queued if m["_id"] not in seen and (floor is None or _message_key(m) > floor)),
+            key=_message_key,
+        ))
+        docs = docs[:limit] if after else docs[-limit:]
+
+    messages = [_public_message(d) for d in docs]
+    for doc, msg in zip(docs, messages):
+        msg["cursor"] = _message_cursor(doc)
+    return messages
+
+async def conversation_version(conversation_id: str):
+    """Change token for conditional GETs; None when the conversation does not exist."""
+    db = get_db()
+    doc = await db.conversations.find_one({"_id": conversation_id}, {"messageCount": 1, "updatedAt": 1})
+    if doc is None:
+        return None
+    return doc.get("messageCount", 0), _iso(doc.get("updatedAt")), len(conversation_writer.queued_for(conversation_id))
@@ -6,14 +6,17 @@ Enhancements:
 - Few-shot prompting (descriptive intent support)
 - Confidence normalization
 - Language-aware fallback
-- Context memory
+- Multi-intent detection for compound questions
 """
 
 import logging
+import os
+import re
 import spacy
 from langdetect import detect
 from transformers import pipeline
 import torch
+import tracing
 
 # ---------------------------- Logging Setup ----------------------------
 
@@ -93,6 +96,7 @@ INTENT_SCHEMA = {
     "insurance_details": "Fetch insurance coverage info.",
     "next_of_kin": "Show next of kin info.",
     "doctor_notes": "Display doctor's notes.",
+    "search_notes": "Search clinical notes for a symptom, event or finding.",
     "referral_status": "Check referral status.",
     "follow_up_appointments": "Get follow-up appointment info.",
     "pending_lab_tests": "List pending lab tests.",
@@ -118,12 +122,12 @@ INTENT_SCHEMA = {
     "oxygen_saturation_levels": "View oxygen saturation data."
 }
 
-# ---------------------------- Context Memory ----------------------------
-
-DIALOGUE_CONTEXT = {
-    "last_intent": None,
-    "last_entity": None
-}
+# Compound questions ("Ravi's prescriptions and lab results") are scored
+# multi-label (each intent independently) and every intent at or above this
+# score is answered, up to MAX_INTENTS.
+MULTI_INTENT_THRESHOLD = float(os.getenv("MULTI_INTENT_THRESHOLD", "0.75"))
+MAX_INTENTS = int(os.getenv("MAX_INTENTS", "3"))
+_COMPOUND = re.compile(r"\b(?:and|also|plus|as well as|along with)\b|[,&+;]", re.IGNORECASE)
 
 # ---------------------------- Language Detection ----------------------------
 
@@ -150,61 +154,126 @@ def extract_entities(text: str):
 
 # ---------------------------- Intent Detection ----------------------------
 
+# the zero-shot pipeline's default hypothesis template
+HYPOTHESIS_TEMPLATE = "This example is {}."
+
+def score_intents(text: str, entity_text: str = None):
+    """
+    One NLI forward pass over every intent label. Returns (ranked, independent):
+    - ranked: [(intent, score)] best first, the entailment logits softmaxed
+      across labels, as single-label zero-shot scores them;
+    - independent: {intent: score}, each label's entailment vs contradiction
+      on its own, as multi-label zero-shot scores them.
+    """
+    candidate_labels = list(INTENT_SCHEMA.values())
+    label_to_intent = {v: k for k, v in INTENT_SCHEMA.items()}
+
+    if entity_text:
+        text += f" (Patient: {entity_text})"
+
+    model, tokenizer = intent_classifier.model, intent_classifier.tokenizer
+    inputs = tokenizer([text] * len(candidate_labels), [HYPOTHESIS_TEMPLATE.format(l) for l in candidate_labels],
+                       return_tensors="pt", padding=True, truncation="only_first").to(model.device)
+    with torch.no_grad():
+        logits = model(**inputs).logits
+    entailment = intent_classifier.entailment_id
+    contradiction = -1 if entailment == 0 else 0
+    softmax = logits[:, entailment].softmax(dim=0).tolist()
+    independent = logits[:, [contradiction, entailment]].softmax(dim=1)[:, 1].tolist()
+
+    intents = [label_to_intent[label] for label in candidate_labels]
+    ranked = sorted(zip(intents, softmax), key=lambda pair: pair[1], reverse=True)
+    return ranked, dict(zip(intents, independent))
+
+def _primary_intent(ranked, threshold: float = 0.10):
+    top_intent, score = ranked[0]
+    logger.debug(f"[NLP] Intent prediction: {top_intent} (score: {score:.2f})")
+
+    # Normalize threshold based on linguistic complexity
+    dynamic_threshold = max(threshold, 0.10)
+    if score < dynamic_threshold:
+        logger.warning(f"[NLP] Intent score low ({score:.2f}) < {dynamic_threshold:.2f} → fallback.")
+        return "fallback", score
+
+    return top_intent, score
+
+def _extra_intents(independent, threshold: float = MULTI_INTENT_THRESHOLD, max_intents: int = MAX_INTENTS):
+    picked = sorted(((i, s) for i, s in independent.items() if s >= threshold), key=lambda p: p[1], reverse=True)
+    picked = picked[:max_intents]
+    logger.debug(f"[NLP] Multi-label intents: {[(i, round(s, 2)) for i, s in picked]}")
+    return picked
+
 def detect_intent(text: str, entity_text: str = None, threshold: float = 0.10):
     """
     Entity-aware intent detection using descriptive prompts.
     """
     try:
-        candidate_labels = list(INTENT_SCHEMA.values())
-        label_to_intent = {v: k for k, v in INTENT_SCHEMA.items()}
-
-        if entity_text:
-            text += f" (Patient: {entity_text})"
-
-        result = intent_classifier(text, candidate_labels)
-        top_label = result['labels'][0]
-        top_intent = label_to_intent[top_label]
-        score = result['scores'][0]
-
-        logger.debug(f"[NLP] Intent prediction: {top_intent} (score: {score:.2f})")
-
-        # Normalize threshold based on linguistic complexity
-        dynamic_threshold = max(threshold, 0.10)
-        if score < dynamic_threshold:
-            logger.warning(f"[NLP] Intent score low ({score:.2f}) < {dynamic_threshold:.2f} → fallback.")
-            return "fallback", score
-
-        return top_intent, score
+        return _primary_intent(score_intents(text, entity_text)[0], threshold)
     except Exception:
         logger.exception("[NLP] Intent detection failed.")
         return "fallback", 0.0
 
+def detect_intents(text: str, entity_text: str = None, threshold: float = MULTI_INTENT_THRESHOLD,
+                   max_intents: int = MAX_INTENTS):
+    """
+    Multi-label detection: every intent whose independent entailment score
+    clears `threshold`, best first, as [(intent, score)].
+    """
+    try:
+        return _extra_intents(score_intents(text, entity_text)[1], threshold, max_intents)
+    except Exception:
+        logger.exception("[NLP] Multi-label intent detection failed.")
+        return []
+
 # ---------------------------- Main NLP Pipeline ----------------------------
 
-def detect_intent_and_entity(user_input: str):
+def _extract_entity(user_input: str):
+    with tracing.span("nlp.ner"):
+        entities = extract_entities(user_input)
+    for ent in entities:
+        if ent['label'] in ("PERSON", "ORG", "GPE", "DATE", "DEPARTMENT", "PATIENT_ID"):
+            return ent['text']
+    return None
+
+def detect_intents_and_entity(user_input: str, entity: str = None):
+    """
+    Like detect_intent_and_entity, but returns every requested intent
+    ([primary, *others]) for compound questions. One model pass scores every
+    intent both ways: the primary intent and the fallback threshold use the
+    single-label (softmax) ranking, and compound inputs add the intents whose
+    independent multi-label score clears MULTI_INTENT_THRESHOLD.
+    A known `entity` (e.g. the patient a follow-up refers to) skips NER.
+    """
     logger.debug(f"[NLP] Input received: {user_input}")
 
     # Detect language
-    lang = detect_language(user_input)
+    with tracing.span("nlp.language"):
+        lang = detect_language(user_input)
 
     # Extract entities
-    entities = extract_entities(user_input)
-    entity_text = None
-    for ent in entities:
-        if ent['label'] in ("PERSON", "ORG", "GPE", "DATE", "DEPARTMENT", "PATIENT_ID"):
-            entity_text = ent['text']
-            break
+    entity_text = entity or _extract_entity(user_input)
 
     # Detect intent
-    intent, score = detect_intent(user_input, entity_text)
+    with tracing.span("nlp.intent"):
+        try:
+            ranked, independent = score_intents(user_input, entity_text)
+            intent, score = _primary_intent(ranked)
+        except Exception:
+            logger.exception("[NLP] Intent detection failed.")
+            intent = "fallback"
 
     if intent == "fallback":
         logger.debug("[NLP] Fallback triggered → returning unknown intent.")
-        return "unknown", None
+        return ["unknown"], None
+
+    intents = [intent]
+    if _COMPOUND.search(user_input):
+        intents += [i for i, _ in _extra_intents(independent) if i != intent]
+        intents = intents[:MAX_INTENTS]
 
-    # Update memory
-    DIALOGUE_CONTEXT["last_intent"] = intent
-    DIALOGUE_CONTEXT["last_entity"] = entity_text
+    logger.debug(f"[NLP] Final NLP output → Intents: {intents}, Entity: '{entity_text}'")
+    return intents, entity_text
 
-    logger.debug(f"[NLP] Final NLP output → Intent: '{intent}', Entity: '{entity_text}'")
-    return intent, entity_text
+def detect_intent_and_entity(user_input: str):
+    intents, entity_text = detect_intents_and_entity(user_input)
+    return intents[0], entity_text
@@ -0,0 +1,961 @@
+"""
+BM25 full-text index over `noteevents`. It serves note searches ("who had a
+fall last week") and the doctor_notes / notes_for_admission intents.
+
+Note text is tokenised into an inverted index: lower-cased words, stopwords
+dropped, plural "s" stripped. The index lives on disk under NOTES_INDEX_DIR
+as immutable segment files plus a manifest:
+
+    seg-000001.nix   b"NIX1" | u32 header length | JSON header (doc count,
+                     patient/admission/category tables) | columns: note
+                     ObjectIds (12 bytes each), patient/admission/category
+                     codes, charttime (epoch seconds), token count | posting
+                     lists: varint (docno delta, term frequency) pairs |
+                     JSON term table {term: [offset, length, df]} |
+                     u64 term table offset, u64 term table length
+    manifest.json    live segments, deleted docnos per segment, last indexed _id
+
+Patient and admission IDs are indexed as field terms, so filtering on
+either one reads a single posting list. Segments are memory-mapped, and a
+search decodes only the posting lists for its own terms.
+
+New notes first go into an in-memory segment. It is written to disk every
+NOTES_INDEX_FLUSH_DOCS notes or every NOTES_INDEX_FLUSH_INTERVAL seconds.
+When there are more than NOTES_INDEX_MAX_SEGMENTS files, they are merged in
+a worker thread and deleted notes are dropped. On start, the index catches
+up from the last indexed _id and then follows a change stream for inserts,
+edits and deletes. Where change streams are unavailable, it polls for new
+notes and for notes whose updatedAt changed.
+
+The index stores only what ranking and filtering need. find() fetches the
+text of the top notes and cuts highlighted snippets from it, so the LLM sees
+snippets rather than whole notes.
+
+Every uvicorn worker opens the same directory, but only one writes to it:
+the worker holding an fcntl lock on NOTES_INDEX_DIR/writer.lock follows
+the notes and flushes and merges segments. The others are readers. They
+re-open the manifest when it changes (every NOTES_INDEX_FLUSH_INTERVAL
+seconds at most), so they see new notes once the writer has flushed them.
+The lock is released when the writer's process exits, and a reader then
+takes over. To do the first build offline (with the service stopped):
+
+    python notes_index.py --rebuild
+    python notes_index.py --search "fall risk" --patient P0001
+"""
+
+import os
+import re
+import json
+import math
+import mmap
+import time
+import heapq
+import shutil
+import struct
+import asyncio
+import logging
+import argparse
+import threading
+try:
+    import fcntl
+except ImportError:  # no cross-process lock (Windows): run a single worker there
+    fcntl = None
+from array import array
+from collections import Counter
+from itertools import accumulate
+from operator import itemgetter
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError, OperationFailure
+
+import mongo
+import metrics
+from config import (NOTES_INDEX_DIR, NOTES_INDEX_FLUSH_DOCS, NOTES_INDEX_FLUSH_INTERVAL,
+                    NOTES_INDEX_MAX_SEGMENTS, NOTES_INDEX_POLL_INTERVAL)
+
+# -------------------- Logging Setup --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+if not logger.handlers:
+    handler = logging.FileHandler("logs/chatbot.log", encoding="utf-8")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+# BM25 parameters (the usual defaults)
+K1 = 1.2
+B = 0.75
+SNIPPET_WORDS = 32
+MAX_LIMIT = 50
+LOCK_FILE = "writer.lock"
+
+SEARCH_SECONDS = metrics.REGISTRY.histogram(
+    "chatbot_notes_search_seconds",
+    "Time to rank notes in the BM25 index (excluding the snippet text fetch).",
+)
+INDEXED_NOTES = metrics.REGISTRY.counter(
+    "chatbot_notes_indexed_total",
+    "Note index updates by operation (add, replace, delete).",
+    ("op",),
+)
+
+# -------------------- Tokenisation --------------------
+
+STOPWORDS = frozenset("""
+a about after all also an and any anyone are as at be been before but by can could did do does during
+for from had has have having he her hers him his how i if in into is it its me my of on or our over
+please she show so someone than that the their them then there these they this those to up was we
+were what when where which while who whom whose why will with would you
+patient patients note notes find list search mention mentioned mentions documented
+today yesterday tomorrow last next past previous week weeks month months day days ago since recent recently
+""".split())
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+def _stem(token: str) -> str:
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return [_stem(t) for t in _TOKEN.findall((text or "").lower()) if len(t) > 1 and t not in STOPWORDS]
+
+# words that phrase a question about notes rather than name what to find in them
+QUERY_STOPWORDS = frozenset("doctor clinical display give tell everyone anybody".split())
+
+def query_terms(query: Optional[str]) -> List[str]:
+    return [t for t in dict.fromkeys(tokenize(query)) if t not in QUERY_STOPWORDS]
+
+# field terms never collide with word tokens (they start with \x00)
+def _patient_term(pid: str) -> str:
+    return "\x00p:" + pid
+
+def _admission_term(aid: str) -> str:
+    return "\x00a:" + aid
+
+_EPOCH = datetime(1970, 1, 1)
+
+def _epoch(value) -> float:
+    """Seconds since the epoch for a stored charttime/chartdate (naive = UTC, as pymongo returns them)."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value[:19])
+        except ValueError:
+            return math.nan
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return (value - _EPOCH).total_seconds()
+    if isinstance(value, date):
+        return (datetime(value.year, value.month, value.day) - _EPOCH).total_seconds()
+    return math.nan
+
+# -------------------- Posting Lists --------------------
+
+def _put_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _encode(pairs: Iterable) -> bytearray:
+    out, prev = bytearray(), 0
+    for doc, tf in pairs:
+        _put_varint(out, doc - prev)
+        _put_varint(out, tf)
+        prev = doc
+    return out
+
+def _decode(buf: bytes) -> list:
+    """[(docno, tf)] of one encoded posting list."""
+    if buf and max(buf) < 0x80:
+        # dense lists (the frequent terms) are all one-byte varints: decode at C speed
+        return list(zip(accumulate(buf[0::2]), buf[1::2]))
+    pairs, doc, i, end = [], 0, 0, len(buf)
+    while i < end:
+        n = shift = 0
+        while True:
+            byte = buf[i]
+            i += 1
+            n |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        doc += n
+        tf = shift = 0
+        while True:
+            byte = buf[i]
+            i += 1
+            tf |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        pairs.append((doc, tf))
+    return pairs
+
+# -------------------- Segments --------------------
+
+MAGIC = b"NIX1"
+# per-note columns: name -> array typecode (native byte order)
+COLUMNS = (("patient", "I"), ("admission", "I"), ("category", "H"), ("time", "d"), ("length", "I"))
+
+class _SegmentBase:
+    """Per-note columns shared by the in-memory and on-disk segments; docno = position."""
+
+    def __init__(self):
+        self.ids = b""
+        self.patients: List[str] = []
+        self.admissions: List[str] = []
+        self.categories: List[str] = []
+        self.deleted: Set[int] = set()
+        self.live = 0
+        self.live_length = 0
+
+    @property
+    def n(self) -> int:
+        return len(self.length)
+
+    def oid(self, docno: int) -> ObjectId:
+        return ObjectId(bytes(self.ids[docno * 12:docno * 12 + 12]))
+
+    def find(self, oid: bytes) -> Optional[int]:
+        """Live docno of a note, by its 12-byte ObjectId."""
+        pos = self.ids.find(oid)
+        while pos >= 0:
+            if pos % 12 == 0 and pos // 12 not in self.deleted:
+                return pos // 12
+            pos = self.ids.find(oid, pos + 1)
+        return None
+
+    def delete(self, docno: int):
+        if docno not in self.deleted:
+            self.deleted.add(docno)
+            self.live -= 1
+            self.live_length -= self.length[docno]
+
+    def meta(self, docno: int) -> dict:
+        t = self.time[docno]
+        return {
+            "patient_id": self.patients[self.patient[docno]] or None,
+            "admission_id": self.admissions[self.admission[docno]] or None,
+            "category": self.categories[self.category[docno]] or None,
+            "charttime": None if math.isnan(t) else _EPOCH + timedelta(seconds=t),
+        }
+
+
+class _MemSegment(_SegmentBase):
+    """Notes added since the last flush."""
+
+    def __init__(self):
+        super().__init__()
+        self.ids = bytearray()
+        for name, code in COLUMNS:
+            setattr(self, name, array(code))
+        self.postings: Dict[str, list] = {}
+        self._codes = ({}, {}, {})
+
+    @staticmethod
+    def _code(table: list, codes: dict, value) -> int:
+        value = str(value) if value is not None else ""
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(table)
+            table.append(value)
+        return code
+
+    def add(self, oid: bytes, doc: dict) -> int:
+        docno = self.n
+        tokens = tokenize(doc.get("text"))
+        pid, aid = doc.get("patient_id"), doc.get("admission_id")
+        self.ids += oid
+        self.patient.append(self._code(self.patients, self._codes[0], pid))
+        self.admission.append(self._code(self.admissions, self._codes[1], aid))
+        self.category.append(self._code(self.categories, self._codes[2], doc.get("category")))
+        self.time.append(_epoch(doc.get("charttime") or doc.get("chartdate")))
+        self.length.append(len(tokens))
+        counts = Counter(tokens)
+        if pid:
+            counts[_patient_term(str(pid))] = 1
+        if aid:
+            counts[_admission_term(str(aid))] = 1
+        for term, tf in counts.items():
+            self.postings.setdefault(term, []).append((docno, tf))
+        self.live += 1
+        self.live_length += len(tokens)
+        return docno
+
+    def df(self, term: str) -> int:
+        return len(self.postings.get(term, ()))
+
+    def read(self, term: str) -> list:
+        return self.postings.get(term, [])
+
+    def term_lists(self):
+        for term in sorted(self.postings):
+            pairs = self.postings[term]
+            yield term, _encode(pairs), len(pairs)
+
+
+class _Segment(_SegmentBase):
+    """One immutable segment file, memory-mapped."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            # segment names restart after a rebuild; the inode tells a reader the file was replaced
+            self.ino = os.fstat(fh.fileno()).st_ino
+        mm = self._mm
+        if mm[:4] != MAGIC:
+            raise ValueError(f"{path} is not a notes index segment")
+        (header_len,) = struct.unpack_from("<I", mm, 4)
+        header = json.loads(mm[8:8 + header_len])
+        self.patients, self.admissions, self.categories = header["patients"], header["admissions"], header["categories"]
+        n, offset = header["docs"], 8 + header_len
+        self.ids = mm[offset:offset + 12 * n]
+        offset += 12 * n
+        for name, code in COLUMNS:
+            column = array(code)
+            column.frombytes(mm[offset:offset + column.itemsize * n])
+            offset += column.itemsize * n
+            setattr(self, name, column)
+        self._postings = offset
+        terms_offset, terms_len = struct.unpack_from("<QQ", mm, len(mm) - 16)
+        self.terms: Dict[str, list] = json.loads(mm[terms_offset:terms_offset + terms_len])
+        self.live = n
+        self.live_length = sum(self.length)
+
+    def df(self, term: str) -> int:
+        entry = self.terms.get(term)
+        return entry[2] if entry else 0
+
+    def read(self, term: str) -> list:
+        entry = self.terms.get(term)
+        if not entry:
+            return []
+        start = self._postings + entry[0]
+        return _decode(self._mm[start:start + entry[1]])
+
+    def term_lists(self):
+        for term in sorted(self.terms):
+            offset, length, df = self.terms[term]
+            start = self._postings + offset
+            yield term, self._mm[start:start + length], df
+
+    def close(self):
+        self._mm.close()
+
+
+def _write_segment(path: str, source: _SegmentBase, term_lists: Iterable):
+    """Writes `source`'s columns plus the (term, encoded postings, df) stream, atomically."""
+    header = json.dumps({"docs": source.n, "patients": source.patients, "admissions": source.admissions,
+                         "categories": source.categories}, separators=(",", ":")).encode("utf-8")
+    terms = {}
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(MAGIC)
+        fh.write(struct.pack("<I", len(header)))
+        fh.write(header)
+        fh.write(bytes(source.ids))
+        for name, _ in COLUMNS:
+            getattr(source, name).tofile(fh)
+        offset = 0
+        for term, blob, df in term_lists:
+            terms[term] = [offset, len(blob), df]
+            fh.write(blob)
+            offset += len(blob)
+        table = json.dumps(terms, separators=(",", ":")).encode("utf-8")
+        table_offset = fh.tell()
+        fh.write(table)
+        fh.write(struct.pack("<QQ", table_offset, len(table)))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def _merge(path: str, segments: List[_Segment], deleted: List[Set[int]]):
+    """Merges segments into one file, dropping deleted notes and renumbering the rest."""
+    merged = _MemSegment()
+    remaps = []
+    for seg, gone in zip(segments, deleted):
+        remap = array("l", [-1]) * seg.n
+        for docno in range(seg.n):
+            if docno in gone:
+                continue
+            remap[docno] = merged.n
+            merged.ids += seg.ids[docno * 12:docno * 12 + 12]
+            merged.patient.append(merged._code(merged.patients, merged._codes[0], seg.patients[seg.patient[docno]]))
+            merged.admission.append(merged._code(merged.admissions, merged._codes[1], seg.admissions[seg.admission[docno]]))
+            merged.category.append(merged._code(merged.categories, merged._codes[2], seg.categories[seg.category[docno]]))
+            merged.time.append(seg.time[docno])
+            merged.length.append(seg.length[docno])
+        remaps.append(remap)
+
+    def term_lists():
+        # docnos grow across segments in order, so deltas stay non-negative
+        for term in sorted(set().union(*(seg.terms for seg in segments))):
+            out, prev, df = bytearray(), 0, 0
+            for seg, remap in zip(segments, remaps):
+                for docno, tf in seg.read(term):
+                    new = remap[docno]
+                    if new < 0:
+                        continue
+                    _put_varint(out, new - prev)
+                    _put_varint(out, tf)
+                    prev, df = new, df + 1
+            if df:
+                yield term, out, df
+
+    _write_segment(path, merged, term_lists())
+
+# -------------------- Snippets --------------------
+
+_WORD = re.compile(r"\S+")
+
+def snippet(text: str, terms: Set[str], width: int = SNIPPET_WORDS) -> str:
+    """The `width`-word window of `text` with the most query terms, with those terms in **bold**."""
+    words = _WORD.findall(text or "")
+    hits = [i for i, w in enumerate(words) if any(_stem(t) in terms for t in _TOKEN.findall(w.lower()))]
+    start = 0
+    if hits:
+        best, first = 0, 0
+        for i in range(len(hits)):
+            while hits[i] - hits[first] >= width:
+                first += 1
+            if i - first + 1 > best:
+                best, start = i - first + 1, hits[first]
+        # a little lead-in before the first hit
+        start = max(0, min(start - 4, len(words) - width))
+    marked = set(hits)
+    out = " ".join(f"**{w}**" if i in marked else w for i, w in enumerate(words[start:start + width], start))
+    return ("… " if start > 0 else "") + out + (" …" if start + width < len(words) else "")
+
+# -------------------- Index --------------------
+
+class NotesIndex:
+    def __init__(self, path: str = NOTES_INDEX_DIR, flush_docs: int = NOTES_INDEX_FLUSH_DOCS,
+                 flush_interval: float = NOTES_INDEX_FLUSH_INTERVAL, max_segments: int = NOTES_INDEX_MAX_SEGMENTS,
+                 poll_interval: float = NOTES_INDEX_POLL_INTERVAL):
+        self.path = path
+        self.flush_docs = flush_docs
+        self.flush_interval = flush_interval
+        self.max_segments = max_segments
+        self.poll_interval = poll_interval
+        self.mode = "offline"
+        self.caught_up = False
+        self.merges = 0
+        self.last_flush_ms = None
+        self.last_merge_ms = None
+        self.checkpoint: Optional[ObjectId] = None  # largest note _id indexed
+        self._disk_checkpoint: Optional[ObjectId] = None  # ... and written to a segment file
+        self.segments: List[_Segment] = []
+        self.mem = _MemSegment()
+        self._seq = 0
+        self._merge_log: Optional[list] = None  # notes deleted while a merge runs
+        # searches run in worker threads and maintenance in others; every
+        # read and write of segments/mem holds this lock except the merge
+        # write itself, which only reads immutable files
+        self._lock = threading.RLock()
+        self._tasks = []
+        self.writer = False  # holds the directory's writer lock
+        self._writer_lock = None
+        self._manifest_version = None
+
+        metrics.REGISTRY.gauge("chatbot_notes_index_docs", "Live notes in the BM25 notes index.",
+                               fn=lambda: self.live())
+        metrics.REGISTRY.gauge("chatbot_notes_index_segments", "Segment files in the BM25 notes index.",
+                               fn=lambda: len(self.segments))
+
+    # --- persistence ---
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, "manifest.json")
+
+    def load(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._lock_writer()
+        self.reload()
+        logger.info("[NOTES] Loaded %d segments (%d notes) from %s as the %s", len(self.segments), self.live(),
+                    self.path, "writer" if self.writer else "reader")
+
+    def reload(self) -> bool:
+        """Opens the segments of the manifest on disk if it changed since the last load; True if it did."""
+        try:
+            fh = open(self._manifest_path(), encoding="utf-8")
+        except FileNotFoundError:
+            return False
+        with fh:
+            st = os.fstat(fh.fileno())
+            version = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if version == self._manifest_version:
+                return False
+            manifest = json.load(fh)
+        with self._lock:
+            current = {seg.name: seg for seg in self.segments}
+            segments = []
+            try:
+                for name in manifest["segments"]:
+                    path = os.path.join(self.path, name)
+                    seg = current.get(name)
+                    if seg is None or seg.ino != os.stat(path).st_ino:
+                        seg = _Segment(path)
+                    segments.append(seg)
+            except FileNotFoundError:
+                # merged away since this manifest was written; the next one lists the merged segment
+                for seg in segments:
+                    if seg is not current.get(seg.name):
+                        seg.close()
+                return False
+            for seg in segments:
+                for docno in manifest["deleted"].get(seg.name, ()):
+                    seg.delete(docno)
+            for seg in self.segments:
+                if seg not in segments:
+                    seg.close()
+            self.segments = segments
+            self._seq = manifest["seq"]
+            self.checkpoint = ObjectId(manifest["checkpoint"]) if manifest.get("checkpoint") else None
+            self._disk_checkpoint = self.checkpoint
+            if not self.writer:
+                self.caught_up = manifest.get("caughtUp", False)
+            self._manifest_version = version
+        return True
+
+    def _save_manifest(self):
+        # the checkpoint only covers what is on disk; notes still in memory are re-read after a crash
+        manifest = {
+            "segments": [seg.name for seg in self.segments],
+            "deleted": {seg.name: sorted(seg.deleted) for seg in self.segments if seg.deleted},
+            "seq": self._seq,
+            "checkpoint": str(self._disk_checkpoint) if self._disk_checkpoint else None,
+            "caughtUp": self.caught_up,
+        }
+        tmp = self._manifest_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh)
+        os.replace(tmp, self._manifest_path())
+
+    def _lock_writer(self) -> bool:
+        """Takes the directory's writer lock unless another process holds it; True if this index is the writer."""
+        if self.writer:
+            return True
+        fh = open(os.path.join(self.path, LOCK_FILE), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                fh.close()
+                return False
+        self._writer_lock = fh
+        self.writer = True
+        return True
+
+    def _unlock_writer(self):
+        if self._writer_lock is not None:
+            self._writer_lock.close()  # closing the file releases the lock
+            self._writer_lock = None
+        self.writer = False
+
+    def _next_path(self) -> str:
+        self._seq += 1
+        return os.path.join(self.path, f"seg-{self._seq:06d}.nix")
+
+    def flush(self) -> bool:
+        """Writes the in-memory segment to disk. Returns True when a merge is due."""
+        with self._lock:
+            if self.mem.n:
+                t0 = time.perf_counter()
+                path = self._next_path()
+                _write_segment(path, self.mem, self.mem.term_lists())
+                seg = _Segment(path)
+                for docno in self.mem.deleted:
+                    seg.delete(docno)
+                self.segments.append(seg)
+                self.mem = _MemSegment()
+                self.last_flush_ms = round((time.perf_counter() - t0) * 1000, 2)
+                logger.debug("[NOTES] Flushed %s (%d notes) in %sms", seg.name, seg.n, self.last_flush_ms)
+            self._disk_checkpoint = self.checkpoint
+            self._save_manifest()
+            return len(self.segments) > self.max_segments
+
+    def merge(self):
+        """Merges every current segment into one; safe to run while notes are added and searched."""
+        t0 = time.perf_counter()
+        with self._lock:
+            inputs = list(self.segments)
+            if len(inputs) < 2:
+                return
+            deleted = [set(seg.deleted) for seg in inputs]
+            path = self._next_path()
+            self._merge_log = []
+        try:
+            _merge(path, inputs, deleted)
+        except Exception:
+            with self._lock:
+                self._merge_log = None
+            raise
+        with self._lock:
+            merged = _Segment(path)
+            for oid in self._merge_log:
+                docno = merged.find(oid)
+                if docno is not None:
+                    merged.delete(docno)
+            self._merge_log = None
+            self.segments = [merged] + [seg for seg in self.segments if seg not in inputs]
+            # flushing too keeps the manifest's deletions and checkpoint consistent with what is on disk
+            self.flush()
+            for seg in inputs:
+                seg.close()
+                os.remove(seg.path)
+        self.merges += 1
+        self.last_merge_ms = round((time.perf_counter() - t0) * 1000, 2)
+        logger.info("[NOTES] Merged %d segments into %s (%d notes) in %sms",
+                    len(inputs), merged.name, merged.n, self.last_merge_ms)
+
+    # --- updates ---
+    def _locate(self, oid: bytes):
+        docno = self.mem.find(oid)
+        if docno is not None:
+            return self.mem, docno
+        for seg in self.segments:
+            docno = seg.find(oid)
+            if docno is not None:
+                return seg, docno
+        return None, None
+
+    def _delete(self, oid: bytes) -> bool:
+        seg, docno = self._locate(oid)
+        if seg is None:
+            return False
+        seg.delete(docno)
+        if self._merge_log is not None and seg is not self.mem:
+            self._merge_log.append(oid)
+        return True
+
+    def add(self, doc: dict, replace: bool = False) -> bool:
+        """
+        Indexes one note. An already-indexed note is skipped unless `replace`
+        (an edit), in which case the old version is deleted first.
+        """
+        oid = doc.get("_id")
+        if not isinstance(oid, ObjectId):
+            return False
+        raw = oid.binary
+        with self._lock:
+            # notes past the checkpoint are new; only earlier ones can already be indexed
+            if self.checkpoint is not None and oid <= self.checkpoint:
+                if self._locate(raw)[0] is not None:
+                    if not replace:
+                        return False
+                    self._delete(raw)
+                    INDEXED_NOTES.inc(op="replace")
+                else:
+                    INDEXED_NOTES.inc(op="add")
+            else:
+                INDEXED_NOTES.inc(op="add")
+                self.checkpoint = oid
+            self.mem.add(raw, doc)
+        return True
+
+    def add_many(self, docs: Iterable[dict], replace: bool = False) -> int:
+        return sum(self.add(doc, replace) for doc in docs)
+
+    def delete(self, oid) -> bool:
+        if not isinstance(oid, ObjectId):
+            return False
+        with self._lock:
+            found = self._delete(oid.binary)
+        if found:
+            INDEXED_NOTES.inc(op="delete")
+        return found
+
+    # --- search ---
+    def live(self) -> int:
+        return self.mem.live + sum(seg.live for seg in self.segments)
+
+    def search(self, query: str, patient_id: Optional[str] = None, admission_id: Optional[str] = None,
+               start=None, end=None, category: Optional[str] = None, limit: int = 10) -> List[dict]:
+        """
+        Top `limit` live notes by BM25 score for `query`, restricted to a
+        patient / admission / category and a [start, end) charttime range.
+        Without query terms, lists the newest notes matching the filters
+        (a patient or admission filter is then required).
+        """
+        t0 = time.perf_counter()
+        terms = query_terms(query)
+        lo = _epoch(start) if start is not None else -math.inf
+        hi = _epoch(end) if end is not None else math.inf
+        dated = start is not None or end is not None
+        filters = [term for term in (patient_id and _patient_term(patient_id),
+                                     admission_id and _admission_term(admission_id)) if term]
+        if not terms and not filters:
+            return []
+        limit = max(1, min(limit, MAX_LIMIT))
+        hits = []
+        with self._lock:
+            segments = self.segments + [self.mem]
+            n = self.live()
+            avgdl = sum(seg.live_length for seg in segments) / n if n else 1.0
+            weights = {}
+            for term in terms:
+                df = sum(seg.df(term) for seg in segments)
+                if df:
+                    weights[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            if len(weights) > 1:
+                # terms in most notes add almost nothing to the score but cost the most to decode
+                common = [t for t in weights if sum(seg.df(t) for seg in segments) > n / 2]
+                for term in common[:len(weights) - 1]:
+                    del weights[term]
+            if terms and not weights:
+                return []
+
+            for si, seg in enumerate(segments):
+                allowed = None
+                for term in filters:
+                    docs = {docno for docno, _ in seg.read(term)}
+                    allowed = docs if allowed is None else allowed & docs
+                if allowed is not None and not allowed:
+                    continue
+                wanted_category = None
+                if category:
+                    lowered = [c.lower() for c in seg.categories]
+                    if category.lower() not in lowered:
+                        continue
+                    wanted_category = lowered.index(category.lower())
+
+                def keep(docno):
+                    if docno in seg.deleted or (wanted_category is not None and seg.category[docno] != wanted_category):
+                        return False
+                    t = seg.time[docno]
+                    return not dated if math.isnan(t) else lo <= t < hi
+
+                if not weights:
+                    hits += [(seg.time[d] if not math.isnan(seg.time[d]) else -math.inf, si, d) for d in allowed if keep(d)]
+                    continue
+                scores = {}
+                lengths, base, per_token = seg.length, K1 * (1 - B), K1 * B / avgdl
+                for term, idf in weights.items():
+                    postings = seg.read(term)
+                    if allowed is not None:
+                        postings = [p for p in postings if p[0] in allowed]
+                    gain, get = idf * (K1 + 1), scores.get
+                    for docno, tf in postings:
+                        scores[docno] = get(docno, 0.0) + gain * tf / (tf + base + per_token * lengths[docno])
+                # best first, so the date/category/deleted checks stop after `limit` survivors
+                kept = 0
+                for docno, score in sorted(scores.items(), key=itemgetter(1), reverse=True):
+                    if keep(docno):
+                        hits.append((score, si, docno))
+                        kept += 1
+                        if kept == limit:
+                            break
+
+            top = heapq.nlargest(limit, hits)
+            results = []
+            for score, si, docno in top:
+                seg = segments[si]
+                hit = {"_id": seg.oid(docno), **seg.meta(docno)}
+                if weights:
+                    hit["score"] = round(score, 3)
+                results.append(hit)
+        SEARCH_SECONDS.observe(time.perf_counter() - t0)
+        return results
+
+    async def find(self, query: str, patient_id: Optional[str] = None, admission_id: Optional[str] = None,
+                   start=None, end=None, category: Optional[str] = None, limit: int = 10) -> List[dict]:
+        """search() plus a highlighted snippet from each matching note's current text."""
+        hits = await asyncio.to_thread(self.search, query, patient_id, admission_id, start, end, category, limit)
+        if not hits:
+            return []
+        notes = {note["_id"]: note for note in await mongo.get_notes_by_ids([hit["_id"] for hit in hits])}
+        terms = set(query_terms(query))
+        results = []
+        for hit in hits:
+            note = notes.get(hit.pop("_id"))
+            if note is None:  # deleted since it was indexed
+                continue
+            hit["note_id"] = str(note["_id"])
+            hit["description"] = note.get("description")
+            hit["snippet"] = snippet(note.get("text") or "", terms)
+            results.append(hit)
+        return results
+
+    # --- maintenance ---
+    async def catch_up(self, batch: int = 500) -> int:
+        """Indexes every note with an _id past the checkpoint."""
+        added, docs = 0, []
+        async for doc in mongo.iter_records("noteevents", {}, mongo.PROJECTIONS["notes"],
+                                            after=self.checkpoint, batch_size=1000):
+            docs.append(doc)
+            if len(docs) >= batch:
+                added += await asyncio.to_thread(self.add_many, docs)
+                docs = []
+                if self.mem.n >= self.flush_docs:
+                    await self._flush()
+        if docs:
+            added += await asyncio.to_thread(self.add_many, docs)
+        if added:
+            logger.info("[NOTES] Caught up %d notes (checkpoint %s)", added, self.checkpoint)
+        return added
+
+    async def _flush(self):
+        if await asyncio.to_thread(self.flush):
+            await asyncio.to_thread(self.merge)
+
+    async def _apply(self, change: dict):
+        op = change.get("operationType")
+        if op == "delete":
+            await asyncio.to_thread(self.delete, (change.get("documentKey") or {}).get("_id"))
+        elif change.get("fullDocument") is not None:
+            await asyncio.to_thread(self.add, change["fullDocument"], op != "insert")
+        if self.mem.n >= self.flush_docs:
+            await self._flush()
+
+    async def _follow(self):
+        db = mongo.get_db()
+        while True:
+            try:
+                # open the stream before catching up so nothing inserted in between is missed
+                async with db.noteevents.watch(full_document="updateLookup") as stream:
+                    self.mode = "change_stream"
+                    await self.catch_up()
+                    self.caught_up = True
+                    async for change in stream:
+                        await self._apply(change)
+            except OperationFailure as e:
+                logger.info("[NOTES] Change streams unavailable (%s); polling every %ss.", e, self.poll_interval)
+                await self._poll()
+                return
+            except PyMongoError as e:
+                logger.warning("[NOTES] Change stream dropped: %s", e)
+                self.mode = "offline"
+                await asyncio.sleep(self.poll_interval)
+
+    async def _poll(self):
+        """New notes by _id, edited ones by updatedAt (when the writer sets it); deletes need --rebuild."""
+        self.mode = "delta_poll"
+        coll = mongo.get_db().noteevents
+        newest = await coll.find_one({"updatedAt": {"$exists": True}}, {"updatedAt": 1}, sort=[("updatedAt", DESCENDING)])
+        last_updated = newest["updatedAt"] if newest else datetime.utcnow()
+        while True:
+            try:
+                await self.catch_up()
+                self.caught_up = True
+                edited = []
+                async for doc in coll.find({"updatedAt": {"$gt": last_updated}}, {**mongo.PROJECTIONS["notes"], "updatedAt": 1}) \
+                        .sort("updatedAt", ASCENDING).limit(10000):
+                    last_updated = max(last_updated, doc["updatedAt"])
+                    edited.append(doc)
+                if edited:
+                    await asyncio.to_thread(self.add_many, edited, True)
+            except PyMongoError as e:
+                logger.warning("[NOTES] Delta poll failed: %s", e)
+            await asyncio.sleep(self.poll_interval)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                if self.mem.n or self.mem.deleted or any(seg.deleted for seg in self.segments):
+                    await self._flush()
+            except OSError as e:
+                logger.warning("[NOTES] Flush failed: %s", e)
+
+    async def _follow_writer(self):
+        """Reader: picks up the writer's flushes and merges, and takes over if the writer's process exits."""
+        self.mode = "reader"
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                if self._lock_writer():
+                    await asyncio.to_thread(self.reload)
+                    logger.info("[NOTES] Took over as the index writer")
+                    self.caught_up = False
+                    self._tasks += [asyncio.create_task(self._follow()), asyncio.create_task(self._flush_loop())]
+                    return
+                await asyncio.to_thread(self.reload)
+            except (OSError, ValueError) as e:
+                logger.warning("[NOTES] Reload failed: %s", e)
+
+    def start(self):
+        if self._tasks:
+            return
+        if self.writer:
+            self._tasks = [asyncio.create_task(self._follow()), asyncio.create_task(self._flush_loop())]
+        else:
+            self._tasks = [asyncio.create_task(self._follow_writer())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.writer:
+            await asyncio.to_thread(self.flush)
+            self._unlock_writer()
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "writer": self.writer,
+            "caughtUp": self.caught_up,
+            "notes": self.live(),
+            "unflushed": self.mem.n,
+            "segments": len(self.segments),
+            "checkpoint": str(self.checkpoint) if self.checkpoint else None,
+            "merges": self.merges,
+            "lastFlushMs": self.last_flush_ms,
+            "lastMergeMs": self.last_merge_ms,
+        }
+
+# -------------------- CLI --------------------
+
+async def rebuild(path: str = NOTES_INDEX_DIR) -> NotesIndex:
+    """Builds the index from scratch into `path` (replacing what is there)."""
+    os.makedirs(path, exist_ok=True)
+    index = NotesIndex(path)
+    if not index._lock_writer():
+        raise RuntimeError(f"{path} is in use by a running service; stop it before rebuilding")
+    for name in os.listdir(path):
+        if name != LOCK_FILE:
+            entry = os.path.join(path, name)
+            shutil.rmtree(entry) if os.path.isdir(entry) else os.remove(entry)
+    index.load()
+    t0 = time.perf_counter()
+    await index.catch_up()
+    index.flush()
+    index.merge()
+    logger.info("[NOTES] Rebuilt index of %d notes in %.1fs", index.live(), time.perf_counter() - t0)
+    return index
+
+async def _cli(args):
+    if args.rebuild:
+        index = await rebuild()
+        print(f"indexed {index.live()} notes into {index.path}")
+    else:
+        index = NotesIndex()
+        index.load()
+    if args.search is not None:
+        t0 = time.perf_counter()
+        hits = await index.find(args.search, args.patient, args.admission, limit=args.limit)
+        print(f"{len(hits)} hits in {(time.perf_counter() - t0) * 1000:.1f}ms")
+        for hit in hits:
+            print(f"- {hit['note_id']} {hit['patient_id']}/{hit['admission_id']} {hit['charttime']} "
+                  f"[{hit['category']}] score={hit.get('score')}\n  {hit['snippet']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the BM25 notes index.")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the index from every note")
+    parser.add_argument("--search", help="query to run against the index")
+    parser.add_argument("--patient", help="restrict --search to a patient_id")
+    parser.add_argument("--admission", help="restrict --search to an admission_id")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+    if not args.rebuild and args.search is None:
+        parser.error("pass --rebuild and/or --search")
+    asyncio.run(_cli(args))
+    mongo.close_client()
@@ -0,0 +1,268 @@
+"""
+In-memory bed occupancy for the bed_occupancy, ward_overview, ICU_patients
+and room_availability intents.
+
+Current admissions (no dischtime) are loaded once at startup into a map
+keyed by the admission document's _id; per-ward and per-bed-type counts are
+derived from it. Admission change events (admit, ward transfer, discharge,
+delete) are applied to the map as they arrive. A periodic reconciliation
+rebuilds the map from the source and logs any drift. Every mutation
+is synchronous on the event loop, so readers never see a half-applied
+event, and events that arrive while a reconciliation scan is running are
+replayed onto the fresh map before it is swapped in.
+
+Ward capacities come from WARD_CAPACITY (e.g. "ICU=20,HDU=12"); wards
+without a capacity report occupancy but not availability.
+
+Assumes admission documents carry `ward` and `status` fields alongside
+dischtime. Nothing in the repo defines them: a missing status counts as
+admitted and a missing ward as "Unassigned".
+"""
+
+import time
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional
+
+from pymongo.errors import PyMongoError, OperationFailure
+
+import mongo
+import metrics
+from config import WARD_CAPACITY, OCCUPANCY_RECONCILE_INTERVAL, OCCUPANCY_POLL_INTERVAL
+
+# -------------------- Logging Setup --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+if not logger.handlers:
+    handler = logging.FileHandler("logs/chatbot.log", encoding="utf-8")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+INTENTS = ("bed_occupancy", "ward_overview", "ICU_patients", "room_availability")
+
+# ward-name keyword -> bed type, first match wins
+BED_TYPES = (
+    ("icu", "ICU"),
+    ("hdu", "HDU"),
+    ("semi-private", "Semi-private room"),
+    ("private", "Private room"),
+    ("day care", "Day care"),
+)
+CRITICAL_CARE = ("ICU", "HDU")
+MAX_LISTED_PATIENTS = 25
+
+OCCUPANCY_DRIFT = metrics.REGISTRY.counter(
+    "chatbot_occupancy_drift_total",
+    "Admissions whose in-memory occupancy state disagreed with the source at reconciliation.",
+)
+
+def bed_type(ward: str) -> str:
+    name = (ward or "").lower()
+    for keyword, kind in BED_TYPES:
+        if keyword in name:
+            return kind
+    return "General"
+
+def _entry(doc: dict) -> Optional[dict]:
+    """Occupancy state for one admission document, or None if it holds no bed."""
+    if doc.get("dischtime") or (doc.get("status") or "admitted").lower() != "admitted":
+        return None
+    ward = doc.get("ward") or "Unassigned"
+    return {"patient_id": doc.get("patient_id"), "admission_id": doc.get("admission_id"),
+            "ward": ward, "bed_type": bed_type(ward), "admittime": doc.get("admittime")}
+
+# -------------------- Aggregator --------------------
+
+class OccupancyAggregator:
+    def __init__(self, capacity: Dict[str, int] = WARD_CAPACITY,
+                 reconcile_interval: float = OCCUPANCY_RECONCILE_INTERVAL, poll_interval: float = OCCUPANCY_POLL_INTERVAL):
+        self.capacity = dict(capacity)
+        self.reconcile_interval = reconcile_interval
+        self.poll_interval = poll_interval
+        self.mode = "schedule"
+        self.events = 0
+        self.reconciles = 0
+        self.last_drift = 0
+        self.last_reconcile_ms = None
+        self.loaded = False
+        self._current: Dict[object, dict] = {}  # admission _id -> entry
+        self._by_ward = Counter()
+        self._by_type = Counter()
+        self._replay = None  # events seen during a reconciliation scan
+        self._tasks = []
+
+        metrics.REGISTRY.gauge("chatbot_ward_occupied_beds", "Occupied beds per ward (in-memory occupancy).",
+                               ("ward",), fn=lambda: dict(self._by_ward))
+
+    # --- incremental updates ---
+    def _set(self, key, entry: Optional[dict]):
+        old = self._current.pop(key, None)
+        if old:
+            self._by_ward[old["ward"]] -= 1
+            self._by_type[old["bed_type"]] -= 1
+        if entry:
+            self._current[key] = entry
+            self._by_ward[entry["ward"]] += 1
+            self._by_type[entry["bed_type"]] += 1
+        self._by_ward += Counter()  # drop wards that emptied
+        self._by_type += Counter()
+
+    def apply(self, key, doc: Optional[dict]):
+        """Applies one admission's latest state (None = deleted). Idempotent."""
+        self.events += 1
+        self._set(key, _entry(doc) if doc else None)
+        if self._replay is not None:
+            self._replay.append((key, doc))
+
+    def apply_change(self, change: dict):
+        key = (change.get("documentKey") or {}).get("_id")
+        if key is None:
+            return
+        if change.get("operationType") == "delete":
+            self.apply(key, None)
+        elif change.get("fullDocument") is not None:
+            self.apply(key, change["fullDocument"])
+
+    # --- reconciliation ---
+    async def reconcile(self) -> int:
+        t0 = time.perf_counter()
+        self._replay = []
+        try:
+            fresh = {}
+            async for doc in mongo.iter_current_admissions():
+                entry = _entry(doc)
+                if entry:
+                    fresh[doc["_id"]] = entry
+            for key, doc in self._replay:
+                entry = _entry(doc) if doc else None
+                if entry:
+                    fresh[key] = entry
+                else:
+                    fresh.pop(key, None)
+        finally:
+            self._replay = None
+
+        drift = 0
+        if self.loaded:
+            drift = sum(1 for k in fresh.keys() | self._current.keys() if fresh.get(k) != self._current.get(k))
+            if drift:
+                OCCUPANCY_DRIFT.inc(drift)
+                logger.warning("[OCCUPANCY] Reconciliation corrected %d admissions", drift)
+        self._current = fresh
+        self._by_ward = Counter(e["ward"] for e in fresh.values())
+        self._by_type = Counter(e["bed_type"] for e in fresh.values())
+        self.loaded = True
+        self.reconciles += 1
+        self.last_drift = drift
+        self.last_reconcile_ms = round((time.perf_counter() - t0) * 1000, 2)
+        logger.debug("[OCCUPANCY] Reconciled %d occupied beds in %sms", len(fresh), self.last_reconcile_ms)
+        return drift
+
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval if self.mode == "change_stream" else self.poll_interval)
+            try:
+                await self.reconcile()
+            except PyMongoError as e:
+                logger.warning("[OCCUPANCY] Reconciliation failed: %s", e)
+
+    async def _watch(self):
+        db = mongo.get_db()
+        while True:
+            try:
+                async with db.admissions.watch(full_document="updateLookup") as stream:
+                    self.mode = "change_stream"
+                    async for change in stream:
+                        self.apply_change(change)
+            except OperationFailure as e:
+                logger.info("[OCCUPANCY] Change streams unavailable (%s); reconciling every %ss.", e, self.poll_interval)
+                self.mode = "schedule"
+                return
+            except PyMongoError as e:
+                logger.warning("[OCCUPANCY] Change stream dropped: %s", e)
+                self.mode = "schedule"
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._reconcile_loop()), asyncio.create_task(self._watch())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # --- reads ---
+    def wards(self) -> list:
+        names = set(self._by_ward) | set(self.capacity)
+        rows = []
+        for ward in sorted(names, key=lambda w: (-self._by_ward.get(w, 0), w)):
+            occupied, capacity = self._by_ward.get(ward, 0), self.capacity.get(ward)
+            rows.append({"ward": ward, "bed_type": bed_type(ward), "occupied": occupied, "capacity": capacity,
+                         "available": max(capacity - occupied, 0) if capacity is not None else None})
+        return rows
+
+    def answer(self, intent: str, ward: Optional[str] = None) -> Optional[str]:
+        """Rendered answer for one of INTENTS, or None before the first load."""
+        if not self.loaded:
+            return None
+        rows = self.wards()
+        if ward:
+            rows = [r for r in rows if ward.lower() in r["ward"].lower()] or rows
+        total = sum(r["occupied"] for r in rows)
+
+        if intent == "ICU_patients":
+            now = datetime.utcnow()
+            patients = sorted((e for e in self._current.values() if e["bed_type"] in CRITICAL_CARE),
+                              key=lambda e: e["admittime"] or now)
+            if not patients:
+                return "🏥 No patients are currently in ICU/HDU."
+            lines = [f"🏥 {len(patients)} patients in ICU/HDU:"]
+            for e in patients[:MAX_LISTED_PATIENTS]:
+                stay = f", day {(now - e['admittime']).days + 1}" if isinstance(e["admittime"], datetime) else ""
+                lines.append(f"• {e['patient_id']} — {e['ward']} (admission {e['admission_id']}{stay})")
+            if len(patients) > MAX_LISTED_PATIENTS:
+                lines.append(f"• +{len(patients) - MAX_LISTED_PATIENTS} more")
+            return "\n".join(lines)
+
+        if intent == "room_availability":
+            known = [r for r in rows if r["capacity"] is not None]
+            if not known:
+                return "🛏️ Ward capacities aren't configured, so availability is unknown. " \
+                       f"{total} beds are currently occupied."
+            lines = [f"🛏️ {sum(r['available'] for r in known)} beds available:"]
+            lines += [f"• {r['ward']}: {r['available']} free of {r['capacity']}" for r in known]
+            return "\n".join(lines)
+
+        if intent == "bed_occupancy":
+            lines = [f"🛏️ {total} beds occupied."]
+            by_type = Counter()
+            for r in rows:
+                by_type[r["bed_type"]] += r["occupied"]
+            for kind, n in by_type.most_common():
+                if n:
+                    lines.append(f"• {kind}: {n}")
+            return "\n".join(lines)
+
+        # ward_overview
+        lines = [f"🏥 Ward overview ({total} occupied):"]
+        for r in rows:
+            cap = f" / {r['capacity']} ({r['occupied'] * 100 // r['capacity']}%)" if r["capacity"] else ""
+            lines.append(f"• {r['ward']} [{r['bed_type']}]: {r['occupied']}{cap}")
+        return "\n".join(lines)
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "loaded": self.loaded,
+            "occupied": len(self._current),
+            "byBedType": dict(self._by_type),
+            "events": self.events,
+            "reconciles": self.reconciles,
+            "lastDrift": self.last_drift,
+            "lastReconcileMs": self.last_reconcile_ms,
+        }
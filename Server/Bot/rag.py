@@ -6,6 +6,8 @@ import json
 import logging
 import hashlib
 from openai import AzureOpenAI
+import metrics
+import tracing
 from config import (
     AZURE_OPENAI_API_KEY,
     AZURE_OPENAI_ENDPOINT,
@@ -97,14 +99,18 @@ Instructions:
 """.strip()
 
 # ---------------------- GPT Inference ----------------------
-def generate_response(user_query: str, context_data) -> str:
+def generate_response(user_query: str, context_data, on_token=None) -> str:
     """
     Runs full RAG pipeline: context → prompt → GPT → response.
+    If on_token is given, the completion is streamed and each text delta is
+    passed to it as it arrives (from the calling thread); the full answer is
+    still returned.
     """
     try:
         logger.debug("[RAG] Serializing context for prompt...")
-        context = serialize_context(context_data)
-        prompt = build_prompt(user_query, context)
+        with tracing.span("serialization", stage="serialization"):
+            context = serialize_context(context_data)
+            prompt = build_prompt(user_query, context)
 
         prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()[:10]
         logger.debug(f"[RAG] Prompt hash: {prompt_hash} | Length: {len(prompt)}")
@@ -112,22 +118,34 @@ def generate_response(user_query: str, context_data) -> str:
         if not client:
             raise RuntimeError("Azure GPT client is not available.")
 
-        response = client.chat.completions.create(
-            model=AZURE_OPENAI_DEPLOYMENT,
-            messages=[
-                {"role": "system", "content": "You are a factual, helpful, and concise medical assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=350,
-            n=1,
-        )
+        with tracing.span("llm.generation", stage="llm"):
+            response = client.chat.completions.create(
+                model=AZURE_OPENAI_DEPLOYMENT,
+                messages=[
+                    {"role": "system", "content": "You are a factual, helpful, and concise medical assistant."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7,
+                max_tokens=350,
+                n=1,
+                stream=on_token is not None,
+            )
+            if on_token is None:
+                result = response.choices[0].message.content.strip()
+            else:
+                parts = []
+                for chunk in response:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        on_token(delta)
+                result = "".join(parts).strip()
 
-        result = response.choices[0].message.content.strip()
         logger.debug("[RAG] ✅ Response generated. Tokens used: ~%d", len(result.split()))
         return result
 
     except Exception as e:
+        metrics.LLM_FAILURES.inc()
         logger.exception("[RAG] GPT-4 call failed.")
         return (
             "⚠️ A system error occurred while generating the answer. "
@@ -0,0 +1,248 @@
+"""
+Incrementally maintained `patient_summaries` materialized view.
+
+One small document per patient (keyed by patient_id) with demographics,
+active/recent admissions, latest diagnoses, current medications, recent
+labs and an excerpt of the last note, so the patient_info intent reads one
+document instead of six paged queries.
+
+Changes to the source collections mark the affected patient dirty; a worker
+rebuilds dirty patients in small debounced batches. Change streams
+(fullDocument=updateLookup) are used when available; otherwise a delta job
+polls each source collection for documents newer than the last seen _id or
+updatedAt. Patients never touched since deploy are filled lazily on first
+read, or in bulk with the CLI:
+
+    python summaries.py --rebuild             # every patient
+    python summaries.py --rebuild --limit 1000
+"""
+
+import time
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+from typing import Optional
+
+from pymongo import ASCENDING, DESCENDING, ReplaceOne
+from pymongo.errors import PyMongoError, OperationFailure
+
+import mongo
+import metrics
+from config import SUMMARY_DEBOUNCE_MS, SUMMARY_POLL_INTERVAL, SUMMARY_BATCH
+
+# -------------------- Logging Setup --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+if not logger.handlers:
+    handler = logging.FileHandler("logs/chatbot.log", encoding="utf-8")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+SUMMARY_COLLECTION = "patient_summaries"
+SOURCE_COLLECTIONS = ("patients", "admissions", "prescriptions", "diagnosis_icd", "application", "noteevents")
+
+RECENT_ADMISSIONS = 3
+LATEST_DIAGNOSES = 8
+CURRENT_MEDICATIONS = 15
+RECENT_LABS = 10
+NOTE_EXCERPT_CHARS = 400
+
+SUMMARY_REBUILDS = metrics.REGISTRY.counter(
+    "chatbot_patient_summary_rebuilds_total",
+    "patient_summaries documents rebuilt, by trigger (change, delta, lazy, backfill).",
+    ("trigger",),
+)
+
+# -------------------- Building --------------------
+
+def _newest(collection: str, query: dict, projection: dict, limit: int):
+    # newest first along the existing <key>_1__id_1 indexes (no in-memory sort)
+    return mongo.get_db()[collection].find(query, projection).sort("_id", DESCENDING).limit(limit).to_list(length=limit)
+
+def _slim(doc: dict, fields: tuple) -> dict:
+    return {f: doc.get(f) for f in fields if doc.get(f) is not None}
+
+async def build_summary(pid: str) -> Optional[dict]:
+    db = mongo.get_db()
+    patient = await db.patients.find_one({"patient_id": pid}, mongo.PROJECTIONS["patient"])
+    if not patient:
+        return None
+
+    admissions, labs, notes = await asyncio.gather(
+        _newest("admissions", {"patient_id": pid}, mongo.PROJECTIONS["admissions"], RECENT_ADMISSIONS + 5),
+        _newest("application", {"patient_id": pid}, mongo.PROJECTIONS["lab_applications"], RECENT_LABS),
+        _newest("noteevents", {"patient_id": pid}, mongo.PROJECTIONS["notes"], 1),
+    )
+    active = [a for a in admissions if not a.get("dischtime")]
+    focus = active[0] if active else (admissions[0] if admissions else None)
+
+    diagnoses, medications = [], []
+    if focus and focus.get("admission_id"):
+        aid = focus["admission_id"]
+        diagnoses, prescriptions = await asyncio.gather(
+            _newest("diagnosis_icd", {"admission_id": aid}, mongo.PROJECTIONS["diagnoses"], LATEST_DIAGNOSES),
+            _newest("prescriptions", {"admission_id": aid}, mongo.PROJECTIONS["prescriptions"], 100),
+        )
+        now = datetime.utcnow()
+        medications = [p for p in prescriptions
+                       if not p.get("enddate") or not isinstance(p["enddate"], datetime) or p["enddate"] >= now]
+        # a discharged admission has no "current" meds; keep its discharge list for context
+        medications = (medications if active else prescriptions)[:CURRENT_MEDICATIONS]
+
+    admission_fields = ("admission_id", "admittime", "dischtime", "admission_type", "ward", "diagnosis", "status")
+    last_note = notes[0] if notes else None
+    return {
+        "_id": pid,
+        "patient_id": pid,
+        "name": patient.get("name"),
+        "demographics": _slim(patient, ("dob", "gender", "contact", "address")),
+        "activeAdmissions": [_slim(a, admission_fields) for a in active],
+        "recentAdmissions": [_slim(a, admission_fields) for a in admissions[:RECENT_ADMISSIONS]],
+        "latestDiagnoses": [_slim(d, ("icd_code", "icd9_code", "long_title", "description")) for d in diagnoses],
+        "currentMedications": [_slim(m, ("drug", "dose_val_rx", "dose_unit_rx", "route", "startdate", "enddate"))
+                               for m in medications],
+        "recentLabs": [_slim(l, ("test_name", "itemid", "value", "valueuom", "flag", "charttime")) for l in labs],
+        "lastNote": {
+            **_slim(last_note, ("category", "charttime", "chartdate")),
+            "excerpt": (last_note.get("text") or "")[:NOTE_EXCERPT_CHARS],
+        } if last_note else None,
+        "updatedAt": datetime.utcnow(),
+    }
+
+async def rebuild(pids, trigger: str) -> int:
+    docs = [d for d in await asyncio.gather(*(build_summary(pid) for pid in pids)) if d]
+    if not docs:
+        return 0
+    await mongo.get_db()[SUMMARY_COLLECTION].bulk_write(
+        [ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in docs], ordered=False)
+    SUMMARY_REBUILDS.inc(len(docs), trigger=trigger)
+    return len(docs)
+
+# -------------------- Incremental Maintenance --------------------
+
+class SummaryMaintainer:
+    def __init__(self, debounce: float = SUMMARY_DEBOUNCE_MS / 1000, poll_interval: float = SUMMARY_POLL_INTERVAL,
+                 batch: int = SUMMARY_BATCH):
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.batch = batch
+        self.rebuilt = 0
+        self.failures = 0
+        self.modes = {}
+        self._dirty = {}  # pid -> trigger; dict keeps arrival order
+        self._wake = asyncio.Event()
+        self._tasks = []
+
+        metrics.REGISTRY.gauge("chatbot_patient_summary_dirty", "Patients waiting for a summary rebuild.",
+                               fn=lambda: len(self._dirty))
+
+    def mark_dirty(self, pid, trigger: str = "lazy"):
+        if pid:
+            self._dirty.setdefault(pid, trigger)
+            self._wake.set()
+
+    async def _worker(self):
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(self.debounce)  # coalesce bursts (e.g. a batch of lab results)
+            self._wake.clear()
+            while self._dirty:
+                pids = list(self._dirty)[:self.batch]
+                triggers = {pid: self._dirty.pop(pid) for pid in pids}
+                try:
+                    by_trigger = {}
+                    for pid, trigger in triggers.items():
+                        by_trigger.setdefault(trigger, []).append(pid)
+                    for trigger, group in by_trigger.items():
+                        self.rebuilt += await rebuild(group, trigger)
+                except Exception as e:
+                    self.failures += 1
+                    if isinstance(e, PyMongoError):
+                        logger.warning("[SUMMARY] Rebuild of %d patients failed: %s", len(pids), e)
+                    else:
+                        # e.g. a malformed source document; keep the worker and the batch alive
+                        logger.exception("[SUMMARY] Rebuild of %d patients failed unexpectedly: %s", len(pids), e)
+                    for pid, trigger in triggers.items():
+                        self._dirty.setdefault(pid, trigger)
+                    await asyncio.sleep(self.poll_interval)
+
+    async def _watch(self, collection: str):
+        db = mongo.get_db()
+        while True:
+            try:
+                async with db[collection].watch(full_document="updateLookup") as stream:
+                    self.modes[collection] = "change_stream"
+                    async for change in stream:
+                        # deletes carry only the _id; `--rebuild` reconciles those
+                        self.mark_dirty((change.get("fullDocument") or {}).get("patient_id"), "change")
+            except OperationFailure as e:
+                logger.info("[SUMMARY] Change streams unavailable on %s (%s); polling deltas.", collection, e)
+                await self._poll_deltas(collection)
+                return
+            except PyMongoError as e:
+                logger.warning("[SUMMARY] Change stream on %s dropped: %s", collection, e)
+                await asyncio.sleep(self.poll_interval)
+
+    async def _poll_deltas(self, collection: str):
+        """Delta job: new documents by _id, edited ones by updatedAt (when the writer sets it)."""
+        self.modes[collection] = "delta_poll"
+        coll = mongo.get_db()[collection]
+        newest = await coll.find_one({}, {"_id": 1}, sort=[("_id", DESCENDING)])
+        last_id = newest["_id"] if newest else None
+        last_updated = datetime.utcnow()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+                async for doc in coll.find(query, {"patient_id": 1}).sort("_id", ASCENDING).limit(10000):
+                    last_id = doc["_id"]
+                    self.mark_dirty(doc.get("patient_id"), "delta")
+                async for doc in coll.find({"updatedAt": {"$gt": last_updated}}, {"patient_id": 1, "updatedAt": 1}) \
+                        .sort("updatedAt", ASCENDING).limit(10000):
+                    last_updated = max(last_updated, doc["updatedAt"])
+                    self.mark_dirty(doc.get("patient_id"), "delta")
+            except PyMongoError as e:
+                logger.warning("[SUMMARY] Delta poll on %s failed: %s", collection, e)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker())]
+        self._tasks += [asyncio.create_task(self._watch(c)) for c in SOURCE_COLLECTIONS]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {"dirty": len(self._dirty), "rebuilt": self.rebuilt, "failures": self.failures, "modes": dict(self.modes)}
+
+# -------------------- CLI --------------------
+
+async def backfill(limit: Optional[int] = None, batch: int = SUMMARY_BATCH) -> int:
+    total, pids = 0, []
+    t0 = time.perf_counter()
+    async for doc in mongo.iter_records("patients", {}, {"patient_id": 1}):
+        pids.append(doc["patient_id"])
+        if len(pids) >= batch:
+            total += await rebuild(pids, "backfill")
+            pids = []
+        if limit and total + len(pids) >= limit:
+            break
+    if pids:
+        total += await rebuild(pids, "backfill")
+    logger.info("[SUMMARY] Backfilled %d summaries in %.1fs", total, time.perf_counter() - t0)
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the patient_summaries materialized view.")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild summaries for every patient")
+    parser.add_argument("--limit", type=int, help="stop after this many patients")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.error("pass --rebuild")
+    print(f"rebuilt {asyncio.run(backfill(args.limit))} summaries")
+    mongo.close_client()
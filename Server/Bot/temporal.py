@@ -0,0 +1,210 @@
+"""
+Fast resolver for the date expressions doctors type into the chatbot.
+
+resolve(text) returns a half-open DateRange [start, end) of calendar days,
+or None if nothing was recognised (callers may then fall back to
+dateparser). Covered:
+- relative days: today, tomorrow, day after tomorrow, yesterday, in 3 days,
+  next/last/past 5 days
+- weeks and months: this/next/last week (Monday-based), this/next weekend,
+  this/next/last month
+- weekdays: monday, this friday, next tuesday, last thursday; abbreviations
+  only after this/next/last/on or with a trailing "." (on sat, sun.), so
+  "o2 sat" and "sun burn" are not dates
+- explicit dates, day first (Indian usage): 21-06-2025, 21.6.25, 21 June,
+  21st Jun 2025, June 21, 2025-06-21; the short form (21/06) only after
+  on/from/since/until/till/before/after/between or in a from/between range,
+  so "room 3-4" is not a date
+- ranges of any two of the above: "between monday and thursday",
+  "from 21/06 to 25/06", "21 june - 24 june", "monday till friday"
+
+All patterns are compiled once at import and results are memoised per
+(text, today), so a repeated question costs a dict lookup.
+"""
+
+import re
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+
+class DateRange(NamedTuple):
+    start: date
+    end: date  # exclusive
+
+    @property
+    def days(self) -> int:
+        return (self.end - self.start).days
+
+    def iso(self):
+        return self.start.isoformat(), self.end.isoformat()
+
+
+WEEKDAYS = {name: i for i, names in enumerate((
+    ("monday", "mon"), ("tuesday", "tue", "tues"), ("wednesday", "wed"), ("thursday", "thu", "thur", "thurs"),
+    ("friday", "fri"), ("saturday", "sat"), ("sunday", "sun"),
+)) for name in names}
+MONTHS = {name: i for i, names in enumerate((
+    ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"), ("may",), ("june", "jun"),
+    ("july", "jul"), ("august", "aug"), ("september", "sep", "sept"), ("october", "oct"),
+    ("november", "nov"), ("december", "dec"),
+), start=1) for name in names}
+
+_FULL_WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+_WEEKDAY = "|".join(_FULL_WEEKDAYS)
+_WEEKDAY_ABBR = "|".join(sorted((w for w in WEEKDAYS if w not in _FULL_WEEKDAYS), key=len, reverse=True))
+_MONTH = "|".join(sorted(MONTHS, key=len, reverse=True))
+_NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+                 "eight": 8, "nine": 9, "ten": 10, "fourteen": 14, "thirty": 30}
+_COUNT = r"(\d{1,3}|" + "|".join(_NUMBER_WORDS) + r")"
+
+_ISO = r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b"
+_DMY = r"\b(\d{1,2})[/.\-](\d{1,2})(?:[/.\-](\d{2}|\d{4}))?\b"
+_D_MONTH = r"\b(\d{1,2})(?:st|nd|rd|th)?(?: of)? (" + _MONTH + r")\.?(?:,? (\d{4}))?\b"
+_MONTH_D = r"\b(" + _MONTH + r")\.? (\d{1,2})(?:st|nd|rd|th)?(?:,? (\d{4}))?\b"
+# every explicit calendar date form, for lower-cased text (capture.py masks these)
+CALENDAR_DATE = "|".join(f"(?:{p})" for p in (_ISO, _DMY, _D_MONTH, _MONTH_D))
+
+_DMY_YEAR = r"\b(\d{1,2})[/.\-](\d{1,2})[/.\-](\d{2}|\d{4})\b"
+_DM_CUED = r"\b(?:on|from|since|until|till|before|after|between) (\d{1,2})[/.\-](\d{1,2})()\b"
+_DM = r"\b(\d{1,2})[/.\-](\d{1,2})()\b"
+_RANGE_CUE = re.compile(r"\b(?:from|between)\b")
+
+# a single point/period expression; order matters (longest phrases first)
+_SINGLE = [
+    ("day_after", re.compile(r"\bday after tomorrow\b")),
+    ("day_before", re.compile(r"\bday before yesterday\b")),
+    ("today", re.compile(r"\b(?:today|tonight|this (?:morning|afternoon|evening))\b")),
+    ("tomorrow", re.compile(r"\b(?:tomorrow|tmrw|tmr)\b")),
+    ("yesterday", re.compile(r"\byesterday\b")),
+    ("in_days", re.compile(r"\bin " + _COUNT + r" days?\b|\b" + _COUNT + r" days? from (?:now|today)\b")),
+    ("next_days", re.compile(r"\b(?:next|coming|upcoming) " + _COUNT + r" days?\b")),
+    ("past_days", re.compile(r"\b(?:last|past|previous) " + _COUNT + r" days?\b")),
+    ("weekend", re.compile(r"\b(this|next|coming)? ?weekend\b")),
+    ("week", re.compile(r"\b(this|next|last|previous|coming) week\b")),
+    ("month", re.compile(r"\b(this|next|last|previous|coming) month\b")),
+    ("iso", re.compile(_ISO)),
+    ("dmy", re.compile(_DMY_YEAR)),
+    ("dmy", re.compile(_DM_CUED)),
+    ("d_month", re.compile(_D_MONTH)),
+    ("month_d", re.compile(_MONTH_D)),
+    ("weekday", re.compile(r"\b(?:(this|next|last|coming|previous) )?(" + _WEEKDAY + r")\b")),
+    # "on sat" is the bare weekday; "sat." leaves the qualifier group empty
+    ("weekday", re.compile(r"\b(this|next|last|coming|previous|on) (" + _WEEKDAY_ABBR + r")\b")),
+    ("weekday", re.compile(r"\b()(" + _WEEKDAY_ABBR + r")\.")),
+]
+_SINGLE_ANY = re.compile("|".join(f"(?:{p.pattern})" for _, p in _SINGLE))
+# either side of a from/between range may be a short date ("from 21/06 to 25/06")
+_SINGLE_SHORT = _SINGLE + [("dmy", re.compile(_DM))]
+_SINGLE_SHORT_ANY = re.compile(_SINGLE_ANY.pattern + f"|(?:{_DM})")
+
+_RANGE = re.compile(
+    r"\b(?:between|from)?\s*(?P<a>.+?)\s+(?:and|to|till|until|through|thru|-|–)\s+(?P<b>.+)$"
+)
+_SPACES = re.compile(r"\s+")
+
+
+def _count(token: str) -> int:
+    return int(token) if token.isdigit() else _NUMBER_WORDS[token]
+
+def _year(token: Optional[str], today: date) -> int:
+    if not token:
+        return today.year
+    year = int(token)
+    return year + 2000 if year < 100 else year
+
+def _day(y: int, m: int, d: int) -> Optional[DateRange]:
+    try:
+        start = date(y, m, d)
+    except ValueError:
+        return None
+    return DateRange(start, start + timedelta(days=1))
+
+def _week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+def _month_range(y: int, m: int) -> DateRange:
+    start = date(y, m, 1)
+    end = date(y + (m == 12), m % 12 + 1, 1)
+    return DateRange(start, end)
+
+def _match(kind: str, m, today: date) -> Optional[DateRange]:
+    one = timedelta(days=1)
+    if kind == "today":
+        return DateRange(today, today + one)
+    if kind == "tomorrow":
+        return DateRange(today + one, today + 2 * one)
+    if kind == "day_after":
+        return DateRange(today + 2 * one, today + 3 * one)
+    if kind == "yesterday":
+        return DateRange(today - one, today)
+    if kind == "day_before":
+        return DateRange(today - 2 * one, today - one)
+    if kind == "in_days":
+        day = today + _count(m.group(1) or m.group(2)) * one
+        return DateRange(day, day + one)
+    if kind == "next_days":
+        return DateRange(today, today + _count(m.group(1)) * one)
+    if kind == "past_days":
+        return DateRange(today - _count(m.group(1)) * one, today + one)
+    if kind == "weekend":
+        saturday = _week_start(today) + 5 * one
+        if m.group(1) == "next" and today.weekday() < 5:
+            saturday += 7 * one
+        return DateRange(max(saturday, today), saturday + 2 * one)
+    if kind == "week":
+        start = _week_start(today) + {"this": 0, "next": 7, "coming": 7}.get(m.group(1), -7) * one
+        return DateRange(start, start + 7 * one)
+    if kind == "month":
+        shift = {"this": 0, "next": 1, "coming": 1}.get(m.group(1), -1)
+        index = today.year * 12 + today.month - 1 + shift
+        return _month_range(index // 12, index % 12 + 1)
+    if kind == "iso":
+        return _day(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    if kind == "dmy":
+        # day first; "06/21" is not a valid DD/MM date and is rejected
+        return _day(_year(m.group(3), today), int(m.group(2)), int(m.group(1)))
+    if kind == "d_month":
+        return _day(_year(m.group(3), today), MONTHS[m.group(2)], int(m.group(1)))
+    if kind == "month_d":
+        return _day(_year(m.group(3), today), MONTHS[m.group(1)], int(m.group(2)))
+    # weekday
+    target = WEEKDAYS[m.group(2)]
+    if m.group(1) in ("last", "previous"):
+        day = today - ((today.weekday() - target) % 7 or 7) * one
+    elif m.group(1) == "next":
+        day = today + ((target - today.weekday()) % 7 or 7) * one
+    else:  # bare, "this" or "coming": the next occurrence, today included
+        day = today + ((target - today.weekday()) % 7) * one
+    return DateRange(day, day + one)
+
+def _single(text: str, today: date, short: bool = False) -> Tuple[Optional[str], Optional[DateRange]]:
+    """First recognised expression in `text` (already lower-cased and squashed) and its kind."""
+    for kind, pattern in (_SINGLE_SHORT if short else _SINGLE):
+        for m in pattern.finditer(text):
+            found = _match(kind, m, today)
+            if found:  # invalid calendar dates (e.g. a "10.30" time) keep looking
+                return kind, found
+    return None, None
+
+@lru_cache(maxsize=2048)
+def _resolve(text: str, today: date) -> Optional[DateRange]:
+    m = _RANGE.search(text)
+    short = bool(m) and _RANGE_CUE.search(text, 0, m.start("b")) is not None
+    any_single = _SINGLE_SHORT_ANY if short else _SINGLE_ANY
+    if m and any_single.search(m.group("a")) and any_single.search(m.group("b")):
+        (first_kind, first), (last_kind, last) = _single(m.group("a"), today, short), _single(m.group("b"), today, short)
+        if first and last:
+            if first_kind == last_kind == "weekday" and last.start < first.start:
+                # "friday to monday": the end rolls into the following week
+                last = DateRange(last.start + timedelta(days=7), last.end + timedelta(days=7))
+            if last.end > first.start:
+                return DateRange(first.start, last.end)
+    return _single(text, today)[1]
+
+def resolve(text: Optional[str], today: Optional[date] = None) -> Optional[DateRange]:
+    if not text:
+        return None
+    return _resolve(_SPACES.sub(" ", text.lower()).strip(), today or date.today())
+
+cache_info = _resolve.cache_info
@@ -0,0 +1,14 @@
+"""
+The Bot's modules are flat and log to logs/chatbot.log relative to the
+working directory, so the tests run from the Bot directory whatever
+directory pytest was started in:
+
+    cd Server/Bot && python -m pytest tests
+"""
+
+import os
+import sys
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_DIR)
+os.chdir(BOT_DIR)
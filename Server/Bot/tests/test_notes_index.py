@@ -0,0 +1,100 @@
+import random
+
+from bson import ObjectId
+
+import notes_index
+from notes_index import NotesIndex, _MemSegment, _Segment, _decode, _encode, _merge, _write_segment
+
+
+def note(text, patient="P1", admission="A1", category="Nursing"):
+    return {"_id": ObjectId(), "text": text, "patient_id": patient, "admission_id": admission,
+            "category": category, "charttime": None}
+
+
+def test_tokenize():
+    assert notes_index.tokenize("Patients had FALLS; the bodies") == ["fall", "body"]
+    assert notes_index.query_terms("show doctor notes about fall risk") == ["fall", "risk"]
+
+
+def test_posting_roundtrip():
+    rng = random.Random(7)
+    docs = sorted(rng.sample(range(1_000_000), 500))
+    pairs = [(d, rng.randint(1, 300)) for d in docs]
+    assert _decode(bytes(_encode(pairs))) == pairs
+    dense = [(d, 1) for d in range(0, 200, 2)]  # one-byte varints take the fast path
+    assert _decode(bytes(_encode(dense))) == dense
+    assert _decode(b"") == []
+
+
+def test_segment_roundtrip(tmp_path):
+    mem = _MemSegment()
+    first, second = note("fall risk assessed", "P1"), note("abdominal pain", "P2", category="Physician")
+    mem.add(first["_id"].binary, first)
+    mem.add(second["_id"].binary, second)
+    path = str(tmp_path / "seg.nix")
+    _write_segment(path, mem, mem.term_lists())
+    seg = _Segment(path)
+    try:
+        assert seg.n == 2
+        assert seg.oid(1) == second["_id"]
+        assert seg.read("fall") == [(0, 1)]
+        assert seg.read(notes_index._patient_term("P2")) == [(1, 1)]
+        assert seg.meta(1)["category"] == "Physician"
+        assert seg.find(second["_id"].binary) == 1
+    finally:
+        seg.close()
+
+
+def test_merge_drops_deleted_and_renumbers(tmp_path):
+    segments, notes = [], []
+    for i in range(2):
+        mem = _MemSegment()
+        for text in ("fall risk", "fall again", "nausea"):
+            doc = note(f"{text} {i}")
+            notes.append(doc)
+            mem.add(doc["_id"].binary, doc)
+        path = str(tmp_path / f"seg-{i}.nix")
+        _write_segment(path, mem, mem.term_lists())
+        segments.append(_Segment(path))
+    out = str(tmp_path / "merged.nix")
+    _merge(out, segments, [{0}, {2}])
+    merged = _Segment(out)
+    try:
+        assert merged.n == 4
+        assert [merged.oid(d) for d in range(4)] == [notes[i]["_id"] for i in (1, 2, 3, 4)]
+        assert merged.read("fall") == [(0, 1), (2, 1), (3, 1)]
+        assert merged.read("nausea") == [(1, 1)]
+    finally:
+        for seg in segments + [merged]:
+            seg.close()
+
+
+def test_index_search_flush_merge_and_reader_reload(tmp_path):
+    writer = NotesIndex(str(tmp_path), max_segments=2)
+    writer.load()
+    reader = NotesIndex(str(tmp_path))
+    try:
+        assert writer.writer and not reader.writer
+        docs = [note("patient had a fall in the ward", "P1"), note("fall risk high", "P2"), note("nausea", "P1")]
+        writer.add_many(docs[:2])
+        writer.flush()
+        writer.add_many(docs[2:])
+        writer.flush()
+        writer.delete(docs[0]["_id"])
+        writer.flush()
+        writer.merge()
+        assert len(writer.segments) == 1
+
+        hits = writer.search("fall")
+        assert [h["_id"] for h in hits] == [docs[1]["_id"]]
+        assert [h["_id"] for h in writer.search("", patient_id="P1")] == [docs[2]["_id"]]
+
+        reader.load()
+        assert [seg.name for seg in reader.segments] == [seg.name for seg in writer.segments]
+        assert reader.live() == writer.live() == 2
+        assert not reader.reload()  # unchanged manifest
+    finally:
+        for index in (writer, reader):
+            for seg in index.segments:
+                seg.close()
+            index._unlock_writer()
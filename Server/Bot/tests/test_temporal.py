@@ -0,0 +1,58 @@
+from datetime import date
+
+import pytest
+
+import temporal
+from temporal import DateRange
+
+TODAY = date(2025, 6, 18)  # a Wednesday
+
+
+def day(y, m, d):
+    start = date(y, m, d)
+    return DateRange(start, date.fromordinal(start.toordinal() + 1))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("today", day(2025, 6, 18)),
+    ("day after tomorrow", day(2025, 6, 20)),
+    ("last week", DateRange(date(2025, 6, 9), date(2025, 6, 16))),
+    ("saturday", day(2025, 6, 21)),
+    ("next sun", day(2025, 6, 22)),
+    ("on sat", day(2025, 6, 21)),
+    ("sat.", day(2025, 6, 21)),
+    ("last thu", day(2025, 6, 12)),
+    ("2025-06-21", day(2025, 6, 21)),
+    ("21-06-2025", day(2025, 6, 21)),
+    ("21.6.25", day(2025, 6, 21)),
+    ("on 21/06", day(2025, 6, 21)),
+    ("21st june", day(2025, 6, 21)),
+    ("june 21, 2025", day(2025, 6, 21)),
+    ("from 21/06 to 25/06", DateRange(date(2025, 6, 21), date(2025, 6, 26))),
+    ("notes from 21/06 to 25/06", DateRange(date(2025, 6, 21), date(2025, 6, 26))),
+    ("between monday and thursday", DateRange(date(2025, 6, 23), date(2025, 6, 27))),
+    ("friday to monday", DateRange(date(2025, 6, 20), date(2025, 6, 24))),
+    ("21 june - 24 june", DateRange(date(2025, 6, 21), date(2025, 6, 25))),
+])
+def test_resolves(text, expected):
+    assert temporal.resolve(text, TODAY) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "who had low o2 sat",
+    "sun burn on the left arm",
+    "room 3-4",
+    "beds 3-4 and 5-6",
+    "reduce the dose to 3/4",
+    "bp check at 10.30",
+    "fall risk",
+    "",
+    None,
+])
+def test_not_a_date(text):
+    assert temporal.resolve(text, TODAY) is None
+
+
+def test_invalid_calendar_date_keeps_looking():
+    # "31/06" does not exist; the weekday after it still counts
+    assert temporal.resolve("on 31/06 or friday", TODAY) == day(2025, 6, 20)
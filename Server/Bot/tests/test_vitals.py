@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+import vitals
+
+T0 = datetime(2025, 6, 1)
+
+
+def buckets(means, spread=0.2, hours=6):
+    """$bucketAuto-shaped output with consecutive windows around `means`."""
+    return [{"_id": {"min": T0 + timedelta(hours=i * hours), "max": T0 + timedelta(hours=(i + 1) * hours)},
+             "n": 4, "min": m - spread, "max": m + spread, "mean": m} for i, m in enumerate(means)]
+
+
+def test_classify():
+    assert vitals.classify("spo2", 97) == "normal"
+    assert vitals.classify("spo2", 92) == "low"
+    assert vitals.classify("spo2", 88) == "critical_low"
+    assert vitals.classify("temperature", 38.4) == "high"
+    assert vitals.classify("temperature", 40.0) == "critical_high"
+    assert vitals.classify("heart_rate", None) == "unknown"
+
+
+def test_trend_directions():
+    assert vitals.trend("temperature", vitals._points(buckets([37.0])))["direction"] == "insufficient_data"
+    assert vitals.trend("temperature", vitals._points(buckets([37.0, 37.1, 36.9, 37.0])))["direction"] == "stable"
+    rising = vitals.trend("temperature", vitals._points(buckets([37.0, 37.5, 38.0, 38.5])))
+    assert rising["direction"] == "rising"
+    assert rising["change"] == 1.5
+    assert rising["slopePerDay"] == 2.0  # 0.5 per 6h bucket
+    assert vitals.trend("spo2", vitals._points(buckets([98, 96, 94, 92])))["direction"] == "falling"
+
+
+def test_alerts_merge_consecutive_buckets():
+    points = vitals._points(buckets([97, 93, 89, 93, 97, 92], spread=0))
+    episodes = vitals.alerts("spo2", points)
+    assert [(e["kind"], e["severity"], e["extreme"]) for e in episodes] == [("low", "critical", 89), ("low", "warning", 92)]
+    first = episodes[0]
+    assert (first["from"], first["to"]) == (points[1]["from"], points[3]["to"])
+
+
+def test_alerts_high_and_low_are_separate_episodes():
+    points = vitals._points(buckets([37.0, 38.5, 35.5], spread=0))
+    assert [(e["kind"], e["severity"]) for e in vitals.alerts("temperature", points)] == [("high", "warning"), ("low", "warning")]
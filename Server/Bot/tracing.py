@@ -0,0 +1,83 @@
+"""
+Per-request stage timing for the chatbot service.
+
+A RequestTrace lives in a contextvar for the duration of one /chat request,
+so nlp.py, rag.py and app.py can add spans without threading a handle
+through every call. asyncio tasks and asyncio.to_thread() inherit the
+context, so spans recorded from worker threads land on the same trace.
+Outside a request (CLI tools, benchmarks) span() only feeds the metrics.
+"""
+
+import json
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+import metrics
+
+# ---------------------------- Trace ----------------------------
+
+class RequestTrace:
+    def __init__(self, cid: str):
+        self.cid = cid
+        self.t0 = time.perf_counter()
+        self.spans = []  # list.append is atomic, so worker threads may record too
+        self.attrs = {}
+
+    def record(self, name: str, seconds: float, start: Optional[float] = None):
+        offset = (start if start is not None else time.perf_counter() - seconds) - self.t0
+        self.spans.append({"name": name, "ms": round(seconds * 1000, 2), "atMs": round(offset * 1000, 2)})
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.t0) * 1000, 2)
+
+    def breakdown(self) -> dict:
+        return {"totalMs": self.elapsed_ms(), "spans": list(self.spans), **self.attrs}
+
+    def log_line(self, **extra) -> str:
+        return json.dumps({"event": "request_timing", "cid": self.cid, **extra, **self.breakdown()},
+                          default=str, separators=(",", ":"))
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("request_trace", default=None)
+
+def current() -> Optional[RequestTrace]:
+    return _current.get()
+
+@contextmanager
+def request_trace(cid: str):
+    trace = RequestTrace(cid)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+# ---------------------------- Spans ----------------------------
+
+@contextmanager
+def span(name: str, stage: Optional[str] = None):
+    """Times a block onto the current trace; `stage` also feeds metrics.STAGE_SECONDS."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        trace = _current.get()
+        if trace is not None:
+            trace.record(name, elapsed, t0)
+        if stage is not None:
+            metrics.STAGE_SECONDS.observe(elapsed, stage=stage)
+
+def record(name: str, seconds: float, stage: Optional[str] = None):
+    trace = _current.get()
+    if trace is not None:
+        trace.record(name, seconds)
+    if stage is not None:
+        metrics.STAGE_SECONDS.observe(seconds, stage=stage)
+
+def annotate(**attrs):
+    trace = _current.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
@@ -0,0 +1,148 @@
+"""
+Vital-sign trends for the temperature_trends, oxygen_saturation_levels and
+vital_signs_history intents.
+
+Readings are the PatientVitals documents the Node server records
+(Server/Models/PatientVitals.js): one per recording, with each vital in its
+own field; mongo.VITAL_FIELDS maps a metric to its field. They are keyed by
+the Node Patient's UUID, which the caller resolves with
+mongo.get_vitals_patient_ref. A trend is always
+the same bounded shape whatever the recording frequency: the window (default
+the last 14 days of data) is downsampled server-side with $bucketAuto into
+at most VITALS_POINTS buckets of min/max/mean, then a least-squares slope
+over the bucket means gives the direction and out-of-range buckets are
+merged into alert episodes.
+"""
+
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Iterable, List, Optional
+
+import mongo
+from config import VITALS_WINDOW_DAYS, VITALS_POINTS
+
+# -------------------- Logging Setup --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+if not logger.handlers:
+    handler = logging.FileHandler("logs/chatbot.log", encoding="utf-8")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+# metric -> display info, adult reference range, critical limits, and the
+# change over the window below which a trend is reported as stable
+VITALS = {
+    "temperature": {"label": "Temperature", "unit": "°C", "low": 36.0, "high": 38.0,
+                    "critical_low": 35.0, "critical_high": 39.5, "stable_band": 0.3},
+    "spo2": {"label": "Oxygen saturation", "unit": "%", "low": 94, "high": None,
+             "critical_low": 90, "critical_high": None, "stable_band": 1.5},
+    "heart_rate": {"label": "Heart rate", "unit": "bpm", "low": 50, "high": 110,
+                   "critical_low": 40, "critical_high": 140, "stable_band": 8},
+    "resp_rate": {"label": "Respiratory rate", "unit": "/min", "low": 10, "high": 22,
+                  "critical_low": 8, "critical_high": 30, "stable_band": 3},
+    "sbp": {"label": "Systolic BP", "unit": "mmHg", "low": 90, "high": 160,
+            "critical_low": 80, "critical_high": 190, "stable_band": 10},
+    "dbp": {"label": "Diastolic BP", "unit": "mmHg", "low": 50, "high": 100,
+            "critical_low": 40, "critical_high": 120, "stable_band": 8},
+}
+
+INTENT_METRICS = {
+    "temperature_trends": ("temperature",),
+    "oxygen_saturation_levels": ("spo2",),
+    "vital_signs_history": tuple(VITALS),
+}
+
+# -------------------- Analysis --------------------
+
+def classify(metric: str, value: Optional[float]) -> str:
+    ref = VITALS[metric]
+    if value is None:
+        return "unknown"
+    if ref["critical_low"] is not None and value < ref["critical_low"]:
+        return "critical_low"
+    if ref["critical_high"] is not None and value > ref["critical_high"]:
+        return "critical_high"
+    if ref["low"] is not None and value < ref["low"]:
+        return "low"
+    if ref["high"] is not None and value > ref["high"]:
+        return "high"
+    return "normal"
+
+def trend(metric: str, points: List[dict]) -> dict:
+    """Least-squares slope of the bucket means against bucket mid-time."""
+    if len(points) < 2:
+        return {"direction": "insufficient_data", "slopePerDay": None, "change": None}
+    t0 = points[0]["from"]
+    xs = [((p["from"] - t0) + (p["to"] - p["from"]) / 2).total_seconds() / 86400 for p in points]
+    ys = [p["mean"] for p in points]
+    n = len(xs)
+    mx, my = sum(xs) / n, sum(ys) / n
+    sxx = sum((x - mx) ** 2 for x in xs)
+    slope = sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / sxx if sxx else 0.0
+    change = slope * (xs[-1] - xs[0])
+    if abs(change) < VITALS[metric]["stable_band"]:
+        direction = "stable"
+    else:
+        direction = "rising" if change > 0 else "falling"
+    return {"direction": direction, "slopePerDay": round(slope, 3), "change": round(change, 2)}
+
+def alerts(metric: str, points: List[dict]) -> List[dict]:
+    """Merges consecutive out-of-range buckets into episodes, keeping the extreme value."""
+    episodes = []
+    for p in points:
+        for side, value in (("low", p["min"]), ("high", p["max"])):
+            status = classify(metric, value)
+            if not status.endswith(side):
+                continue
+            last = episodes[-1] if episodes else None
+            if last and last["kind"] == side and last["to"] == p["_prev_to"]:
+                last["to"] = p["to"]
+                last["extreme"] = round(min(last["extreme"], value) if side == "low" else max(last["extreme"], value), 2)
+                last["severity"] = "critical" if status.startswith("critical") else last["severity"]
+            else:
+                episodes.append({"kind": side, "severity": "critical" if status.startswith("critical") else "warning",
+                                 "from": p["from"], "to": p["to"], "extreme": round(value, 2)})
+    return episodes
+
+def _points(buckets: list) -> List[dict]:
+    points, prev_to = [], None
+    for b in buckets:
+        points.append({"from": b["_id"]["min"], "to": b["_id"]["max"], "n": b["n"],
+                       "min": b["min"], "max": b["max"], "mean": round(b["mean"], 2), "_prev_to": prev_to})
+        prev_to = b["_id"]["max"]
+    return points
+
+# -------------------- Queries --------------------
+
+async def metric_trend(pid: str, metric: str, days: float = VITALS_WINDOW_DAYS, points: int = VITALS_POINTS) -> dict:
+    ref = VITALS[metric]
+    latest = await mongo.get_latest_vital(pid, metric)
+    result = {"metric": metric, "label": ref["label"], "unit": ref["unit"],
+              "range": {"low": ref["low"], "high": ref["high"]}}
+    if not latest:
+        return {**result, "readings": 0}
+
+    # window ends at the last reading so discharged patients still get a trend
+    end = latest["recordedAt"]
+    start = end - timedelta(days=days)
+    series = _points(await mongo.get_vitals_series(pid, metric, start, end, points))
+    result.update({
+        "window": {"from": start, "to": end},
+        "readings": sum(p["n"] for p in series),
+        "latest": {"value": latest["value"], "recordedAt": end, "status": classify(metric, latest["value"])},
+        "trend": trend(metric, series),
+        "alerts": alerts(metric, series),
+        "points": [{k: v for k, v in p.items() if k != "_prev_to"} for p in series],
+    })
+    return result
+
+async def vital_trends(patient: dict, metrics: Iterable[str], days: float = VITALS_WINDOW_DAYS,
+                       points: int = VITALS_POINTS) -> dict:
+    """Trends for a Node Patient document ({_id, firstName, lastName})."""
+    pid = patient["_id"]
+    trends = await asyncio.gather(*(metric_trend(pid, m, days, points) for m in metrics))
+    logger.debug("[VITALS] %s: %s", pid,
+                 {t["metric"]: (t["readings"], (t.get("trend") or {}).get("direction")) for t in trends})
+    name = " ".join(part for part in (patient.get("firstName"), patient.get("lastName")) if part)
+    return {"patient": {"id": pid, "name": name}, "vitals": [t for t in trends if t["readings"]] or "No vitals recorded."}
@@ -0,0 +1,19 @@
+"""
+Names, departments, wards and staff roles of the synthetic dataset
+(bench/synthetic_data.py). Traffic capture (capture.py) draws its pseudonyms
+from the same lists, so a captured name resolves to a synthetic patient on
+replay, and it keeps these words when masking capitalised names.
+"""
+
+FIRST_NAMES = [
+    "Ravi", "Priya", "Arjun", "Lakshmi", "Karthik", "Meena", "Suresh", "Divya", "Vijay", "Anitha",
+    "Rajesh", "Kavitha", "Ganesh", "Deepa", "Murali", "Revathi", "Senthil", "Sangeetha", "Arun", "Bhavani",
+    "Prakash", "Janani", "Mohan", "Nithya", "Sathish", "Pooja", "Kumar", "Saranya", "Dinesh", "Gayathri",
+]
+LAST_NAMES = [
+    "Kumar", "Raman", "Subramanian", "Krishnan", "Natarajan", "Iyer", "Pillai", "Rajan", "Murugan", "Sundaram",
+    "Balasubramanian", "Venkatesh", "Shankar", "Ramasamy", "Palani", "Selvam", "Mani", "Chandran", "Gopal", "Nair",
+]
+DEPARTMENTS = ["Gastroenterology", "Hepatology", "General Medicine", "Surgery", "Cardiology", "Nephrology", "Radiology"]
+WARDS = ["General Ward A", "General Ward B", "ICU", "HDU", "Private", "Semi-Private", "Day Care"]
+STAFF_ROLES = ["Doctor", "Nurse", "Pathologist", "Pharmacist", "Admin", "Technician"]
@@ -1,6 +1,18 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import os
+import hmac
+import threading
+from typing import Optional
+from fastapi import FastAPI, UploadFile, File, HTTPException, Header, Query, Request
+from fastapi.responses import PlainTextResponse
 from backend.core.processor import process_document
 from backend.utils.logger import logger
+from backend.db.mongo_handler import db
+from backend.db.indexes import ensure_indexes
+from backend.utils import metrics
+from backend.utils import profiler
+from backend.utils import memdiag
+from backend.utils.fastjson import FastJSONResponse
+from backend.utils.compression import CompressionMiddleware
 from backend.utils.file_utils import (
     save_uploaded_file,
     is_allowed_file,
@@ -11,21 +23,144 @@ from pathlib import Path
 
 MAX_FILES = 20
 MAX_SIZE_MB = 50
+# enables /admin/* for requests carrying it in X-Admin-Token; unset = 404
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
-app = FastAPI(title="Smart Medical Doc Processor API")
+app = FastAPI(title="Smart Medical Doc Processor API", default_response_class=FastJSONResponse)
+
+# OCR text + structured data for 20 files compresses ~4-5x (bench.serialization); skip small bodies
+app.add_middleware(CompressionMiddleware, min_size=int(os.getenv("COMPRESS_MIN_BYTES", "1024")))
+
+@app.middleware("http")
+async def track_profiled_requests(request: Request, call_next):
+    """
+    Reports requests matching an /admin/profile?requests=N session, which samples while they are in flight.
+    """
+    session = profiler.PROFILER.track(request.url.path)
+    if session is None:
+        return await call_next(request)
+    try:
+        return await call_next(request)
+    finally:
+        session.finish()
+
+def _apply_indexes():
+    try:
+        ensure_indexes(db)
+        logger.info("✅ MongoDB indexes verified.")
+    except Exception as e:
+        logger.warning(f"⚠️ Index setup failed (continuing without): {e}")
+
+@app.on_event("startup")
+def apply_indexes():
+    """
+    With ENSURE_INDEXES=1, applies the declared report-store indexes on a background thread, so
+    startup never waits on index builds. Off by default: deploys run `python -m backend.db.indexes --apply`.
+    """
+    if os.getenv("ENSURE_INDEXES", "0") == "1":
+        threading.Thread(target=_apply_indexes, name="ensure-indexes", daemon=True).start()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """
+    Prometheus text exposition of pipeline stage timings, counters and gauges.
+    """
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+def _require_admin(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+def profile_endpoint(seconds: float = Query(30, gt=0), interval_ms: float = Query(10, ge=1),
+                     requests: int = Query(0, ge=0), path: str = Query("/process"),
+                     idle: bool = False, threads: bool = False,
+                     x_admin_token: Optional[str] = Header(None)):
+    """
+    Sampling profile of every thread in this worker as collapsed stacks (flamegraph.pl / speedscope).
+    Runs for `seconds`, or with `requests=N` samples only while the next N requests under `path`
+    are in flight (`seconds` is then the timeout). Sync, so it waits on the threadpool, not the loop.
+    """
+    _require_admin(x_admin_token)
+    try:
+        session = profiler.PROFILER.run(seconds, interval_ms / 1000, path, requests, idle, threads)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except profiler.Busy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(session.collapsed(), headers=session.headers())
+
+memory_diagnostics = memdiag.MemoryDiagnostics()
+
+def _memory_stores() -> dict:
+    return {
+        "ocrPageImages": {"pages": metrics.OCR_PAGE_IMAGES.value(), "bytes": metrics.OCR_PAGE_IMAGE_BYTES.value()},
+        "filesPending": metrics.FILES_PENDING.value(),
+    }
+
+@app.get("/admin/memory")
+def memory_endpoint(top: int = Query(20, ge=1, le=200), group: str = Query("lineno"),
+                    x_admin_token: Optional[str] = Header(None)):
+    """
+    RSS and peak, OCR page images held by ocr_pdf, gc counters, and, while tracemalloc is on,
+    the top allocators grouped by `group` (lineno | filename | traceback).
+    """
+    _require_admin(x_admin_token)
+    try:
+        return memory_diagnostics.report(_memory_stores(), top, group)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/admin/memory/tracemalloc")
+def tracemalloc_endpoint(enable: bool = True, seconds: float = Query(600, gt=0), frames: int = Query(1, ge=1),
+                         x_admin_token: Optional[str] = Header(None)):
+    """
+    Starts tracemalloc for a bounded window (it stops itself after `seconds`), or stops it with enable=false.
+    """
+    _require_admin(x_admin_token)
+    if not enable:
+        return memory_diagnostics.stop_tracing()
+    try:
+        return memory_diagnostics.start_tracing(seconds, frames)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/admin/memory/snapshots")
+def memory_snapshot_endpoint(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    return memory_diagnostics.take_snapshot(_memory_stores())
+
+@app.get("/admin/memory/diff")
+def memory_diff_endpoint(base: int, target: Optional[int] = None, top: int = Query(20, ge=1, le=200),
+                         group: str = Query("lineno"), x_admin_token: Optional[str] = Header(None)):
+    """
+    Growth between snapshot `base` and snapshot `target` (default: a new snapshot taken now).
+    """
+    _require_admin(x_admin_token)
+    try:
+        return memory_diagnostics.diff(base, target, _memory_stores(), top, group)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/process")
-async def process_files(files: list[UploadFile] = File(...)):
+async def process_files(files: list[UploadFile] = File(...), x_debug_timing: Optional[str] = Header(None)):
     """
     Upload up to 20 PDF or image files for OCR → GPT parsing → MongoDB storage.
     Returns structured JSON + OCR text + DB status for each file.
+    With `X-Debug-Timing: 1`, each result also carries its per-stage timing.
     """
     if len(files) > MAX_FILES:
         raise HTTPException(status_code=400, detail=f"Too many files. Max allowed is {MAX_FILES}.")
 
     results_list = []
+    metrics.FILES_PENDING.inc(len(files))
 
     for uploaded_file in files:
+        metrics.FILES_PENDING.dec()
         try:
             ext = Path(uploaded_file.filename).suffix.lower()
             if not is_allowed_file(uploaded_file.filename):
@@ -58,7 +193,7 @@ async def process_files(files: list[UploadFile] = File(...)):
                 logger.warning(f"Error moving file {file_path} to processed: {move_err}")
 
             # Append results
-            results_list.append({
+            entry = {
                 "file": uploaded_file.filename,
                 "job_id": job_id,
                 "status": results.get("status", "unknown"),
@@ -66,7 +201,10 @@ async def process_files(files: list[UploadFile] = File(...)):
                 "structured_data": results.get("structured_data", {}),
                 "db_status": results.get("db_status", "No DB response."),
                 "message": results.get("message", "")
-            })
+            }
+            if x_debug_timing and x_debug_timing.lower() not in ("0", "false", "no"):
+                entry["timing"] = results.get("timing")
+            results_list.append(entry)
 
         except Exception as e:
             logger.exception(f"[API] Error processing file {uploaded_file.filename}: {e}")
@@ -76,7 +214,8 @@ async def process_files(files: list[UploadFile] = File(...)):
                 "message": str(e)
             })
 
-    return {"results": results_list}
+    # returning the Response directly skips FastAPI's jsonable_encoder pass
+    return FastJSONResponse({"results": results_list})
  
  
  #uvicorn backend.api:app --reload --host 0.0.0.0 --port 8000
@@ -1,10 +1,12 @@
 # backend/core/processor.py
 
 import os
+import time
 from backend.ocr.tesseract_ocr import extract_text
 from backend.nlp.gpt import get_gpt_structured_data
 from backend.db.mongo_handler import insert_report_auto
 from backend.utils.logger import logger
+from backend.utils import metrics, tracing
 
 def detect_report_type(ocr_text: str) -> str:
     """
@@ -41,6 +43,18 @@ def detect_report_type(ocr_text: str) -> str:
 
 
 def process_document(file_path: str, job_id: str = None) -> dict:
+    """
+    Runs the pipeline under a per-job trace and writes one structured
+    `job_timing` log line. The stage breakdown is returned under "timing".
+    """
+    with tracing.job_trace(job_id) as trace:
+        result = _run_pipeline(file_path, job_id)
+        result["timing"] = trace.breakdown()
+        logger.info(trace.log_line(status=result.get("status")))
+        return result
+
+
+def _run_pipeline(file_path: str, job_id: str = None) -> dict:
     """
     Main pipeline:
     - OCR
@@ -50,9 +64,13 @@ def process_document(file_path: str, job_id: str = None) -> dict:
     logger.info("📄 Starting GPT-based document processing...")
     logger.info(f"[{job_id}] 📂 File path received: {file_path}")
 
+    outcome = "error"
+    metrics.IN_FLIGHT.inc(kind="document")
+    t0 = time.perf_counter()
     try:
         # Step 1: OCR
-        raw_text = extract_text(file_path, job_id=job_id)
+        with tracing.span("ocr"):
+            raw_text = extract_text(file_path, job_id=job_id)
         logger.info(f"[{job_id}] ✅ OCR completed.")
         logger.debug(f"[{job_id}] 🔍 OCR Preview: {raw_text[:500]}")
 
@@ -71,6 +89,7 @@ def process_document(file_path: str, job_id: str = None) -> dict:
 
         logger.info(f"[{job_id}] 🗃️ MongoDB insert complete. Patient ID: {patient_id}")
 
+        outcome = "success"
         return {
             "status": "success",
             "structured_data": structured_data,
@@ -89,6 +108,10 @@ def process_document(file_path: str, job_id: str = None) -> dict:
         }
 
     finally:
+        metrics.IN_FLIGHT.dec(kind="document")
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="document")
+        metrics.DOCUMENTS_TOTAL.inc(outcome=outcome)
+
         # Cleanup
         try:
             if os.path.exists(file_path):
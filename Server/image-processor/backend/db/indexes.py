@@ -0,0 +1,104 @@
+# backend/db/indexes.py — Declared index spec + query-plan check for the report store
+#
+#   python -m backend.db.indexes --apply
+#   python -m backend.db.indexes --check
+
+import sys
+import argparse
+from typing import Dict, Any, List
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+from backend.utils.logger import logger
+
+# === Index Spec ===
+INDEX_SPEC: Dict[str, List[IndexModel]] = {
+    "patients": [
+        IndexModel([("name", ASCENDING)], name="name_1"),
+    ],
+    "blood_tests": [
+        IndexModel([("patient_id", ASCENDING), ("timestamp", DESCENDING)], name="patient_id_1_timestamp_-1"),
+    ],
+    "prescriptions": [
+        IndexModel([("patient_id", ASCENDING), ("timestamp", DESCENDING)], name="patient_id_1_timestamp_-1"),
+    ],
+    "xray_reports": [
+        IndexModel([("patient_id", ASCENDING), ("timestamp", DESCENDING)], name="patient_id_1_timestamp_-1"),
+    ],
+}
+
+# === Query Shapes Used By mongo_handler ===
+# (function name, collection, filter) — every read in mongo_handler must be listed.
+HANDLER_QUERIES = [
+    ("upsert_patient_basic_info", "patients", {"name": "Unknown"}),
+]
+
+
+def ensure_indexes(db: Database) -> Dict[str, Any]:
+    """
+    Applies INDEX_SPEC. Idempotent: re-creating an identical index is a no-op.
+    """
+    created = {}
+    for collection, models in INDEX_SPEC.items():
+        try:
+            created[collection] = db[collection].create_indexes(models)
+            logger.debug(f"[INDEX] {collection} -> {created[collection]}")
+        except PyMongoError as e:
+            logger.error(f"❌ Failed to apply indexes on {collection}: {e}")
+            created[collection] = {"error": str(e)}
+    return created
+
+
+def _plan_stages(plan) -> List[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for val in plan.values():
+            stages.extend(_plan_stages(val))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def check_query_plans(db: Database) -> List[str]:
+    """
+    Runs explain() on every declared handler query.
+    Returns failure strings; an empty list means no query plans a COLLSCAN.
+    """
+    failures = []
+    for func_name, collection, query in HANDLER_QUERIES:
+        try:
+            explain = db[collection].find(query).explain()
+        except PyMongoError as e:
+            failures.append(f"{func_name}: explain on {collection} failed: {e}")
+            continue
+
+        stages = _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        if "COLLSCAN" in stages:
+            failures.append(f"{func_name}: COLLSCAN on {collection} for filter {query}")
+    return failures
+
+
+if __name__ == "__main__":
+    from backend.db.mongo_handler import db
+
+    parser = argparse.ArgumentParser(description="Apply or verify report-store MongoDB indexes.")
+    parser.add_argument("--apply", action="store_true", help="create indexes from INDEX_SPEC")
+    parser.add_argument("--check", action="store_true", help="fail if any handler query plans a COLLSCAN")
+    args = parser.parse_args()
+    if not (args.apply or args.check):
+        parser.error("pass --apply and/or --check")
+
+    if args.apply:
+        for collection, names in ensure_indexes(db).items():
+            print(f"{collection}: {names}")
+
+    if args.check:
+        failures = check_query_plans(db)
+        for failure in failures:
+            print(f"[FAIL] {failure}")
+        if failures:
+            sys.exit(1)
+        print("[OK] All handler queries are served by an index.")
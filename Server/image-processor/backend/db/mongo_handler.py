@@ -8,6 +8,7 @@ from pymongo.collection import Collection
 from bson.objectid import ObjectId
 from dotenv import load_dotenv
 from backend.utils.logger import logger
+from backend.utils import metrics, tracing
 
 # === Load environment variables ===
 load_dotenv()
@@ -132,14 +133,17 @@ def insert_report_auto(structured_data: Dict[str, Any], raw_text: str = "", imag
     Master handler: auto-detects type and routes to correct insert function.
     Returns report ID.
     """
-    patient_id = upsert_patient_basic_info(structured_data)
     report_type = detect_report_type(structured_data)
-
-    if report_type == "blood_test":
-        return insert_blood_test(patient_id, structured_data, raw_text)
-    elif report_type == "prescription":
-        return insert_prescription(patient_id, structured_data)
-    elif report_type == "xray":
-        return insert_xray_report(patient_id, structured_data, image_url)
-    else:
-        raise ValueError("Could not detect report type for structured data.")
+    metrics.REPORTS_TOTAL.inc(report_type=report_type)
+
+    tracing.annotate(report_type=report_type)
+    with tracing.span("db_insert", stage="db_insert"):
+        patient_id = upsert_patient_basic_info(structured_data)
+        if report_type == "blood_test":
+            return insert_blood_test(patient_id, structured_data, raw_text)
+        elif report_type == "prescription":
+            return insert_prescription(patient_id, structured_data)
+        elif report_type == "xray":
+            return insert_xray_report(patient_id, structured_data, image_url)
+        else:
+            raise ValueError("Could not detect report type for structured data.")
@@ -5,6 +5,7 @@ from typing import Dict, Any
 from dotenv import load_dotenv
 from openai import AzureOpenAI
 from backend.utils.logger import logger
+from backend.utils import tracing
 
 load_dotenv()
 
@@ -88,15 +89,16 @@ def get_gpt_structured_data(ocr_text: str) -> Dict[str, Any]:
         raise ValueError("OCR text is empty. Cannot send to GPT.")
 
     try:
-        response = client.chat.completions.create(
-            model=AZURE_DEPLOYMENT,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": ocr_text.strip()},
-            ],
-            temperature=0.2,
-            max_tokens=2048,
-        )
+        with tracing.span("gpt", stage="gpt"):
+            response = client.chat.completions.create(
+                model=AZURE_DEPLOYMENT,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": ocr_text.strip()},
+                ],
+                temperature=0.2,
+                max_tokens=2048,
+            )
 
         content = response.choices[0].message.content.strip()
         logger.debug(f"🧠 Raw GPT Response:\n{content[:1000]}")
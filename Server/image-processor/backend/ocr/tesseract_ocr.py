@@ -8,6 +8,7 @@ from PIL import Image, ImageOps, ImageFilter, ExifTags
 from pdf2image import convert_from_path
 import pytesseract
 from backend.utils.logger import logger
+from backend.utils import metrics, tracing
 from langdetect import detect
 import json
 
@@ -96,9 +97,11 @@ def ocr_image(image: Union[str, Image.Image], lang: str = None, job_id: str = No
         job_id = job_id or str(uuid.uuid4())
         start = time.time()
         img = Image.open(image) if isinstance(image, str) else image
-        img = preprocess_image(img)
-        lang = lang or detect_language(img)
-        result = ocr_with_confidence(img, lang, job_id)
+        with metrics.IN_FLIGHT.track_inprogress(kind="ocr_page"), tracing.span("ocr.image", stage="ocr_page"):
+            img = preprocess_image(img)
+            lang = lang or detect_language(img)
+            result = ocr_with_confidence(img, lang, job_id)
+        metrics.OCR_PAGES_TOTAL.inc()
         result.update({
             "job_id": job_id,
             "time_taken": round(time.time() - start, 2),
@@ -119,15 +122,35 @@ def ocr_pdf(pdf_path: str, lang: str = None, job_id: str = None) -> Dict:
         job_id = job_id or str(uuid.uuid4())
         start = time.time()
         with tempfile.TemporaryDirectory() as temp_dir:
-            images = convert_from_path(pdf_path, dpi=300, output_folder=temp_dir)
-            logger.info(f"[OCR:{job_id}] Converted {len(images)} pages to images")
-
-            def process_page(i, img):
-                pre_img = preprocess_image(img)
-                return {"page": i + 1, **ocr_with_confidence(pre_img, lang or detect_language(pre_img), f"{job_id}-pg{i+1}")}
+            with tracing.span("rasterization", stage="rasterization"):
+                images = convert_from_path(pdf_path, dpi=300, output_folder=temp_dir)
+            page_count = len(images)
+            logger.info(f"[OCR:{job_id}] Converted {page_count} pages to images")
+
+            # decoded size of each page (~26 MB for an A4 RGB page at 300 dpi), for /admin/memory
+            page_bytes = [img.width * img.height * len(img.getbands()) for img in images]
+            metrics.OCR_PAGE_IMAGES.inc(page_count)
+            metrics.OCR_PAGE_IMAGE_BYTES.inc(sum(page_bytes))
+
+            # page workers don't inherit the contextvar; hand them the job's trace
+            trace = tracing.current()
+
+            def process_page(i):
+                try:
+                    with metrics.IN_FLIGHT.track_inprogress(kind="ocr_page"), \
+                            tracing.span(f"ocr.page{i+1}", stage="ocr_page", trace=trace):
+                        pre_img = preprocess_image(images[i])
+                        result = {"page": i + 1, **ocr_with_confidence(pre_img, lang or detect_language(pre_img), f"{job_id}-pg{i+1}")}
+                finally:
+                    # release each page once it is OCR'd rather than holding all of them until the last one
+                    images[i] = None
+                    metrics.OCR_PAGE_IMAGES.dec()
+                    metrics.OCR_PAGE_IMAGE_BYTES.dec(page_bytes[i])
+                metrics.OCR_PAGES_TOTAL.inc()
+                return result
 
             with concurrent.futures.ThreadPoolExecutor() as executor:
-                results = list(executor.map(lambda p: process_page(*p), enumerate(images)))
+                results = list(executor.map(process_page, range(page_count)))
 
         full_text = "\n\n".join([f"--- Page {r['page']} (conf: {r['confidence']:.2f}) ---\n{r['text']}" for r in results])
         avg_conf = sum([r['confidence'] for r in results]) / len(results) if results else 0.0
@@ -135,7 +158,7 @@ def ocr_pdf(pdf_path: str, lang: str = None, job_id: str = None) -> Dict:
         return {
             "text": full_text.strip(),
             "confidence": avg_conf,
-            "pages": len(images),
+            "pages": page_count,
             "job_id": job_id,
             "time_taken": round(time.time() - start, 2),
             "lang_used": lang or DEFAULT_LANGUAGES
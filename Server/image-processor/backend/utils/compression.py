@@ -0,0 +1,108 @@
+# backend/utils/compression.py — brotli/gzip for large /process payloads
+
+"""
+Negotiated response compression (brotli or gzip) as pure ASGI middleware.
+
+Starlette's GZipMiddleware has no brotli and compresses everything above one
+size; this picks the best encoding the client accepts (br > gzip), skips
+bodies under `min_size`, non-text content types and already-encoded
+responses, and leaves streamed responses (more_body on the first chunk)
+untouched. brotli is optional; without it only gzip is offered.
+"""
+
+import gzip
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml")
+
+# ---------------------------- Negotiation ----------------------------
+
+def _accepted(header: str) -> dict:
+    weights = {}
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            weights[token.strip().lower()] = q
+    return weights
+
+def choose_encoding(accept_encoding: str) -> str:
+    weights = _accepted(accept_encoding or "")
+    star = weights.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for enc in candidates:  # ties keep the earlier (better-compressing) encoding
+        q = weights.get(enc, star)
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+def compress(body: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 4) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level)
+
+# ---------------------------- Middleware ----------------------------
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        passthrough = False
+
+        async def wrapped_send(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                return await send(message)
+
+            body = message.get("body", b"")
+            if start is not None and message.get("more_body", False):
+                # streaming response: don't buffer, send it as-is
+                passthrough = True
+                await send(start)
+                return await send(message)
+
+            response_headers = [(k, v) for k, v in start["headers"]]
+            lowered = {k.lower(): v for k, v in response_headers}
+            content_type = lowered.get(b"content-type", b"").decode("latin-1")
+            if (len(body) >= self.min_size
+                    and b"content-encoding" not in lowered
+                    and content_type.startswith(COMPRESSIBLE_TYPES)):
+                body = compress(body, encoding, self.gzip_level, self.brotli_quality)
+                response_headers = [(k, v) for k, v in response_headers if k.lower() != b"content-length"]
+                response_headers += [
+                    (b"content-encoding", encoding.encode()),
+                    (b"content-length", str(len(body)).encode()),
+                ]
+                if b"vary" not in lowered:
+                    response_headers.append((b"vary", b"Accept-Encoding"))
+            await send({**start, "headers": response_headers})
+            await send({"type": "http.response.body", "body": body, "more_body": False})
+
+        await self.app(scope, receive, wrapped_send)
@@ -0,0 +1,225 @@
+# backend/utils/metrics.py — Prometheus-style metrics for the document processor
+
+"""
+Counters, gauges and fixed-bucket histograms with labels, rendered in the
+text exposition format by GET /metrics. Thread-safe, since PDF pages are
+OCR'd on a thread pool. Kept dependency-free, like the chatbot's registry.
+"""
+
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; OCR and GPT stages run from ~100ms to minutes for long PDFs
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+# ---------------------------- Metric Types ----------------------------
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, "", value) for key, value in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for sample_name, key, extra, value in self._samples():
+            lines.append(f"{sample_name}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), fn=None):
+        super().__init__(name, documentation, labelnames)
+        self._fn = fn
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        key = self._key(labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(1, **labels)
+        try:
+            yield
+        finally:
+            self.dec(1, **labels)
+
+    def _samples(self):
+        if self._fn is None:
+            return super()._samples()
+        # fn returns a number (unlabelled) or {label value tuple: number}
+        try:
+            value = self._fn()
+        except Exception:
+            return []
+        if isinstance(value, dict):
+            return [(self.name, tuple(map(str, k if isinstance(k, tuple) else (k,))), "", v) for k, v in value.items()]
+        return [(self.name, (), "", value)]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket (non-cumulative) counts + overflow, sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][idx] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def _samples(self):
+        with self._lock:
+            snapshot = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        samples = []
+        for key, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", key, f'le="{_format_value(float(bound))}"', cumulative))
+            samples.append((f"{self.name}_sum", key, "", total))
+            samples.append((f"{self.name}_count", key, "", cumulative))
+        return samples
+
+# ---------------------------- Registry ----------------------------
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=(), fn=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, fn))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# ---------------------------- Processor Metrics ----------------------------
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "docproc_stage_seconds",
+    "Time per pipeline stage (rasterization, ocr_page, gpt, db_insert, document).",
+    ("stage",),
+)
+DOCUMENTS_TOTAL = REGISTRY.counter(
+    "docproc_documents_total",
+    "Processed documents by outcome.",
+    ("outcome",),
+)
+REPORTS_TOTAL = REGISTRY.counter(
+    "docproc_reports_total",
+    "Reports written to MongoDB by detected report type.",
+    ("report_type",),
+)
+OCR_PAGES_TOTAL = REGISTRY.counter(
+    "docproc_ocr_pages_total",
+    "Pages (or single images) run through Tesseract.",
+)
+FILES_PENDING = REGISTRY.gauge(
+    "docproc_files_pending",
+    "Uploaded files accepted by /process and not yet processed.",
+)
+OCR_PAGE_IMAGES = REGISTRY.gauge(
+    "docproc_ocr_page_images",
+    "Rasterized PDF pages held in memory by ocr_pdf and not yet OCR'd.",
+)
+OCR_PAGE_IMAGE_BYTES = REGISTRY.gauge(
+    "docproc_ocr_page_image_bytes",
+    "Decoded size of the rasterized PDF pages held by ocr_pdf.",
+)
+IN_FLIGHT = REGISTRY.gauge(
+    "docproc_in_flight",
+    "Work currently in progress by kind (document, ocr_page).",
+    ("kind",),
+)
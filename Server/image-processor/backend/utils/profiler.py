@@ -0,0 +1,212 @@
+# backend/utils/profiler.py — on-demand sampling profiler for the document processor
+
+"""
+On-demand sampling profiler behind GET /admin/profile.
+
+A daemon thread wakes every `interval` seconds and reads the current frame
+of every thread with sys._current_frames(): the event loop (where /process
+runs process_document), the threadpool behind sync endpoints, the PDF page
+OCR pool and pymongo's monitor threads. Each stack is counted. No hook is installed in the profiled threads (no
+sys.setprofile / settrace), so they run unmodified. The only cost is the
+sampler holding the GIL while it walks the stacks: about 6us per busy thread
+per sample, so well under 1% of one core at the default 10ms interval. The
+sampler's own CPU time is reported with every profile.
+
+Samples are wall-clock: a thread blocked in a socket read shows up like one
+burning CPU, which is what latency work needs. Threads parked waiting for
+work (the loop in select(), idle pool workers) are dropped unless
+include_idle is set.
+
+Two modes:
+- run(seconds): sample everything for N seconds;
+- run(seconds, path=..., requests=N): sample only while one of the next N
+  requests whose path starts with `path` is in flight, giving up after
+  `seconds`. The request middleware reports them via track() / finish().
+
+Output is the collapsed-stack format ("thread;outer;inner count" per line)
+read by flamegraph.pl, speedscope and inferno. Each uvicorn worker profiles
+only itself, and one session runs at a time per process.
+"""
+
+import os
+import re
+import sys
+import time
+import threading
+from collections import Counter
+from typing import Optional
+
+from backend.utils.logger import logger
+
+MAX_SECONDS = float(os.getenv("PROFILE_MAX_S", "300"))
+MIN_INTERVAL = 0.001
+MAX_DEPTH = 128
+
+# innermost frames of a thread that is waiting for work, not doing it
+IDLE_LEAVES = frozenset({
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("periodic_executor.py", "_run"),
+})
+
+class Busy(Exception):
+    pass
+
+# ---------------------------- Session ----------------------------
+
+class ProfileSession:
+    def __init__(self, seconds: float, interval: float, path: Optional[str] = None, requests: int = 0,
+                 include_idle: bool = False, per_thread: bool = False):
+        self.seconds = seconds
+        self.interval = interval
+        self.path = path if requests else None
+        self.requests = requests
+        self.include_idle = include_idle
+        self.per_thread = per_thread
+        self.counts = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self.started = 0
+        self.finished = 0
+        self.inflight = 0
+        self.sampler_cpu_s = 0.0
+        self.wall_s = 0.0
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    def track(self, path: str) -> bool:
+        with self._lock:
+            if self.path is None or self.started >= self.requests or not path.startswith(self.path):
+                return False
+            self.started += 1
+            self.inflight += 1
+            return True
+
+    def finish(self):
+        with self._lock:
+            self.inflight -= 1
+            self.finished += 1
+            if self.finished >= self.requests:
+                self.done.set()
+
+    def sampling(self) -> bool:
+        return self.path is None or self.inflight > 0
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+    def headers(self) -> dict:
+        headers = {
+            "X-Profile-Samples": str(self.samples),
+            "X-Profile-Idle-Samples": str(self.idle_samples),
+            "X-Profile-Wall-S": f"{self.wall_s:.2f}",
+            "X-Profile-Sampler-CPU-Pct": f"{100 * self.sampler_cpu_s / self.wall_s:.2f}" if self.wall_s else "0",
+            "Content-Disposition": f'attachment; filename="profile-{os.getpid()}-{int(time.time())}.folded"',
+        }
+        if self.path is not None:
+            headers["X-Profile-Requests"] = f"{self.finished}/{self.requests}"
+        return headers
+
+# ---------------------------- Sampler ----------------------------
+
+class SamplingProfiler:
+    def __init__(self, max_seconds: float = MAX_SECONDS):
+        self.max_seconds = max_seconds
+        self.sessions = 0
+        self._session: Optional[ProfileSession] = None
+        self._lock = threading.Lock()
+        self._labels = {}
+        self._thread_names = {}
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            i = path.rfind("site-packages" + os.sep)
+            if i >= 0:
+                path = path[i + len("site-packages") + 1:]
+            elif path.startswith(os.getcwd() + os.sep):
+                path = path[len(os.getcwd()) + 1:]
+            else:
+                path = os.path.basename(path)
+            label = f"{getattr(code, 'co_qualname', code.co_name)} ({path}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _thread_name(self, ident: int, per_thread: bool) -> str:
+        name = self._thread_names.get(ident)
+        if name is None:
+            self._thread_names = {t.ident: t.name for t in threading.enumerate()}
+            name = self._thread_names.get(ident, f"thread-{ident}")
+        # "asyncio_3" / "ThreadPoolExecutor-0_3" -> one root per pool
+        return name if per_thread else re.sub(r"_\d+$", "", name)
+
+    def _sample(self, session: ProfileSession, own: int):
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            code = frame.f_code
+            if not session.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                session.idle_samples += 1
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(self._thread_name(ident, session.per_thread).replace(";", ":"))
+            session.counts[";".join(reversed(stack))] += 1
+            session.samples += 1
+
+    def _loop(self, session: ProfileSession, stop: threading.Event):
+        own = threading.get_ident()
+        cpu0 = time.thread_time()
+        while not stop.wait(session.interval):
+            if session.sampling():
+                self._sample(session, own)
+        session.sampler_cpu_s = time.thread_time() - cpu0
+
+    def run(self, seconds: float, interval: float = 0.01, path: Optional[str] = None, requests: int = 0,
+            include_idle: bool = False, per_thread: bool = False) -> ProfileSession:
+        """Blocks for up to `seconds` while sampling; call it from a worker thread, not the event loop."""
+        if not 0 < seconds <= self.max_seconds:
+            raise ValueError(f"seconds must be in (0, {self.max_seconds:g}]")
+        session = ProfileSession(seconds, max(MIN_INTERVAL, interval), path, requests, include_idle, per_thread)
+        with self._lock:
+            if self._session is not None:
+                raise Busy("a profile is already running")
+            self._session = session
+            self.sessions += 1
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._loop, args=(session, stop), name="profiler", daemon=True)
+        scope = f", next {requests} requests to {path}" if session.path else ""
+        logger.info(f"🔬 [PROFILE] Started: {seconds:.1f}s, interval={session.interval * 1000:.1f}ms{scope}")
+        t0 = time.perf_counter()
+        sampler.start()
+        try:
+            session.done.wait(seconds)
+        finally:
+            stop.set()
+            sampler.join()
+            session.wall_s = time.perf_counter() - t0
+            with self._lock:
+                self._session = None
+            self._labels.clear()
+        logger.info(f"🔬 [PROFILE] Finished: {session.samples} samples in {session.wall_s:.1f}s, "
+                    f"{len(session.counts)} stacks, sampler cpu {session.sampler_cpu_s:.3f}s")
+        return session
+
+    def track(self, path: str) -> Optional[ProfileSession]:
+        """Called by the request middleware; returns the session to finish() if this request is profiled."""
+        session = self._session
+        if session is not None and session.track(path):
+            return session
+        return None
+
+    def stats(self) -> dict:
+        session = self._session
+        return {"running": session is not None, "sessions": self.sessions,
+                "samples": session.samples if session is not None else None}
+
+
+PROFILER = SamplingProfiler()
@@ -0,0 +1,76 @@
+# backend/utils/tracing.py — per-job stage timing for process_document
+
+"""
+A JobTrace collects timed spans for one job_id. It is held in a contextvar
+while process_document runs; the PDF page workers run on a plain thread
+pool (no context copy), so ocr_pdf passes the trace to span() explicitly.
+"""
+
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+from backend.utils import metrics
+
+
+class JobTrace:
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.t0 = time.perf_counter()
+        self.spans = []
+        self.attrs = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, start: float):
+        entry = {"name": name, "ms": round(seconds * 1000, 2), "atMs": round((start - self.t0) * 1000, 2)}
+        with self._lock:
+            self.spans.append(entry)
+
+    def breakdown(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["atMs"])
+        return {"totalMs": round((time.perf_counter() - self.t0) * 1000, 2), "spans": spans, **self.attrs}
+
+    def log_line(self, **extra) -> str:
+        return json.dumps({"event": "job_timing", "job_id": self.job_id, **extra, **self.breakdown()},
+                          default=str, separators=(",", ":"))
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("job_trace", default=None)
+
+def current() -> Optional[JobTrace]:
+    return _current.get()
+
+@contextmanager
+def job_trace(job_id: str):
+    trace = JobTrace(job_id)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+@contextmanager
+def span(name: str, stage: str = None, trace: Optional[JobTrace] = None):
+    """
+    Times a block onto the job trace (explicit `trace` wins over the contextvar)
+    and, if `stage` is given, into metrics.STAGE_SECONDS.
+    """
+    trace = trace or _current.get()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        if trace is not None:
+            trace.record(name, elapsed, t0)
+        if stage is not None:
+            metrics.STAGE_SECONDS.observe(elapsed, stage=stage)
+
+def annotate(**attrs):
+    trace = _current.get()
+    if trace is not None:
+        trace.attrs.update(attrs)